@@ -7,25 +7,135 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic_settings import BaseSettings
 from contextlib import asynccontextmanager
+import asyncio
+import os
 from src.api.routes import router
+from src.agent.conversation_store import conversation_store
+from src.models.priority_model import priority_model
+from src.models.registry import model_registry
+from src.models.encoders import category_encoders
+from src.models.drift import drift_monitor, load_reference_profile
+from src.models.shadow import shadow_evaluator
+from src.models.surrogate import (
+    DEFAULT_MIN_AGREEMENT,
+    distilled_from,
+    load_distillation_report,
+    within_tolerance,
+)
+from src.services.profiler import ProfilerMiddleware, sampling_profiler
+from src.services.ingestion import ingestion_worker
+from src.services.message_queue import create_queue
 
 class Settings(BaseSettings):
     openai_api_key: str = ""
     anthropic_api_key: str = ""
     google_cloud_project_id: str = ""
     backend_url: str = "http://localhost:3002"
+    # Diretório do artefato plano (mmap) ou arquivo .pkl do modelo
+    priority_model_path: str = "models/priority_model"
+    # LabelEncoders salvos pelo treino (codificação das features categóricas)
+    label_encoders_path: str = "models/label_encoders.pkl"
+    # Tenants pré-carregados no registro, do mais para o menos acessado
+    model_registry_preload: str = ""
+    # Substituto destilado (train_priority_model.py --distill); servido no
+    # lugar do ensemble se o MAE em relação a ele for <= tolerância (0 = desativado)
+    # e a concordância de categoria for >= o mínimo; só vale para o modelo de
+    # que foi destilado (priority_model_path)
+    priority_surrogate_path: str = "models/priority_surrogate"
+    priority_surrogate_tolerance: float = 0.0
+    priority_surrogate_min_agreement: float = DEFAULT_MIN_AGREEMENT
+    # Modelo candidato avaliado em modo sombra (vazio = desativado)
+    shadow_model_path: str = ""
+    # Fila de mensagens recebidas: "local" (em memória) ou "redis://..."
+    # (vazio = worker de ingestão desativado)
+    ingestion_queue_url: str = ""
+    ingestion_stream: str = "onconav:inbound-messages"
+    # Streams de respostas e descartes (só com Redis; vazio = não publica)
+    ingestion_results_stream: str = ""
+    ingestion_dead_letter_stream: str = ""
+    ingestion_visibility_timeout: float = 60.0
+    # Intervalo da remoção de conversas expiradas (memória e SQLite)
+    conversation_purge_interval_seconds: float = 3600.0
     
     class Config:
         env_file = ".env"
 
 settings = Settings()
 
+def _ingestion_queues():
+    """Filas de entrada, respostas e descartes do worker de ingestão"""
+    url = settings.ingestion_queue_url
+    if url == "local":
+        return create_queue(url, visibility_timeout=settings.ingestion_visibility_timeout), None, None
+    streams = (
+        settings.ingestion_stream,
+        settings.ingestion_results_stream,
+        settings.ingestion_dead_letter_stream,
+    )
+    return tuple(
+        create_queue(url, stream=stream, visibility_timeout=settings.ingestion_visibility_timeout)
+        if stream else None
+        for stream in streams
+    )
+
+async def _purge_conversations():
+    """Remove periodicamente conversas expiradas (o TTL só é checado na leitura)"""
+    while True:
+        await asyncio.sleep(settings.conversation_purge_interval_seconds)
+        try:
+            removed = await asyncio.to_thread(conversation_store.purge_expired)
+            if removed:
+                print(f"[AI Service] Conversas expiradas removidas: {removed}")
+        except Exception as e:
+            print(f"[AI Service] Erro ao remover conversas expiradas: {e}")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     print("[AI Service] Starting...")
+    if os.path.exists(settings.priority_model_path):
+        priority_model.load(settings.priority_model_path)
+        drift_monitor.set_reference(load_reference_profile(settings.priority_model_path))
+        print(f"[AI Service] Modelo carregado: {settings.priority_model_path}")
+    else:
+        print("[AI Service] Modelo não encontrado, usando regras de fallback")
+    if os.path.exists(settings.label_encoders_path):
+        category_encoders.load(settings.label_encoders_path)
+        print(f"[AI Service] Encoders carregados: {settings.label_encoders_path}")
+    if settings.priority_surrogate_tolerance > 0:
+        report = load_distillation_report(settings.priority_surrogate_path)
+        selected = report["selected"] if report else None
+        if selected and not distilled_from(report, settings.priority_model_path):
+            print(
+                "[AI Service] Substituto destilado de outro modelo "
+                f"(não de {settings.priority_model_path}), usando ensemble"
+            )
+        elif selected and within_tolerance(
+            report["models"][selected],
+            settings.priority_surrogate_tolerance,
+            settings.priority_surrogate_min_agreement,
+        ):
+            priority_model.load(settings.priority_surrogate_path)
+            print(f"[AI Service] Substituto carregado ({selected}): {settings.priority_surrogate_path}")
+        else:
+            print("[AI Service] Substituto ausente ou fora da tolerância, usando ensemble")
+    if settings.shadow_model_path:
+        shadow_evaluator.set_candidate(settings.shadow_model_path)
+        print(f"[AI Service] Modelo sombra carregado: {settings.shadow_model_path}")
+    preload = [t.strip() for t in settings.model_registry_preload.split(",") if t.strip()]
+    if preload:
+        model_registry.preload(preload)
+        print(f"[AI Service] Modelos pré-carregados: {len(preload)} tenants")
+    if settings.ingestion_queue_url:
+        ingestion_worker.attach(*_ingestion_queues())
+        ingestion_worker.start()
+        print(f"[AI Service] Worker de ingestão iniciado: {settings.ingestion_queue_url}")
+    purge_task = asyncio.create_task(_purge_conversations())
     yield
     # Shutdown
+    purge_task.cancel()
+    await ingestion_worker.stop()
+    shadow_evaluator.stop()
     print("[AI Service] Shutting down...")
 
 app = FastAPI(
@@ -44,6 +154,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Profiler por amostragem (inativo até POST /api/v1/admin/profile)
+app.add_middleware(ProfilerMiddleware, profiler=sampling_profiler)
+
 # Incluir rotas
 app.include_router(router, prefix="/api/v1", tags=["ai"])
 
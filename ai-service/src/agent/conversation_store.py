@@ -0,0 +1,346 @@
+"""
+Armazenamento de estado de conversa no servidor
+
+Evita que o chamador reenvie `patient_context` e todo o `conversation_history`
+a cada turno: a conversa é criada uma vez e depois recebe apenas a nova
+mensagem (append incremental).
+
+O histórico fica em memória em formato compacto (papel como código de 1 byte
+e conteúdo como str, sem um dict por mensagem), com expiração por TTL e
+despejo LRU. Opcionalmente é persistido em SQLite local: cada append grava só
+a nova linha, e conversas despejadas da memória são recarregadas do disco.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ROLES = ("user", "assistant")
+_ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+
+
+class ConversationNotFound(KeyError):
+    """Conversa inexistente ou expirada"""
+
+
+class Conversation:
+    """
+    Estado de uma conversa: contexto do paciente e histórico compacto
+    """
+
+    __slots__ = ("conversation_id", "patient_id", "patient_context",
+                 "tenant_id", "roles", "contents", "updated_at")
+
+    def __init__(
+        self,
+        conversation_id: str,
+        patient_id: str,
+        patient_context: Dict,
+        tenant_id: Optional[str] = None,
+        updated_at: Optional[float] = None,
+    ):
+        self.conversation_id = conversation_id
+        self.patient_id = patient_id
+        self.patient_context = patient_context
+        self.tenant_id = tenant_id
+        self.roles = array("B")
+        self.contents: List[str] = []
+        self.updated_at = updated_at or time.time()
+
+    def append(self, role: str, content: str):
+        if role not in _ROLE_CODES:
+            raise ValueError(f"Papel inválido: {role}")
+        self.roles.append(_ROLE_CODES[role])
+        self.contents.append(content)
+        self.updated_at = time.time()
+
+    def truncate(self, max_messages: int):
+        """Mantém apenas as últimas `max_messages` mensagens"""
+        excess = len(self.contents) - max_messages
+        if excess > 0:
+            del self.roles[:excess]
+            del self.contents[:excess]
+
+    def iter_messages(self) -> Iterator[Dict]:
+        """Gera mensagens no formato do LLM sem materializar lista intermediária"""
+        for code, content in zip(self.roles, self.contents):
+            yield {"role": ROLES[code], "content": content}
+
+    def __len__(self) -> int:
+        return len(self.contents)
+
+
+class _SQLiteBackend:
+    """Persistência local opcional (uma linha por mensagem)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS conversations (
+                id TEXT PRIMARY KEY,
+                patient_id TEXT NOT NULL,
+                patient_context TEXT NOT NULL,
+                tenant_id TEXT,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                conversation_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                role INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                PRIMARY KEY (conversation_id, seq)
+            );
+            """
+        )
+        self._conn.commit()
+
+    def save_conversation(self, conversation: Conversation):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO conversations VALUES (?, ?, ?, ?, ?)",
+            (
+                conversation.conversation_id,
+                conversation.patient_id,
+                json.dumps(conversation.patient_context),
+                conversation.tenant_id,
+                conversation.updated_at,
+            ),
+        )
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?)",
+            [
+                (conversation.conversation_id, seq, code, content)
+                for seq, (code, content) in enumerate(
+                    zip(conversation.roles, conversation.contents)
+                )
+            ],
+        )
+        self._conn.commit()
+
+    def append_message(self, conversation: Conversation, seq: int):
+        self._conn.execute(
+            "INSERT INTO messages VALUES (?, ?, ?, ?)",
+            (
+                conversation.conversation_id,
+                seq,
+                conversation.roles[-1],
+                conversation.contents[-1],
+            ),
+        )
+        self._conn.execute(
+            "UPDATE conversations SET updated_at = ? WHERE id = ?",
+            (conversation.updated_at, conversation.conversation_id),
+        )
+        self._conn.commit()
+
+    def load(self, conversation_id: str, max_messages: int) -> Optional[Conversation]:
+        row = self._conn.execute(
+            "SELECT patient_id, patient_context, tenant_id, updated_at "
+            "FROM conversations WHERE id = ?",
+            (conversation_id,),
+        ).fetchone()
+        if row is None:
+            return None
+
+        conversation = Conversation(
+            conversation_id, row[0], json.loads(row[1]), tenant_id=row[2], updated_at=row[3]
+        )
+        rows = self._conn.execute(
+            "SELECT role, content FROM messages WHERE conversation_id = ? "
+            "ORDER BY seq DESC LIMIT ?",
+            (conversation_id, max_messages),
+        ).fetchall()
+        for code, content in reversed(rows):
+            conversation.roles.append(code)
+            conversation.contents.append(content)
+        return conversation
+
+    def next_seq(self, conversation_id: str) -> int:
+        row = self._conn.execute(
+            "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE conversation_id = ?",
+            (conversation_id,),
+        ).fetchone()
+        return row[0]
+
+    def delete(self, conversation_id: str):
+        self._conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+        self._conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+        self._conn.commit()
+
+    def delete_expired(self, cutoff: float) -> int:
+        expired = [
+            row[0] for row in self._conn.execute(
+                "SELECT id FROM conversations WHERE updated_at < ?", (cutoff,)
+            )
+        ]
+        for conversation_id in expired:
+            self.delete(conversation_id)
+        return len(expired)
+
+
+class ConversationStore:
+    """
+    Conversas ativas em memória com TTL/LRU e persistência local opcional
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 24 * 3600,
+        max_conversations: int = 10000,
+        max_messages: int = 50,
+        db_path: Optional[str] = None,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_conversations = max_conversations
+        self.max_messages = max_messages
+        self._conversations: "OrderedDict[str, Conversation]" = OrderedDict()
+        # Próximo seq persistido por conversa (histórico em memória é truncado)
+        self._next_seq: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._backend = _SQLiteBackend(db_path) if db_path else None
+
+    def create(
+        self,
+        patient_id: str,
+        patient_context: Dict,
+        conversation_history: Optional[List[Dict]] = None,
+        tenant_id: Optional[str] = None,
+    ) -> Conversation:
+        """
+        Cria conversa, opcionalmente semeada com histórico existente
+
+        Args:
+            patient_id: ID do paciente
+            patient_context: Contexto do paciente (enviado só uma vez)
+            conversation_history: Histórico prévio no formato role/content
+            tenant_id: Tenant do paciente
+        """
+        conversation = Conversation(
+            uuid.uuid4().hex, patient_id, patient_context, tenant_id=tenant_id
+        )
+        for msg in conversation_history or []:
+            conversation.append(msg["role"], msg["content"])
+        conversation.truncate(self.max_messages)
+
+        with self._lock:
+            self._put(conversation)
+            self._next_seq[conversation.conversation_id] = len(conversation)
+            if self._backend:
+                self._backend.save_conversation(conversation)
+        return conversation
+
+    def get(self, conversation_id: str) -> Conversation:
+        """
+        Busca conversa ativa (memória, depois persistência)
+
+        Raises:
+            ConversationNotFound: Conversa inexistente ou expirada
+        """
+        with self._lock:
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None and self._backend:
+                conversation = self._backend.load(conversation_id, self.max_messages)
+                if conversation is not None:
+                    self._put(conversation)
+            if conversation is None:
+                raise ConversationNotFound(conversation_id)
+
+            if time.time() - conversation.updated_at > self.ttl_seconds:
+                self._drop(conversation_id)
+                raise ConversationNotFound(conversation_id)
+
+            self._conversations.move_to_end(conversation_id)
+            return conversation
+
+    def append(self, conversation_id: str, role: str, content: str):
+        """Adiciona uma mensagem ao fim da conversa (grava só o delta)"""
+        conversation = self.get(conversation_id)
+        with self._lock:
+            conversation.append(role, content)
+            conversation.truncate(self.max_messages)
+            if self._backend:
+                seq = self._next_seq.get(conversation_id)
+                if seq is None:
+                    seq = self._backend.next_seq(conversation_id)
+                self._backend.append_message(conversation, seq)
+                self._next_seq[conversation_id] = seq + 1
+
+    def messages(self, conversation_id: str) -> List[Dict]:
+        """
+        Cópia do histórico no formato do LLM, tirada sob o lock
+
+        Use no lugar de `Conversation.iter_messages()` quando o histórico for
+        lido fora do lock (ex: em outra thread), pois appends e truncagens
+        concorrentes alteram as listas durante a iteração.
+
+        Raises:
+            ConversationNotFound: Conversa inexistente ou expirada
+        """
+        conversation = self.get(conversation_id)
+        with self._lock:
+            return list(conversation.iter_messages())
+
+    def delete(self, conversation_id: str):
+        with self._lock:
+            self._drop(conversation_id)
+
+    def purge_expired(self) -> int:
+        """Remove conversas expiradas da memória e da persistência"""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [
+                conversation_id
+                for conversation_id, conversation in self._conversations.items()
+                if conversation.updated_at < cutoff
+            ]
+            for conversation_id in expired:
+                self._drop(conversation_id)
+            removed = len(expired)
+            if self._backend:
+                removed += self._backend.delete_expired(cutoff)
+        return removed
+
+    def _put(self, conversation: Conversation):
+        """Insere em memória e aplica LRU (chamar com _lock)"""
+        self._conversations[conversation.conversation_id] = conversation
+        self._conversations.move_to_end(conversation.conversation_id)
+        while len(self._conversations) > self.max_conversations:
+            # Despejo só da memória: continua recuperável pela persistência
+            evicted_id, _ = self._conversations.popitem(last=False)
+            self._next_seq.pop(evicted_id, None)
+
+    def _drop(self, conversation_id: str):
+        """Remove conversa de todas as camadas (chamar com _lock)"""
+        self._conversations.pop(conversation_id, None)
+        self._next_seq.pop(conversation_id, None)
+        if self._backend:
+            self._backend.delete(conversation_id)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "active_conversations": len(self._conversations),
+                "messages_in_memory": sum(len(c) for c in self._conversations.values()),
+                "max_conversations": self.max_conversations,
+                "persistent": self._backend is not None,
+            }
+
+
+# Instância global do armazenamento de conversas
+conversation_store = ConversationStore(
+    ttl_seconds=float(os.getenv("CONVERSATION_TTL_SECONDS", str(24 * 3600))),
+    max_conversations=int(os.getenv("CONVERSATION_MAX_ACTIVE", "10000")),
+    max_messages=int(os.getenv("CONVERSATION_MAX_MESSAGES", "50")),
+    db_path=os.getenv("CONVERSATION_DB_PATH") or None,
+)
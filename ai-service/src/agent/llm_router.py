@@ -0,0 +1,424 @@
+"""
+Roteamento de turnos do agente entre provedores e modelos de LLM
+
+Turnos simples vão para um modelo menor e mais rápido; turnos complexos ou
+com sintoma crítico ficam com o modelo grande. Dentro de cada nível, as rotas
+são ordenadas pela latência e taxa de erro recentes (médias móveis), e uma
+falha em um provedor (OpenAI/Anthropic) passa o turno para o próximo.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SMALL = "small"
+LARGE = "large"
+
+# Rotas padrão: "provedor:modelo:nível" separados por vírgula
+DEFAULT_ROUTES = (
+    "openai:gpt-4o-mini:small,openai:gpt-4:large,"
+    "anthropic:claude-3-5-haiku-latest:small,anthropic:claude-3-5-sonnet-latest:large"
+)
+
+# Custo aproximado em USD por 1K tokens (entrada, saída); ausente = 0
+MODEL_COSTS_PER_1K = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "claude-3-5-haiku-latest": (0.0008, 0.004),
+    "claude-3-5-sonnet-latest": (0.003, 0.015),
+}
+
+# Turno vai para o modelo grande acima destes limites
+COMPLEX_MESSAGE_CHARS = 280
+COMPLEX_HISTORY_MESSAGES = 12
+
+# Médias móveis de saúde por rota
+EWMA_ALPHA = 0.2
+UNHEALTHY_ERROR_RATE = 0.5
+UNHEALTHY_COOLDOWN_SECONDS = 30.0
+
+
+@dataclass
+class LLMCompletion:
+    text: str
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    # Argumentos da chamada de ferramenta forçada, quando `tool` foi pedido
+    structured: Optional[Dict] = None
+
+    @property
+    def reply(self) -> str:
+        """Resposta ao paciente: campo `reply` da ferramenta ou o texto"""
+        reply = (self.structured or {}).get("reply")
+        if isinstance(reply, str) and reply.strip():
+            return reply
+        return self.text
+
+    @property
+    def total_tokens(self) -> Optional[int]:
+        if self.input_tokens is None or self.output_tokens is None:
+            return None
+        return self.input_tokens + self.output_tokens
+
+
+class LLMProvider:
+    """
+    Interface de provedor: uma chamada de chat completa
+
+    Com `tool` ({"name", "description", "parameters"}), o modelo é obrigado a
+    responder chamando essa ferramenta e os argumentos vêm em
+    `LLMCompletion.structured`; a resposta ao paciente fica no campo `reply`.
+    """
+
+    name = "base"
+
+    def complete(
+        self,
+        model: str,
+        system_prompt: str,
+        messages: List[Dict],
+        max_tokens: int,
+        tool: Optional[Dict] = None,
+    ) -> LLMCompletion:
+        raise NotImplementedError
+
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+
+    def __init__(self, client):
+        self.client = client
+
+    def complete(self, model, system_prompt, messages, max_tokens, tool=None):
+        kwargs = {}
+        if tool is not None:
+            kwargs["tools"] = [{"type": "function", "function": tool}]
+            kwargs["tool_choice"] = {"type": "function", "function": {"name": tool["name"]}}
+        response = self.client.chat.completions.create(
+            model=model,
+            messages=[{"role": "system", "content": system_prompt}, *messages],
+            temperature=0.7,
+            max_tokens=max_tokens,
+            **kwargs,
+        )
+        message = response.choices[0].message
+        structured = None
+        if message.tool_calls:
+            # Argumentos malformados não são falha do provedor: fica só o texto
+            try:
+                structured = json.loads(message.tool_calls[0].function.arguments)
+            except json.JSONDecodeError as e:
+                logger.warning(f"Argumentos da ferramenta inválidos ({model}): {e}")
+        usage = response.usage
+        return LLMCompletion(
+            text=message.content or "",
+            input_tokens=usage.prompt_tokens if usage else None,
+            output_tokens=usage.completion_tokens if usage else None,
+            structured=structured,
+        )
+
+
+class AnthropicProvider(LLMProvider):
+    name = "anthropic"
+
+    def __init__(self, client):
+        self.client = client
+
+    def complete(self, model, system_prompt, messages, max_tokens, tool=None):
+        kwargs = {}
+        if tool is not None:
+            kwargs["tools"] = [{
+                "name": tool["name"],
+                "description": tool["description"],
+                "input_schema": tool["parameters"],
+            }]
+            kwargs["tool_choice"] = {"type": "tool", "name": tool["name"]}
+        # API da Anthropic recebe o prompt do sistema fora da lista de mensagens
+        response = self.client.messages.create(
+            model=model,
+            system=system_prompt,
+            max_tokens=max_tokens,
+            messages=messages,
+            **kwargs,
+        )
+        text = ""
+        structured = None
+        for block in response.content:
+            if block.type == "text":
+                text += block.text
+            elif block.type == "tool_use":
+                structured = block.input
+        return LLMCompletion(
+            text=text,
+            input_tokens=response.usage.input_tokens,
+            output_tokens=response.usage.output_tokens,
+            structured=structured,
+        )
+
+
+class StubProvider(LLMProvider):
+    """
+    Provedor local para testes e desenvolvimento (sem rede)
+
+    Args:
+        name: Nome do provedor simulado (ex: "openai")
+        reply: Texto de resposta
+        latency_seconds: Atraso simulado por chamada
+        fail: Se True, toda chamada levanta RuntimeError
+        structured: Argumentos devolvidos quando uma ferramenta é pedida
+            (padrão: {"reply": reply} sem sintomas)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        reply: str = "Resposta simulada",
+        latency_seconds: float = 0.0,
+        fail: bool = False,
+        structured: Optional[Dict] = None,
+    ):
+        self.name = name
+        self.reply = reply
+        self.latency_seconds = latency_seconds
+        self.fail = fail
+        self.structured = structured
+        self.calls: List[str] = []
+
+    def complete(self, model, system_prompt, messages, max_tokens, tool=None):
+        self.calls.append(model)
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        if self.fail:
+            raise RuntimeError(f"{self.name} indisponível (simulado)")
+        input_chars = len(system_prompt) + sum(len(m["content"]) for m in messages)
+        structured = None
+        if tool is not None:
+            structured = self.structured or {
+                "reply": self.reply, "symptoms": {}, "scales": {},
+            }
+        return LLMCompletion(
+            text="" if structured else self.reply,
+            input_tokens=input_chars // 4,
+            output_tokens=len(self.reply) // 4,
+            structured=structured,
+        )
+
+
+@dataclass
+class ModelRoute:
+    provider: str
+    model: str
+    tier: str
+
+    @property
+    def key(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+
+class EmptyCompletion(RuntimeError):
+    """Provedor respondeu sem texto e sem `reply` utilizável"""
+
+
+def _add_usage(completion: LLMCompletion, discarded: LLMCompletion) -> LLMCompletion:
+    """Soma ao consumo de `completion` os tokens de uma chamada descartada"""
+    for name in ("input_tokens", "output_tokens"):
+        used, extra = getattr(completion, name), getattr(discarded, name)
+        if used is not None and extra is not None:
+            setattr(completion, name, used + extra)
+    return completion
+
+
+class _RouteHealth:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency_ewma: Optional[float] = None
+        self.error_ewma = 0.0
+        self.last_error_at = 0.0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost_usd = 0.0
+
+    def record_success(self, latency: float, completion: LLMCompletion, model: str):
+        self.calls += 1
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma += EWMA_ALPHA * (latency - self.latency_ewma)
+        self.error_ewma *= 1 - EWMA_ALPHA
+        input_cost, output_cost = MODEL_COSTS_PER_1K.get(model, (0.0, 0.0))
+        self.input_tokens += completion.input_tokens or 0
+        self.output_tokens += completion.output_tokens or 0
+        self.cost_usd += (
+            (completion.input_tokens or 0) * input_cost
+            + (completion.output_tokens or 0) * output_cost
+        ) / 1000
+
+    def record_error(self):
+        self.calls += 1
+        self.errors += 1
+        self.error_ewma += EWMA_ALPHA * (1 - self.error_ewma)
+        self.last_error_at = time.monotonic()
+
+    def is_healthy(self) -> bool:
+        recently_failed = (
+            time.monotonic() - self.last_error_at < UNHEALTHY_COOLDOWN_SECONDS
+        )
+        return not (recently_failed and self.error_ewma >= UNHEALTHY_ERROR_RATE)
+
+
+def parse_routes(raw: str) -> List[ModelRoute]:
+    """Formato: "openai:gpt-4o-mini:small,anthropic:claude-3-5-sonnet-latest:large" """
+    routes = []
+    for item in raw.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        provider, model, tier = item.split(":")
+        if tier not in (SMALL, LARGE):
+            raise ValueError(f"Nível de rota inválido: {tier}")
+        routes.append(ModelRoute(provider=provider, model=model, tier=tier))
+    return routes
+
+
+def classify_turn(message: str, history_messages: int, critical: bool) -> tuple:
+    """
+    Decide o nível do modelo para o turno
+
+    Returns:
+        (nível, motivo)
+    """
+    if critical:
+        return LARGE, "critical"
+    if len(message) > COMPLEX_MESSAGE_CHARS or history_messages > COMPLEX_HISTORY_MESSAGES:
+        return LARGE, "complex"
+    return SMALL, "simple"
+
+
+class LLMRouter:
+    """
+    Escolhe modelo por complexidade do turno e faz failover entre provedores
+    """
+
+    def __init__(self, providers: Dict[str, LLMProvider], routes: List[ModelRoute]):
+        self.providers = providers
+        # Só rotas cujo provedor está configurado
+        self.routes = [route for route in routes if route.provider in providers]
+        self._health: Dict[str, _RouteHealth] = {
+            route.key: _RouteHealth() for route in self.routes
+        }
+        self._decisions: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def is_available(self) -> bool:
+        return bool(self.routes)
+
+    def _candidates(self, tier: str) -> List[ModelRoute]:
+        """Rotas do nível pedido (por saúde e latência), depois as do outro nível"""
+        def rank(route: ModelRoute):
+            health = self._health[route.key]
+            # Sem histórico de latência: tenta logo para medir
+            return (not health.is_healthy(), health.latency_ewma or 0.0)
+
+        with self._lock:
+            preferred = sorted((r for r in self.routes if r.tier == tier), key=rank)
+            others = sorted((r for r in self.routes if r.tier != tier), key=rank)
+        return preferred + others
+
+    def complete(
+        self,
+        system_prompt: str,
+        messages: List[Dict],
+        max_tokens: int,
+        tier: str,
+        reason: str,
+        tool: Optional[Dict] = None,
+    ) -> tuple:
+        """
+        Executa o turno na melhor rota disponível, com failover
+
+        Args:
+            system_prompt: Prompt do sistema
+            messages: Histórico + mensagem atual (sem mensagem de sistema)
+            max_tokens: Limite de tokens da resposta
+            tier: SMALL ou LARGE (ver `classify_turn`)
+            reason: Motivo da escolha do nível (registrado nas métricas)
+            tool: Ferramenta de chamada forçada para saída estruturada
+
+        Returns:
+            (LLMCompletion, ModelRoute usada)
+
+        Resposta vazia conta como falha da rota. Com `tool`, antes disso a
+        mesma rota é repetida sem a ferramenta (argumentos cortados por
+        `max_tokens` ou sem `reply`); a resposta vem só em texto.
+
+        Raises:
+            RuntimeError: Todas as rotas falharam
+        """
+        last_error: Optional[Exception] = None
+        for attempt, route in enumerate(self._candidates(tier)):
+            provider = self.providers[route.provider]
+            start = time.perf_counter()
+            try:
+                completion = provider.complete(
+                    route.model, system_prompt, messages, max_tokens, tool=tool
+                )
+                if not completion.reply and tool is not None:
+                    logger.warning(f"LLM {route.key} sem resposta na ferramenta, repetindo sem ela")
+                    completion = _add_usage(
+                        provider.complete(route.model, system_prompt, messages, max_tokens),
+                        completion,
+                    )
+                if not completion.reply:
+                    raise EmptyCompletion(f"{route.key} respondeu vazio")
+            except Exception as e:
+                last_error = e
+                with self._lock:
+                    self._health[route.key].record_error()
+                logger.warning(f"Falha no LLM {route.key}, tentando próxima rota: {e}")
+                continue
+
+            latency = time.perf_counter() - start
+            with self._lock:
+                self._health[route.key].record_success(latency, completion, route.model)
+                self._decisions[(tier, reason, route.key, attempt > 0)] += 1
+            return completion, route
+
+        raise RuntimeError(f"Nenhuma rota de LLM disponível: {last_error}")
+
+    def stats(self) -> Dict:
+        """Decisões de roteamento e latência/custo por modelo"""
+        with self._lock:
+            return {
+                "routes": {
+                    route.key: {
+                        "tier": route.tier,
+                        "calls": self._health[route.key].calls,
+                        "errors": self._health[route.key].errors,
+                        "latency_ewma_ms": round(self._health[route.key].latency_ewma * 1000, 1)
+                        if self._health[route.key].latency_ewma is not None else None,
+                        "error_rate_ewma": round(self._health[route.key].error_ewma, 3),
+                        "healthy": self._health[route.key].is_healthy(),
+                        "input_tokens": self._health[route.key].input_tokens,
+                        "output_tokens": self._health[route.key].output_tokens,
+                        "cost_usd": round(self._health[route.key].cost_usd, 4),
+                    }
+                    for route in self.routes
+                },
+                "decisions": [
+                    {
+                        "tier": tier,
+                        "reason": reason,
+                        "route": route_key,
+                        "failover": failover,
+                        "count": count,
+                    }
+                    for (tier, reason, route_key, failover), count in self._decisions.items()
+                ],
+            }
@@ -0,0 +1,402 @@
+"""
+Escalonador de admissão para chamadas ao LLM
+
+Todas as chamadas disputam o mesmo rate limit do provedor (tokens por minuto).
+O escalonador controla a admissão com:
+
+- Token bucket com capacidade e reposição derivadas do TPM do provedor
+- Fila estrita para mensagens com sintoma crítico: sempre admitidas antes
+  de qualquer mensagem de rotina
+- Weighted fair queueing entre tenants para o restante, para que uma rajada
+  de check-ins de um tenant não atrase os demais
+
+Há duas formas de esperar pela admissão, sobre a mesma fila: `acquire`
+bloqueia a thread de quem chama; `acquire_async` espera no event loop, sem
+ocupar thread do threadpool. Nas rotas, a admissão deve ocorrer no event
+loop e só a chamada ao provedor ir para o threadpool: do contrário, uma
+rajada de rotina ocupa todas as threads esperando na fila e a mensagem
+crítica nem chega a entrar nela.
+"""
+
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Janela de amostras de espera usada para percentis
+WAIT_SAMPLES = 1000
+# Tenants com métricas de espera próprias (LRU; tenant_id vem do cliente)
+MAX_TENANT_STATS = 256
+# tenant_id aceito nas rotas e no worker de ingestão
+TENANT_ID_PATTERN = r"^[A-Za-z0-9_.-]{1,64}$"
+_TENANT_ID = re.compile(TENANT_ID_PATTERN)
+
+
+def is_valid_tenant_id(tenant_id: str) -> bool:
+    return isinstance(tenant_id, str) and _TENANT_ID.match(tenant_id) is not None
+
+
+class AdmissionTimeout(TimeoutError):
+    """Mensagem não foi admitida dentro do tempo máximo de espera"""
+
+
+@dataclass
+class Ticket:
+    tenant_id: str
+    tokens: float
+    critical: bool
+    enqueued_at: float
+    finish_tag: float = 0.0
+    granted: threading.Event = field(default_factory=threading.Event)
+    wait_seconds: float = 0.0
+    # Chamado (com o lock) ao admitir; usado por `acquire_async`
+    on_grant: Optional[Callable[[], None]] = None
+
+
+@dataclass
+class _WaitStats:
+    count: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    samples: Deque[float] = field(default_factory=lambda: deque(maxlen=WAIT_SAMPLES))
+
+    def record(self, seconds: float):
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.samples.append(seconds)
+
+    def summary(self) -> Dict:
+        samples = sorted(self.samples)
+
+        def percentile(p: float) -> Optional[float]:
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 2)
+
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_seconds / self.count * 1000, 2) if self.count else None,
+            "p50_ms": percentile(0.50),
+            "p95_ms": percentile(0.95),
+            "max_ms": round(self.max_seconds * 1000, 2),
+        }
+
+
+class LLMScheduler:
+    """
+    Admissão de chamadas ao LLM por token bucket + WFQ com prioridade crítica
+    """
+
+    def __init__(
+        self,
+        tokens_per_minute: float,
+        tenant_weights: Optional[Dict[str, float]] = None,
+        max_wait_seconds: Optional[float] = None,
+    ):
+        self.capacity = float(tokens_per_minute)
+        self.refill_per_second = tokens_per_minute / 60.0
+        self.tenant_weights = tenant_weights or {}
+        self.max_wait_seconds = max_wait_seconds
+
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+        self._critical: Deque[Ticket] = deque()
+        self._tenant_queues: Dict[str, Deque[Ticket]] = {}
+        self._tenant_finish: Dict[str, float] = {}
+        self._virtual_time = 0.0
+
+        self._wait_by_class = {"critical": _WaitStats(), "routine": _WaitStats()}
+        self._wait_by_tenant: OrderedDict = OrderedDict()
+        self._timeouts = 0
+
+    def _refill(self, now: float):
+        elapsed = now - self._last_refill
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.refill_per_second)
+        self._last_refill = now
+
+    def _enqueue(self, ticket: Ticket):
+        if ticket.critical:
+            self._critical.append(ticket)
+            return
+        # Tag de término virtual (self-clocked fair queueing)
+        weight = self.tenant_weights.get(ticket.tenant_id, 1.0)
+        start = max(self._virtual_time, self._tenant_finish.get(ticket.tenant_id, 0.0))
+        ticket.finish_tag = start + ticket.tokens / weight
+        self._tenant_finish[ticket.tenant_id] = ticket.finish_tag
+        self._tenant_queues.setdefault(ticket.tenant_id, deque()).append(ticket)
+
+    def _next_ticket(self) -> Optional[Ticket]:
+        if self._critical:
+            return self._critical[0]
+        head = None
+        for queue in self._tenant_queues.values():
+            if queue and (head is None or queue[0].finish_tag < head.finish_tag):
+                head = queue[0]
+        return head
+
+    def _pop(self, ticket: Ticket):
+        if ticket.critical:
+            self._critical.popleft()
+            return
+        queue = self._tenant_queues[ticket.tenant_id]
+        queue.popleft()
+        self._virtual_time = max(self._virtual_time, ticket.finish_tag)
+        if not queue:
+            self._forget_tenant(ticket.tenant_id)
+
+    def _forget_tenant(self, tenant_id: str):
+        """
+        Remove fila vazia e tag do tenant (chamar com _lock)
+
+        Sem tickets na fila, a tag só importa se estiver à frente do tempo
+        virtual; ao sair do último ticket ela fica <= `_virtual_time`, e o
+        próximo ticket do tenant começaria em `_virtual_time` de qualquer jeito.
+        """
+        del self._tenant_queues[tenant_id]
+        if self._tenant_finish.get(tenant_id, 0.0) <= self._virtual_time:
+            self._tenant_finish.pop(tenant_id, None)
+
+    def _dispatch(self) -> float:
+        """
+        Admite tickets na ordem enquanto houver tokens (chamar com _lock)
+
+        Returns:
+            Segundos até haver tokens para o próximo da fila (0 se vazia)
+        """
+        now = time.monotonic()
+        self._refill(now)
+        while True:
+            ticket = self._next_ticket()
+            if ticket is None:
+                return 0.0
+            if self._tokens < ticket.tokens:
+                # Sem ultrapassagem: o head bloqueia os demais (precedência estrita)
+                return (ticket.tokens - self._tokens) / self.refill_per_second
+            self._tokens -= ticket.tokens
+            self._pop(ticket)
+            ticket.wait_seconds = now - ticket.enqueued_at
+            self._record_wait(ticket)
+            ticket.granted.set()
+            if ticket.on_grant is not None:
+                ticket.on_grant()
+
+    def _record_wait(self, ticket: Ticket):
+        self._wait_by_class["critical" if ticket.critical else "routine"].record(
+            ticket.wait_seconds
+        )
+        stats = self._wait_by_tenant.get(ticket.tenant_id)
+        if stats is None:
+            stats = self._wait_by_tenant[ticket.tenant_id] = _WaitStats()
+            while len(self._wait_by_tenant) > MAX_TENANT_STATS:
+                self._wait_by_tenant.popitem(last=False)
+        self._wait_by_tenant.move_to_end(ticket.tenant_id)
+        stats.record(ticket.wait_seconds)
+
+    def _new_ticket(
+        self,
+        tenant_id: Optional[str],
+        tokens: float,
+        critical: bool,
+        arrived_at: Optional[float],
+    ) -> Ticket:
+        return Ticket(
+            tenant_id=tenant_id or "default",
+            # Custo limitado à capacidade para que nunca fique preso na fila
+            tokens=min(float(tokens), self.capacity),
+            critical=critical,
+            enqueued_at=arrived_at if arrived_at is not None else time.monotonic(),
+        )
+
+    def _deadline(self, ticket: Ticket) -> Optional[float]:
+        if self.max_wait_seconds is None or ticket.critical:
+            return None
+        return ticket.enqueued_at + self.max_wait_seconds
+
+    def _wait_timeout(self, ticket: Ticket, delay: float, deadline: Optional[float]) -> Optional[float]:
+        """
+        Quanto esperar antes de tentar despachar de novo (None = sem limite)
+
+        Raises:
+            AdmissionTimeout: Prazo de espera esgotado (ticket sai da fila)
+        """
+        timeout = delay if delay > 0 else None
+        if deadline is None:
+            return timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            if self._cancel(ticket):
+                raise AdmissionTimeout(f"Mensagem não admitida em {self.max_wait_seconds}s")
+            # Admitido no último instante
+            return 0.0
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def acquire(
+        self,
+        tenant_id: Optional[str],
+        tokens: float,
+        critical: bool = False,
+        arrived_at: Optional[float] = None,
+    ) -> Ticket:
+        """
+        Bloqueia até a chamada ser admitida
+
+        Args:
+            tenant_id: Tenant da mensagem (None = tenant padrão)
+            tokens: Estimativa de tokens (prompt + max_tokens da resposta)
+            critical: Mensagem com sintoma crítico detectado
+            arrived_at: `time.monotonic()` da chegada da mensagem; a espera
+                (métricas e prazo) conta a partir dele (padrão: agora)
+
+        Returns:
+            Ticket admitido (usar em `settle` com o consumo real)
+
+        Raises:
+            AdmissionTimeout: Mensagem de rotina excedeu `max_wait_seconds`
+        """
+        ticket = self._new_ticket(tenant_id, tokens, critical, arrived_at)
+        deadline = self._deadline(ticket)
+
+        with self._lock:
+            self._enqueue(ticket)
+            delay = self._dispatch()
+
+        while not ticket.granted.is_set():
+            ticket.granted.wait(self._wait_timeout(ticket, delay, deadline))
+            with self._lock:
+                delay = self._dispatch()
+
+        return ticket
+
+    async def acquire_async(
+        self,
+        tenant_id: Optional[str],
+        tokens: float,
+        critical: bool = False,
+        arrived_at: Optional[float] = None,
+    ) -> Ticket:
+        """
+        Como `acquire`, mas espera no event loop (não ocupa thread)
+
+        Raises:
+            AdmissionTimeout: Mensagem de rotina excedeu `max_wait_seconds`
+        """
+        ticket = self._new_ticket(tenant_id, tokens, critical, arrived_at)
+        deadline = self._deadline(ticket)
+
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+
+        def wake():
+            if not granted.done():
+                granted.set_result(None)
+
+        # A admissão pode ocorrer em outra thread (ex: `settle` no threadpool)
+        ticket.on_grant = lambda: loop.call_soon_threadsafe(wake)
+
+        with self._lock:
+            self._enqueue(ticket)
+            delay = self._dispatch()
+
+        try:
+            while not ticket.granted.is_set():
+                timeout = self._wait_timeout(ticket, delay, deadline)
+                try:
+                    await asyncio.wait_for(asyncio.shield(granted), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                with self._lock:
+                    delay = self._dispatch()
+        except asyncio.CancelledError:
+            # Requisição cancelada: libera a vaga ou devolve os tokens
+            if not self._cancel(ticket, timed_out=False):
+                self.settle(ticket, 0)
+            raise
+
+        return ticket
+
+    def _cancel(self, ticket: Ticket, timed_out: bool = True) -> bool:
+        """Remove ticket da fila; False se já tinha sido admitido"""
+        with self._lock:
+            if ticket.granted.is_set():
+                return False
+            if ticket.critical:
+                self._critical.remove(ticket)
+            else:
+                queue = self._tenant_queues.get(ticket.tenant_id)
+                if queue is not None and ticket in queue:
+                    queue.remove(ticket)
+                    if not queue:
+                        # Os servidos têm tag <= `_virtual_time` e os
+                        # cancelados não consumiram nada: a tag cai fora
+                        self._tenant_finish.pop(ticket.tenant_id, None)
+                        self._forget_tenant(ticket.tenant_id)
+            if timed_out:
+                self._timeouts += 1
+            # O ticket removido pode ser o que bloqueava a fila
+            self._dispatch()
+            return True
+
+    def settle(self, ticket: Ticket, actual_tokens: Optional[float]):
+        """
+        Ajusta o bucket com o consumo real informado pelo provedor
+
+        Args:
+            ticket: Ticket retornado por `acquire`
+            actual_tokens: Tokens consumidos (None mantém a estimativa)
+        """
+        if actual_tokens is None:
+            return
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + ticket.tokens - actual_tokens)
+            # Devolução de tokens pode destravar quem está na fila
+            self._dispatch()
+
+    def stats(self) -> Dict:
+        """Tempo de espera na fila por classe e por tenant"""
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                "tokens_per_minute": self.capacity,
+                "available_tokens": round(self._tokens, 1),
+                "queued_critical": len(self._critical),
+                "queued_routine": sum(len(q) for q in self._tenant_queues.values()),
+                "timeouts": self._timeouts,
+                "wait": {name: stats.summary() for name, stats in self._wait_by_class.items()},
+                "wait_by_tenant": {
+                    tenant_id: stats.summary()
+                    for tenant_id, stats in self._wait_by_tenant.items()
+                },
+            }
+
+
+def _parse_weights(raw: str) -> Dict[str, float]:
+    """Formato: "tenantA:2,tenantB:0.5" """
+    weights = {}
+    for item in raw.split(","):
+        if ":" in item:
+            tenant_id, weight = item.rsplit(":", 1)
+            weights[tenant_id.strip()] = float(weight)
+    return weights
+
+
+def estimate_tokens(text_length: int, max_output_tokens: int) -> int:
+    """Estimativa grosseira: ~4 caracteres por token + resposta máxima"""
+    return text_length // 4 + max_output_tokens
+
+
+# Instância global do escalonador
+llm_scheduler = LLMScheduler(
+    tokens_per_minute=float(os.getenv("LLM_TOKENS_PER_MINUTE", "90000")),
+    tenant_weights=_parse_weights(os.getenv("LLM_TENANT_WEIGHTS", "")),
+    max_wait_seconds=float(os.getenv("LLM_MAX_WAIT_SECONDS", "30")),
+)
@@ -0,0 +1,122 @@
+"""
+Saída estruturada do turno do agente
+
+O LLM devolve, na mesma chamada, a resposta conversacional e os sintomas/
+escalas extraídos da mensagem, por meio de uma chamada de ferramenta forçada
+(function calling na OpenAI, tool use na Anthropic) com o schema abaixo.
+Assim a extração rica não exige uma segunda chamada ao LLM.
+"""
+
+from typing import Dict, Optional
+
+TOOL_NAME = "registrar_turno"
+TOOL_DESCRIPTION = (
+    "Responde ao paciente e registra sintomas e escalas relatados "
+    "na última mensagem. Use null para o que não foi relatado."
+)
+
+# Sintomas com escala 0-10 -> campo correspondente em PriorityRequest
+SYMPTOM_FIELDS = {
+    "pain": "pain_score",
+    "nausea": "nausea_score",
+    "fatigue": "fatigue_score",
+}
+# Escalas clínicas -> (mínimo, máximo, campo em PriorityRequest)
+SCALE_FIELDS = {
+    "performance_status": (0, 4, "performance_status"),
+}
+
+
+def _nullable_int(description: str, minimum: int, maximum: int) -> Dict:
+    return {
+        "type": ["integer", "null"],
+        "minimum": minimum,
+        "maximum": maximum,
+        "description": description,
+    }
+
+
+TURN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "reply": {
+            "type": "string",
+            "description": "Resposta ao paciente, em português, seguindo as regras",
+        },
+        "symptoms": {
+            "type": "object",
+            "properties": {
+                "pain": _nullable_int("Intensidade da dor (0-10)", 0, 10),
+                "nausea": _nullable_int("Intensidade da náusea (0-10)", 0, 10),
+                "fatigue": _nullable_int("Intensidade da fadiga (0-10)", 0, 10),
+            },
+            "required": list(SYMPTOM_FIELDS),
+            "additionalProperties": False,
+        },
+        "scales": {
+            "type": "object",
+            "properties": {
+                "performance_status": _nullable_int(
+                    "ECOG performance status (0-4), se inferível", 0, 4
+                ),
+            },
+            "required": list(SCALE_FIELDS),
+            "additionalProperties": False,
+        },
+    },
+    "required": ["reply", "symptoms", "scales"],
+    "additionalProperties": False,
+}
+
+
+TURN_TOOL = {
+    "name": TOOL_NAME,
+    "description": TOOL_DESCRIPTION,
+    "parameters": TURN_SCHEMA,
+}
+
+
+def _as_bounded_int(value, minimum: int, maximum: int) -> Optional[int]:
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    if not minimum <= value <= maximum:
+        return None
+    return value
+
+
+def normalize_structured_data(payload: Optional[Dict]) -> Dict:
+    """
+    Valida payload do LLM no formato de `AgentMessageResponse.structured_data`
+
+    Valores ausentes, nulos ou fora da faixa são descartados.
+
+    Returns:
+        {"symptoms": {...}, "scales": {...}} apenas com valores válidos
+    """
+    payload = payload or {}
+    symptoms = payload.get("symptoms") or {}
+    scales = payload.get("scales") or {}
+
+    structured_data = {"symptoms": {}, "scales": {}}
+    for name in SYMPTOM_FIELDS:
+        value = _as_bounded_int(symptoms.get(name), 0, 10)
+        if value is not None:
+            structured_data["symptoms"][name] = value
+    for name, (minimum, maximum, _) in SCALE_FIELDS.items():
+        value = _as_bounded_int(scales.get(name), minimum, maximum)
+        if value is not None:
+            structured_data["scales"][name] = value
+    return structured_data
+
+
+def merge_structured_data(primary: Dict, fallback: Dict) -> Dict:
+    """Completa `primary` (LLM) com valores de `fallback` (regex) ausentes"""
+    return {
+        section: {**fallback.get(section, {}), **primary.get(section, {})}
+        for section in ("symptoms", "scales")
+    }
+
@@ -2,11 +2,66 @@
 Agente conversacional de IA para WhatsApp
 """
 
-from typing import Dict, List, Optional
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Sequence
 from openai import OpenAI
 from anthropic import Anthropic
+import pandas as pd
 import logging
 import os
+import re
+
+from .llm_router import (
+    DEFAULT_ROUTES,
+    LARGE,
+    AnthropicProvider,
+    LLMProvider,
+    LLMRouter,
+    ModelRoute,
+    OpenAIProvider,
+    classify_turn,
+    parse_routes,
+)
+from .structured_output import TURN_TOOL, merge_structured_data, normalize_structured_data
+from .scheduler import AdmissionTimeout, LLMScheduler, Ticket, estimate_tokens, llm_scheduler
+
+# Limite de tokens da resposta do LLM
+MAX_OUTPUT_TOKENS = 500
+# Timeout por chamada ao provedor; sem retries no SDK (o roteador faz o
+# failover para a próxima rota)
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "20"))
+
+# Palavras-chave de sintomas críticos (alerta imediato)
+CRITICAL_KEYWORDS = {
+    'febre': ['febre', 'febril', 'temperatura alta', 'calafrio'],
+    'dispneia': ['falta de ar', 'não consigo respirar', 'sufocando'],
+    'sangramento': ['sangrando', 'sangue', 'hemorragia'],
+    'dor_intensa': ['dor muito forte', 'dor 10', 'dor insuportável'],
+    'vomito': ['vomitando muito', 'não paro de vomitar'],
+}
+# Escala de dor (0-10), ex: "dor 7 de 10"
+PAIN_PATTERN = r'dor[^\d]*(\d+)[^\d]*10'
+
+
+@dataclass
+class PreparedTurn:
+    """Turno já processado localmente, aguardando admissão e chamada ao LLM"""
+    message: str
+    patient_context: Dict
+    tenant_id: Optional[str]
+    critical_symptoms: List[str]
+    structured_data: Dict
+    system_prompt: str
+    messages: List[Dict] = field(default_factory=list)
+    tier: str = LARGE
+    reason: str = ""
+    tokens: int = 0
+    # Resposta pronta sem LLM (indisponível ou saturado)
+    result: Optional[Dict] = None
+
+    @property
+    def critical(self) -> bool:
+        return len(self.critical_symptoms) > 0
 
 
 class WhatsAppAgent:
@@ -18,38 +73,66 @@ class WhatsAppAgent:
         self,
         provider: str = "openai",  # "openai" ou "anthropic"
         model: str = "gpt-4",
+        scheduler: Optional[LLMScheduler] = None,
+        router: Optional[LLMRouter] = None,
+        structured_output: bool = True,
     ):
+        """
+        Args:
+            provider: Provedor preferencial (rotas dele vêm primeiro)
+            model: Modelo grande do provedor preferencial
+            scheduler: Escalonador de admissão no rate limit do provedor
+            router: Roteador de modelos (padrão: montado a partir do ambiente)
+            structured_output: Pedir resposta + sintomas/escalas na mesma
+                chamada ao LLM (ver `structured_output.py`)
+        """
+        if provider not in ("openai", "anthropic"):
+            raise ValueError(f"Provider não suportado: {provider}")
+        
         self.provider = provider
         self.model = model
-        self.client = None
+        self.scheduler = scheduler
+        self.structured_output = structured_output
         self.disabled_reason: Optional[str] = None
         self.logger = logging.getLogger(__name__)
+        self.router = router or self._build_router()
         
-        if provider == "openai":
-            api_key = os.getenv("OPENAI_API_KEY")
-            if not api_key:
-                self.disabled_reason = "OPENAI_API_KEY não configurada"
-                self.logger.warning(
-                    "OPENAI_API_KEY não configurada. "
-                    "O agente WhatsApp vai responder com mensagens mockadas."
-                )
-            else:
-                self.client = OpenAI(api_key=api_key)
-        elif provider == "anthropic":
-            api_key = os.getenv("ANTHROPIC_API_KEY")
-            if not api_key:
-                self.disabled_reason = "ANTHROPIC_API_KEY não configurada"
-                self.logger.warning(
-                    "ANTHROPIC_API_KEY não configurada. "
-                    "O agente WhatsApp vai responder com mensagens mockadas."
-                )
-            else:
-                self.client = Anthropic(api_key=api_key)
-        else:
-            raise ValueError(f"Provider não suportado: {provider}")
+        if not self.router.is_available():
+            self.disabled_reason = "OPENAI_API_KEY/ANTHROPIC_API_KEY não configuradas"
+            self.logger.warning(
+                "OPENAI_API_KEY e ANTHROPIC_API_KEY não configuradas. "
+                "O agente WhatsApp vai responder com mensagens mockadas."
+            )
+    
+    def _build_router(self) -> LLMRouter:
+        """
+        Monta roteador com os provedores que têm chave configurada
+        
+        Rotas vêm de LLM_ROUTES ("provedor:modelo:nível,..."); o modelo do
+        provedor preferencial é garantido como rota grande.
+        """
+        providers: Dict[str, LLMProvider] = {}
+        openai_key = os.getenv("OPENAI_API_KEY")
+        if openai_key:
+            providers["openai"] = OpenAIProvider(
+                OpenAI(api_key=openai_key, timeout=LLM_TIMEOUT_SECONDS, max_retries=0)
+            )
+        anthropic_key = os.getenv("ANTHROPIC_API_KEY")
+        if anthropic_key:
+            providers["anthropic"] = AnthropicProvider(
+                Anthropic(api_key=anthropic_key, timeout=LLM_TIMEOUT_SECONDS, max_retries=0)
+            )
+        
+        routes = parse_routes(os.getenv("LLM_ROUTES", DEFAULT_ROUTES))
+        if not any(r.provider == self.provider and r.model == self.model for r in routes):
+            routes.append(ModelRoute(provider=self.provider, model=self.model, tier=LARGE))
+        # Ordenação estável: em empate de latência, o provedor preferencial ganha
+        routes.sort(key=lambda r: r.provider != self.provider)
+        
+        return LLMRouter(providers, routes)
     
     def _is_llm_available(self) -> bool:
-        return self.client is not None
+        return self.router.is_available()
     
     def _get_system_prompt(self, patient_context: Dict) -> str:
         """
@@ -93,72 +176,187 @@ Tratamento atual: {patient_context.get('treatment', 'Não especificado')}
         self,
         message: str,
         patient_context: Dict,
-        conversation_history: List[Dict],
+        conversation_history: Iterable[Dict],
+        tenant_id: Optional[str] = None,
+        critical_symptoms: Optional[List[str]] = None,
+        structured_data: Optional[Dict] = None,
     ) -> Dict:
         """
         Processa mensagem do paciente e retorna resposta do agente
         
+        Bloqueia a thread na fila do escalonador; no event loop, use
+        `prepare_turn` + `admit_async` + `complete_turn` (só o último no
+        threadpool).
+        
         Args:
             message: Mensagem do paciente
             patient_context: Contexto do paciente
-            conversation_history: Histórico de conversa
+            conversation_history: Histórico de conversa (lista ou iterador)
+            tenant_id: Tenant do paciente (fila justa no escalonador do LLM)
+            critical_symptoms: Sintomas já detectados (ex: em lote pelo
+                worker de ingestão); se None, detecta aqui
+            structured_data: Extração local já feita; se None, extrai aqui
             
         Returns:
             Dict com resposta, dados estruturados e alertas
         """
+        turn = self.prepare_turn(
+            message, patient_context, conversation_history, tenant_id,
+            critical_symptoms, structured_data,
+        )
+        return self.complete_turn(turn, self.admit(turn))
+    
+    def prepare_turn(
+        self,
+        message: str,
+        patient_context: Dict,
+        conversation_history: Iterable[Dict],
+        tenant_id: Optional[str] = None,
+        critical_symptoms: Optional[List[str]] = None,
+        structured_data: Optional[Dict] = None,
+    ) -> PreparedTurn:
+        """
+        Etapa local do turno (sem I/O): detecção, extração, prompt e roteamento
+        
+        Mesmos argumentos de `process_message`.
+        """
         system_prompt = self._get_system_prompt(patient_context)
         
-        # Construir histórico de mensagens
-        messages = [{"role": "system", "content": system_prompt}]
+        # Detectar sintomas críticos
+        if critical_symptoms is None:
+            critical_symptoms = self._detect_critical_symptoms(message)
         
-        for msg in conversation_history:
-            messages.append({
-                "role": msg["role"],  # "user" ou "assistant"
-                "content": msg["content"]
-            })
+        # Extrair dados estruturados (regex local; LLM complementa abaixo)
+        if structured_data is None:
+            structured_data = self._extract_structured_data(message)
+        
+        turn = PreparedTurn(
+            message=message,
+            patient_context=patient_context,
+            tenant_id=tenant_id,
+            critical_symptoms=critical_symptoms,
+            structured_data=structured_data,
+            system_prompt=system_prompt,
+        )
+        
+        if not self._is_llm_available():
+            turn.result = self._local_result(turn, self._fallback_response(patient_context, message))
+            return turn
+        
+        # Construir histórico de mensagens em uma única passada
+        # (o prompt do sistema é enviado à parte, conforme o provedor)
+        turn.messages = [
+            {"role": msg["role"], "content": msg["content"]}  # "user" ou "assistant"
+            for msg in conversation_history
+        ]
         
         # Adicionar mensagem atual
-        messages.append({"role": "user", "content": message})
+        turn.messages.append({"role": "user", "content": message})
         
-        # Detectar sintomas críticos
-        critical_symptoms = self._detect_critical_symptoms(message)
+        # Modelo pequeno para turnos simples; grande para complexos/críticos
+        turn.tier, turn.reason = classify_turn(
+            message,
+            history_messages=len(turn.messages) - 1,
+            critical=turn.critical,
+        )
         
-        # Extrair dados estruturados
-        structured_data = self._extract_structured_data(message)
-
-        if not self._is_llm_available():
-            agent_response = self._fallback_response(patient_context, message)
-            return {
-                "response": agent_response,
-                "critical_symptoms": critical_symptoms,
-                "structured_data": structured_data,
-                "should_alert": len(critical_symptoms) > 0,
-                "llm_available": False,
-            }
+        prompt_chars = len(system_prompt) + sum(len(msg["content"]) for msg in turn.messages)
+        turn.tokens = estimate_tokens(prompt_chars, MAX_OUTPUT_TOKENS)
+        return turn
+    
+    def admit(self, turn: PreparedTurn, arrived_at: Optional[float] = None) -> Optional[Ticket]:
+        """
+        Admissão no rate limit do provedor, bloqueando a thread
         
-        # Chamar LLM
-        if self.provider == "openai":
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=500,
+        Returns:
+            Ticket, ou None sem escalonador ou se o turno já tem resposta
+            (LLM indisponível ou saturado: `turn.result` preenchido)
+        """
+        if self.scheduler is None or turn.result is not None:
+            return None
+        try:
+            return self.scheduler.acquire(
+                tenant_id=turn.tenant_id,
+                tokens=turn.tokens,
+                critical=turn.critical,
+                arrived_at=arrived_at,
             )
-            agent_response = response.choices[0].message.content
-        else:  # anthropic
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=500,
-                messages=messages,
+        except AdmissionTimeout as e:
+            self._mark_busy(turn, e)
+            return None
+    
+    async def admit_async(self, turn: PreparedTurn, arrived_at: Optional[float] = None) -> Optional[Ticket]:
+        """Como `admit`, esperando no event loop (críticos têm precedência)"""
+        if self.scheduler is None or turn.result is not None:
+            return None
+        try:
+            return await self.scheduler.acquire_async(
+                tenant_id=turn.tenant_id,
+                tokens=turn.tokens,
+                critical=turn.critical,
+                arrived_at=arrived_at,
+            )
+        except AdmissionTimeout as e:
+            self._mark_busy(turn, e)
+            return None
+    
+    def _mark_busy(self, turn: PreparedTurn, error: Exception):
+        self.logger.warning(f"LLM saturado, resposta padrão enviada: {error}")
+        turn.result = self._local_result(turn, self._busy_response(turn.patient_context))
+    
+    def _local_result(self, turn: PreparedTurn, response: str) -> Dict:
+        return {
+            "response": response,
+            "critical_symptoms": turn.critical_symptoms,
+            "structured_data": turn.structured_data,
+            "should_alert": turn.critical,
+            "llm_available": False,
+        }
+    
+    def complete_turn(self, turn: PreparedTurn, ticket: Optional[Ticket]) -> Dict:
+        """
+        Chamada ao provedor (bloqueante) e montagem da resposta
+        
+        Args:
+            turn: Saída de `prepare_turn`
+            ticket: Saída de `admit`/`admit_async`
+        """
+        if turn.result is not None:
+            return turn.result
+        
+        # Chamar LLM (com failover entre provedores)
+        try:
+            completion, route = self.router.complete(
+                system_prompt=turn.system_prompt,
+                messages=turn.messages,
+                max_tokens=MAX_OUTPUT_TOKENS,
+                tier=turn.tier,
+                reason=turn.reason,
+                tool=TURN_TOOL if self.structured_output else None,
+            )
+        except RuntimeError as e:
+            # Sintomas e extração locais (regex) continuam valendo para o alerta
+            self.logger.error(f"LLM indisponível, resposta padrão enviada: {e}")
+            return self._local_result(turn, self._unavailable_response(turn.patient_context))
+        
+        if ticket is not None:
+            self.scheduler.settle(ticket, completion.total_tokens)
+        agent_response = completion.reply
+        structured_data = turn.structured_data
+        
+        # Resposta e extração vieram na mesma chamada (ferramenta forçada)
+        if completion.structured is not None:
+            structured_data = merge_structured_data(
+                normalize_structured_data(completion.structured), structured_data
             )
-            agent_response = response.content[0].text
         
         return {
             "response": agent_response,
-            "critical_symptoms": critical_symptoms,
+            "critical_symptoms": turn.critical_symptoms,
             "structured_data": structured_data,
-            "should_alert": len(critical_symptoms) > 0,
+            "should_alert": turn.critical,
             "llm_available": True,
+            "llm_model": route.key,
         }
 
     def _fallback_response(self, patient_context: Dict, message: str) -> str:
@@ -179,6 +377,27 @@ Tratamento atual: {patient_context.get('treatment', 'Não especificado')}
             f"Mensagem recebida: \"{message}\"\n\n{guidance}"
         )
     
+    def _busy_response(self, patient_context: Dict) -> str:
+        """
+        Retorna resposta padrão quando a fila do LLM excede o tempo máximo.
+        """
+        name = patient_context.get("name", "paciente")
+        return (
+            f"Olá {name}! Recebemos sua mensagem e ela foi registrada. "
+            "Estamos com alto volume de atendimentos e responderemos em breve."
+        )
+    
+    def _unavailable_response(self, patient_context: Dict) -> str:
+        """
+        Retorna resposta padrão quando todos os provedores de LLM falharam.
+        """
+        name = patient_context.get("name", "paciente")
+        return (
+            f"Olá {name}! Recebemos sua mensagem e ela foi registrada. "
+            "No momento não conseguimos responder automaticamente; "
+            "a equipe de enfermagem dará retorno em breve."
+        )
+    
     def _detect_critical_symptoms(self, message: str) -> List[str]:
         """
         Detecta sintomas críticos na mensagem
@@ -192,48 +411,72 @@ Tratamento atual: {patient_context.get('treatment', 'Não especificado')}
         message_lower = message.lower()
         critical_symptoms = []
         
-        critical_keywords = {
-            'febre': ['febre', 'febril', 'temperatura alta', 'calafrio'],
-            'dispneia': ['falta de ar', 'não consigo respirar', 'sufocando'],
-            'sangramento': ['sangrando', 'sangue', 'hemorragia'],
-            'dor_intensa': ['dor muito forte', 'dor 10', 'dor insuportável'],
-            'vomito': ['vomitando muito', 'não paro de vomitar'],
-        }
-        
-        for symptom, keywords in critical_keywords.items():
+        for symptom, keywords in CRITICAL_KEYWORDS.items():
             if any(keyword in message_lower for keyword in keywords):
                 critical_symptoms.append(symptom)
         
         return critical_symptoms
     
+    def detect_critical_symptoms_batch(self, messages: Sequence[str]) -> List[List[str]]:
+        """
+        Detecção de sintomas críticos vetorizada sobre um lote de mensagens
+        
+        Mesmo resultado de `_detect_critical_symptoms` por mensagem, com uma
+        busca (regex de alternativas) por sintoma sobre o lote inteiro.
+        """
+        lowered = pd.Series(list(messages), dtype=object).str.lower()
+        matches = pd.DataFrame({
+            symptom: lowered.str.contains(
+                "|".join(re.escape(keyword) for keyword in keywords), regex=True
+            )
+            for symptom, keywords in CRITICAL_KEYWORDS.items()
+        })
+        symptoms = matches.columns.to_numpy()
+        return [[str(symptom) for symptom in symptoms[row]] for row in matches.to_numpy()]
+    
     def _extract_structured_data(self, message: str) -> Dict:
         """
         Extrai dados estruturados da mensagem (sintomas, escalas)
         
+        Extrator local por regex: usado quando o LLM não está disponível e
+        para completar a saída estruturada do LLM.
+        
         Args:
             message: Mensagem do paciente
             
         Returns:
             Dict com dados estruturados
         """
-        # Implementação básica - pode ser melhorada com LLM function calling
         structured_data = {
             "symptoms": {},
             "scales": {},
         }
         
         # Detectar escala de dor (0-10)
-        import re
-        pain_pattern = r'dor[^\d]*(\d+)[^\d]*10'
-        pain_match = re.search(pain_pattern, message.lower())
+        pain_match = re.search(PAIN_PATTERN, message.lower())
         if pain_match:
             pain_score = int(pain_match.group(1))
             structured_data["symptoms"]["pain"] = pain_score
         
         return structured_data
+    
+    def extract_structured_data_batch(self, messages: Sequence[str]) -> List[Dict]:
+        """Extração local vetorizada (equivalente a `_extract_structured_data`)"""
+        pain = (
+            pd.Series(list(messages), dtype=object)
+            .str.lower()
+            .str.extract(PAIN_PATTERN, expand=False)
+        )
+        return [
+            {
+                "symptoms": {} if pd.isna(value) else {"pain": int(value)},
+                "scales": {},
+            }
+            for value in pain
+        ]
 
 
 # Instância global do agente
-whatsapp_agent = WhatsAppAgent()
+whatsapp_agent = WhatsAppAgent(scheduler=llm_scheduler)
 
 
@@ -2,15 +2,40 @@
 Rotas da API do AI Service
 """
 
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List, Dict, Optional
+import asyncio
+import hmac
+import os
+import time
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+from typing import List, Dict, Literal, Optional
+from weakref import WeakValueDictionary
 from ..models.priority_model import priority_model
+from ..models.registry import InvalidModelIdentifier, model_registry
+from ..models.encoders import category_encoders
+from ..models.drift import drift_monitor
+from ..models.shadow import shadow_evaluator
+from ..models.priority_rules import priority_rules
 from ..agent.whatsapp_agent import whatsapp_agent
+from ..agent.conversation_store import conversation_store, ConversationNotFound
+from ..agent.scheduler import TENANT_ID_PATTERN, llm_scheduler
+from ..services.profiler import sampling_profiler, ProfilerBusy
+from ..services.ingestion import ingestion_worker
 
 router = APIRouter()
 
 
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Rotas administrativas exigem o header X-Admin-Token = AI_ADMIN_TOKEN"""
+    expected = os.getenv("AI_ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=403, detail="Rotas administrativas desabilitadas")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, expected):
+        raise HTTPException(status_code=401, detail="Token administrativo inválido")
+
+
 # Models de requisição/resposta
 class PriorityRequest(BaseModel):
     cancer_type: str
@@ -22,6 +47,8 @@ class PriorityRequest(BaseModel):
     fatigue_score: Optional[int] = 0
     days_since_last_visit: int
     treatment_cycle: Optional[int] = 0
+    tenant_id: Optional[str] = None
+    model_version: Optional[str] = None
 
 
 class PriorityResponse(BaseModel):
@@ -35,6 +62,8 @@ class AgentMessageRequest(BaseModel):
     patient_id: str
     patient_context: Dict
     conversation_history: List[Dict]
+    # Chave da fila justa do escalonador do LLM
+    tenant_id: Optional[str] = Field(None, pattern=TENANT_ID_PATTERN)
 
 
 class AgentMessageResponse(BaseModel):
@@ -44,6 +73,39 @@ class AgentMessageResponse(BaseModel):
     should_alert: bool
 
 
+class QueuedMessageRequest(AgentMessageRequest):
+    conversation_id: Optional[str] = None
+    message_id: Optional[str] = None
+
+
+class QueuedMessageResponse(BaseModel):
+    queue_message_id: str
+
+
+class HistoryMessage(BaseModel):
+    role: Literal["user", "assistant"]
+    content: str
+
+
+class ConversationCreateRequest(BaseModel):
+    patient_id: str
+    patient_context: Dict
+    conversation_history: List[HistoryMessage] = []
+    tenant_id: Optional[str] = Field(None, pattern=TENANT_ID_PATTERN)
+
+
+class ConversationCreateResponse(BaseModel):
+    conversation_id: str
+
+
+class ConversationMessageRequest(BaseModel):
+    message: str
+
+
+class ConversationMessageResponse(AgentMessageResponse):
+    conversation_id: str
+
+
 @router.post("/prioritize", response_model=PriorityResponse)
 async def prioritize_patient(request: PriorityRequest):
     """
@@ -53,21 +115,24 @@ async def prioritize_patient(request: PriorityRequest):
         # Preparar features (simulado - em produção, usar feature engineering real)
         import pandas as pd
         
-        # Encoding básico (em produção, usar label encoders treinados)
-        cancer_type_map = {
-            'mama': 0, 
-            'pulmao': 1, 
-            'colorectal': 2, 
-            'prostata': 3,
-            'kidney': 4,        # Rim
-            'bladder': 5,       # Bexiga
-            'testicular': 6,    # Testículo
+        # Encoding com os LabelEncoders do treino (label_encoders.pkl)
+        row = {
+            'cancer_type_encoded': category_encoders.encode('cancer_type', request.cancer_type.lower()),
+            'stage_encoded': category_encoders.encode('stage', request.stage.upper()),
+            'performance_status': request.performance_status,
+            'age': request.age,
+            'pain_score': request.pain_score,
+            'nausea_score': request.nausea_score,
+            'fatigue_score': request.fatigue_score,
+            'days_since_last_visit': request.days_since_last_visit,
+            'treatment_cycle': request.treatment_cycle,
         }
-        stage_map = {'I': 0, 'II': 1, 'III': 2, 'IV': 3}
+        features = pd.DataFrame([row])
         
-        features = pd.DataFrame([{
-            'cancer_type_encoded': cancer_type_map.get(request.cancer_type.lower(), 0),
-            'stage_encoded': stage_map.get(request.stage.upper(), 0),
+        # Atualizar sketches de drift (features brutas, custo constante)
+        drift_monitor.observe({
+            'cancer_type': request.cancer_type.lower(),
+            'stage': request.stage.upper(),
             'performance_status': request.performance_status,
             'age': request.age,
             'pain_score': request.pain_score,
@@ -75,37 +140,42 @@ async def prioritize_patient(request: PriorityRequest):
             'fatigue_score': request.fatigue_score,
             'days_since_last_visit': request.days_since_last_visit,
             'treatment_cycle': request.treatment_cycle,
-        }])
+        })
+        
+        # Valores brutos para a tabela de regras (fallback e razão)
+        rule_row = {
+            'stage': request.stage,
+            'performance_status': request.performance_status,
+            'pain_score': request.pain_score,
+            'nausea_score': request.nausea_score,
+            'days_since_last_visit': request.days_since_last_visit,
+        }
+        
+        # Modelo calibrado do tenant (ou modelo global como fallback); a carga
+        # do disco roda fora do event loop para não bloquear outras requisições
+        model = model_registry.get_resident(request.tenant_id, request.model_version)
+        if model is None:
+            model = await run_in_threadpool(
+                model_registry.get, request.tenant_id, request.model_version
+            )
         
         # Predição (modelo ainda não treinado - retornar score baseado em regras)
-        if not priority_model.is_trained:
-            # Fallback: calcular score baseado em regras simples
-            score = 0
-            if request.pain_score >= 8:
-                score += 30
-            if request.stage == 'IV':
-                score += 20
-            if request.performance_status >= 3:
-                score += 25
-            if request.days_since_last_visit > 60:
-                score += 15
-            
-            score = min(100, score)
+        if not model.is_trained:
+            # Fallback: mesmas regras de negócio que rotulam o dataset de treino
+            score = priority_rules.score_one(rule_row)
         else:
             # Usar modelo treinado
-            predictions = priority_model.predict(features)
+            predictions = model.predict(features)
             score = float(predictions[0])
+            
+            # Candidato em modo sombra: só enfileira, pontuação em background
+            if model is priority_model:
+                shadow_evaluator.submit(row, score)
         
-        category = priority_model.categorize_priority(score)
+        category = model.categorize_priority(score)
         
-        # Gerar razão (simplificado)
-        reasons = []
-        if request.pain_score >= 8:
-            reasons.append("Dor intensa reportada")
-        if request.stage == 'IV':
-            reasons.append("Estadiamento avançado")
-        if request.performance_status >= 3:
-            reasons.append("Performance status comprometido")
+        # Gerar razão (regras com texto na tabela)
+        reasons = priority_rules.reasons(rule_row)
         
         reason = "; ".join(reasons) if reasons else "Priorização baseada em múltiplos fatores"
         
@@ -114,20 +184,40 @@ async def prioritize_patient(request: PriorityRequest):
             priority_category=category,
             reason=reason,
         )
+    except InvalidModelIdentifier as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao calcular prioridade: {str(e)}")
 
 
+async def _agent_turn(arrived_at: float, **kwargs) -> Dict:
+    """
+    Turno do agente: admissão na fila do LLM no event loop, e só a chamada
+    síncrona ao provedor no threadpool
+
+    Esperar a admissão dentro do threadpool deixaria uma rajada de rotina
+    ocupar todas as threads antes de a mensagem crítica entrar na fila.
+    """
+    turn = whatsapp_agent.prepare_turn(**kwargs)
+    ticket = await whatsapp_agent.admit_async(turn, arrived_at=arrived_at)
+    return await run_in_threadpool(
+        sampling_profiler.bind_thread(whatsapp_agent.complete_turn), turn, ticket
+    )
+
+
 @router.post("/agent/message", response_model=AgentMessageResponse)
 async def process_agent_message(request: AgentMessageRequest):
     """
     Processa mensagem do paciente via agente de IA
     """
+    arrived_at = time.monotonic()
     try:
-        result = whatsapp_agent.process_message(
+        result = await _agent_turn(
+            arrived_at,
             message=request.message,
             patient_context=request.patient_context,
             conversation_history=request.conversation_history,
+            tenant_id=request.tenant_id,
         )
         
         return AgentMessageResponse(**result)
@@ -135,6 +225,181 @@ async def process_agent_message(request: AgentMessageRequest):
         raise HTTPException(status_code=500, detail=f"Erro ao processar mensagem: {str(e)}")
 
 
+@router.post("/agent/messages/queue", response_model=QueuedMessageResponse, status_code=202)
+async def enqueue_agent_message(request: QueuedMessageRequest):
+    """
+    Enfileira mensagem para o worker de ingestão (processamento em lote)
+    """
+    if ingestion_worker.queue is None:
+        raise HTTPException(status_code=503, detail="Fila de ingestão não configurada")
+    try:
+        queue_message_id = await run_in_threadpool(
+            ingestion_worker.queue.enqueue, request.model_dump()
+        )
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Erro ao enfileirar mensagem: {str(e)}")
+    return QueuedMessageResponse(queue_message_id=queue_message_id)
+
+
+# Lock de turno por conversa; some sozinho quando nenhum turno o referencia
+_conversation_locks: "WeakValueDictionary[str, asyncio.Lock]" = WeakValueDictionary()
+
+
+def _conversation_turn_lock(conversation_id: str) -> asyncio.Lock:
+    lock = _conversation_locks.get(conversation_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _conversation_locks[conversation_id] = lock
+    return lock
+
+
+def _load_conversation(conversation_id: str):
+    return conversation_store.get(conversation_id), conversation_store.messages(conversation_id)
+
+
+def _append_turn(conversation_id: str, message: str, response: str):
+    conversation_store.append(conversation_id, "user", message)
+    conversation_store.append(conversation_id, "assistant", response)
+
+
+# Com CONVERSATION_DB_PATH, o armazenamento grava no SQLite (com commit):
+# as chamadas ao conversation_store rodam no threadpool, fora do event loop
+@router.post("/agent/conversations", response_model=ConversationCreateResponse)
+async def create_conversation(request: ConversationCreateRequest):
+    """
+    Cria conversa no servidor; os turnos seguintes enviam só a nova mensagem
+    """
+    conversation = await run_in_threadpool(
+        conversation_store.create,
+        patient_id=request.patient_id,
+        patient_context=request.patient_context,
+        conversation_history=[msg.model_dump() for msg in request.conversation_history],
+        tenant_id=request.tenant_id,
+    )
+    return ConversationCreateResponse(conversation_id=conversation.conversation_id)
+
+
+@router.post(
+    "/agent/conversations/{conversation_id}/messages",
+    response_model=ConversationMessageResponse,
+)
+async def append_conversation_message(
+    conversation_id: str,
+    request: ConversationMessageRequest,
+):
+    """
+    Processa nova mensagem de uma conversa armazenada no servidor
+
+    Turnos da mesma conversa são serializados: cada um vê o histórico com
+    o par pergunta/resposta do anterior.
+    """
+    arrived_at = time.monotonic()
+    async with _conversation_turn_lock(conversation_id):
+        try:
+            conversation, history = await run_in_threadpool(_load_conversation, conversation_id)
+        except ConversationNotFound:
+            raise HTTPException(status_code=404, detail="Conversa não encontrada ou expirada")
+
+        try:
+            result = await _agent_turn(
+                arrived_at,
+                message=request.message,
+                patient_context=conversation.patient_context,
+                conversation_history=history,
+                tenant_id=conversation.tenant_id,
+            )
+
+            await run_in_threadpool(
+                _append_turn, conversation_id, request.message, result["response"]
+            )
+
+            return ConversationMessageResponse(conversation_id=conversation_id, **result)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Erro ao processar mensagem: {str(e)}")
+
+
+@router.get("/agent/scheduler")
+async def scheduler_stats():
+    """Tempo de espera na fila do LLM por classe (crítico/rotina) e tenant"""
+    return llm_scheduler.stats()
+
+
+@router.get("/agent/router")
+async def router_stats():
+    """Decisões de roteamento e latência/custo por modelo de LLM"""
+    return whatsapp_agent.router.stats()
+
+
+@router.get("/agent/ingestion")
+async def ingestion_stats():
+    """Vazão, tempo por etapa e profundidade da fila do worker de ingestão"""
+    return ingestion_worker.stats()
+
+
+@router.get("/models/registry")
+async def registry_stats():
+    """Residência do cache de modelos por tenant e latência de carga"""
+    return model_registry.stats()
+
+
+@router.get("/models/drift")
+async def drift_report():
+    """Drift das features ao vivo em relação ao perfil de treino do modelo"""
+    return drift_monitor.report()
+
+
+@router.get("/models/shadow")
+async def shadow_report():
+    """Divergência do modelo candidato (modo sombra) em relação ao modelo ao vivo"""
+    return shadow_evaluator.report()
+
+
+@router.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def start_profile(
+    seconds: float = 10.0,
+    interval_ms: float = 10.0,
+    fraction: float = 1.0,
+    include_unattributed: bool = True,
+    wait: bool = True,
+    format: str = "json",
+):
+    """
+    Inicia profiler por amostragem (pilhas em formato collapsed, por rota)
+    
+    Com `fraction` < 1, só essa fração das requisições é amostrada. Com
+    `wait=false`, retorna imediatamente; o resultado sai em GET /admin/profile.
+    """
+    try:
+        session = sampling_profiler.start(
+            duration=seconds,
+            interval=interval_ms / 1000,
+            fraction=fraction,
+            include_unattributed=include_unattributed,
+        )
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    if not wait:
+        return {"status": "started", "duration_seconds": session.duration}
+
+    while not session.done.is_set():
+        await asyncio.sleep(0.1)
+    if format == "collapsed":
+        return PlainTextResponse(session.collapsed())
+    return session.result()
+
+
+@router.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def get_profile(format: str = "json"):
+    """Resultado da sessão de profiling atual ou da última concluída"""
+    session = sampling_profiler.last_session
+    if session is None:
+        raise HTTPException(status_code=404, detail="Nenhuma sessão de profiling")
+    if format == "collapsed":
+        return PlainTextResponse(session.collapsed())
+    return {"running": not session.done.is_set(), **session.result()}
+
+
 @router.get("/health")
 async def health():
     """Health check"""
@@ -0,0 +1,327 @@
+"""
+Artefato de modelo em layout de arrays planos, mapeável em memória
+
+O pickle do VotingRegressor guarda as árvores do RandomForest em objetos
+Cython e os boosters do XGBoost/LightGBM como blobs opacos; ao carregar, cada
+worker do uvicorn/gunicorn recebe sua própria cópia privada do ensemble.
+
+Aqui todas as árvores dos três membros são achatadas em alguns arrays NumPy
+(feature, threshold, filhos e valor de folha por nó) salvos como `.npy` sem
+compressão. Esses arquivos são abertos com `np.load(mmap_mode='r')`, de modo
+que todos os workers compartilham as mesmas páginas via page cache do SO.
+"""
+
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+ARRAY_NAMES = ("feature", "threshold", "left", "right", "value", "roots")
+
+# Limite de linhas por bloco na predição (linhas x árvores em memória)
+PREDICT_CHUNK_ROWS = 2048
+
+
+class _TreeBuffer:
+    """Acumula nós de várias árvores em listas antes de virar arrays"""
+
+    def __init__(self):
+        self.feature: List[int] = []
+        self.threshold: List[float] = []
+        self.left: List[int] = []
+        self.right: List[int] = []
+        self.value: List[float] = []
+        self.roots: List[int] = []
+        self.max_depth = 0
+
+    def add_tree(
+        self,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        value: np.ndarray,
+    ):
+        """
+        Adiciona uma árvore com índices locais (folha: left == -1)
+
+        A regra de decisão é sempre `x <= threshold` vai para a esquerda.
+        Folhas apontam para si mesmas, assim a travessia pode rodar um
+        número fixo de passos sem ramificar por linha.
+        """
+        offset = len(self.feature)
+        n_nodes = len(feature)
+        local = np.arange(n_nodes)
+        is_leaf = left < 0
+
+        self.roots.append(offset)
+        self.feature.extend(np.where(is_leaf, 0, feature).tolist())
+        self.threshold.extend(np.where(is_leaf, 0.0, threshold).tolist())
+        self.left.extend((np.where(is_leaf, local, left) + offset).tolist())
+        self.right.extend((np.where(is_leaf, local, right) + offset).tolist())
+        self.value.extend(np.where(is_leaf, value, 0.0).tolist())
+        self.max_depth = max(self.max_depth, _tree_depth(left, right))
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            "feature": np.asarray(self.feature, dtype=np.int32),
+            "threshold": np.asarray(self.threshold, dtype=np.float64),
+            "left": np.asarray(self.left, dtype=np.int32),
+            "right": np.asarray(self.right, dtype=np.int32),
+            "value": np.asarray(self.value, dtype=np.float64),
+            "roots": np.asarray(self.roots, dtype=np.int32),
+        }
+
+
+def _tree_depth(left: np.ndarray, right: np.ndarray) -> int:
+    """Profundidade máxima de uma árvore com índices locais"""
+    depth = np.zeros(len(left), dtype=np.int64)
+    # Nós filhos sempre têm índice maior que o pai nos três formatos
+    for node in range(len(left)):
+        if left[node] >= 0:
+            depth[left[node]] = depth[node] + 1
+            depth[right[node]] = depth[node] + 1
+    return int(depth.max())
+
+
+def _add_sklearn_forest(buffer: _TreeBuffer, forest) -> int:
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        buffer.add_tree(
+            feature=tree.feature,
+            threshold=tree.threshold,
+            left=tree.children_left,
+            right=tree.children_right,
+            value=tree.value[:, 0, 0],
+        )
+    return len(forest.estimators_)
+
+
+def _add_xgboost(buffer: _TreeBuffer, regressor, feature_names: List[str]):
+    """Achata o booster XGBoost; retorna (n_árvores, base_score)"""
+    booster = regressor.get_booster()
+    model = json.loads(booster.save_raw(raw_format="json"))
+    learner = model["learner"]
+    if booster.feature_names and list(booster.feature_names) != feature_names:
+        raise ValueError("Features do XGBoost divergem do ensemble")
+
+    for tree in learner["gradient_booster"]["model"]["trees"]:
+        left = np.asarray(tree["left_children"], dtype=np.int64)
+        right = np.asarray(tree["right_children"], dtype=np.int64)
+        conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+        # XGBoost usa `x < cond` em float32; em float32, isso equivale a
+        # `x <= nextafter(cond, -inf)`
+        threshold = np.nextafter(conditions, np.float32(-np.inf))
+        buffer.add_tree(
+            feature=np.asarray(tree["split_indices"], dtype=np.int64),
+            threshold=threshold.astype(np.float64),
+            left=left,
+            right=right,
+            value=conditions.astype(np.float64),
+        )
+
+    base_score = learner["learner_model_param"]["base_score"]
+    base_score = float(str(base_score).strip("[]"))
+    return len(learner["gradient_booster"]["model"]["trees"]), base_score
+
+
+def _add_lightgbm(buffer: _TreeBuffer, regressor) -> int:
+    dump = regressor.booster_.dump_model()
+    for info in dump["tree_info"]:
+        nodes: List[dict] = []
+        stack = [info["tree_structure"]]
+        index: Dict[int, int] = {}
+        # Pré-ordem: pais sempre antes dos filhos
+        while stack:
+            node = stack.pop()
+            index[id(node)] = len(nodes)
+            nodes.append(node)
+            if "split_index" in node:
+                if node.get("decision_type", "<=") != "<=":
+                    raise ValueError("Splits categóricos não suportados")
+                stack.append(node["right_child"])
+                stack.append(node["left_child"])
+
+        n_nodes = len(nodes)
+        feature = np.zeros(n_nodes, dtype=np.int64)
+        threshold = np.zeros(n_nodes)
+        left = np.full(n_nodes, -1, dtype=np.int64)
+        right = np.full(n_nodes, -1, dtype=np.int64)
+        value = np.zeros(n_nodes)
+        for i, node in enumerate(nodes):
+            if "split_index" in node:
+                feature[i] = node["split_feature"]
+                threshold[i] = node["threshold"]
+                left[i] = index[id(node["left_child"])]
+                right[i] = index[id(node["right_child"])]
+            else:
+                value[i] = node["leaf_value"]
+        buffer.add_tree(feature, threshold, left, right, value)
+    return len(dump["tree_info"])
+
+
+def export_flat_artifact(voting_regressor, directory: str):
+    """
+    Exporta um VotingRegressor treinado (rf, xgb, lgbm) para o layout plano
+
+    Args:
+        voting_regressor: Ensemble treinado de `PriorityModel`
+        directory: Diretório de destino (criado se não existir)
+    """
+    weights = voting_regressor.weights
+    if weights is None:
+        weights = [1.0] * len(voting_regressor.estimators)
+    export_flat_members(
+        [
+            (name, voting_regressor.named_estimators_[name], weight)
+            for (name, _), weight in zip(voting_regressor.estimators, weights)
+        ],
+        [str(name) for name in voting_regressor.feature_names_in_],
+        directory,
+    )
+
+
+def export_flat_members(
+    estimators: List[Tuple[str, object, float]],
+    feature_names: List[str],
+    directory: str,
+):
+    """
+    Exporta média ponderada de estimadores de árvores para o layout plano
+
+    Args:
+        estimators: (nome, estimador treinado, peso) - RandomForestRegressor,
+            XGBRegressor ou LGBMRegressor
+        feature_names: Ordem das colunas usada no treino
+        directory: Diretório de destino (criado se não existir)
+    """
+    buffer = _TreeBuffer()
+    members = []
+    for name, estimator, weight in estimators:
+        first_tree = len(buffer.roots)
+        kind = type(estimator).__name__
+        bias = 0.0
+
+        if kind == "RandomForestRegressor":
+            n_trees = _add_sklearn_forest(buffer, estimator)
+            scale = 1.0 / n_trees
+        elif kind == "XGBRegressor":
+            n_trees, bias = _add_xgboost(buffer, estimator, feature_names)
+            scale = 1.0
+        elif kind == "LGBMRegressor":
+            n_trees = _add_lightgbm(buffer, estimator)
+            scale = 1.0
+        else:
+            raise ValueError(f"Estimador não suportado no artefato: {kind}")
+
+        members.append({
+            "name": name,
+            "kind": kind,
+            "weight": float(weight),
+            "scale": scale,
+            "bias": bias,
+            "first_tree": first_tree,
+            "n_trees": n_trees,
+        })
+
+    os.makedirs(directory, exist_ok=True)
+    for array_name, array in buffer.arrays().items():
+        np.save(os.path.join(directory, f"{array_name}.npy"), array)
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "feature_names": feature_names,
+        "max_depth": buffer.max_depth,
+        "members": members,
+    }
+    with open(os.path.join(directory, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def is_flat_artifact(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, MANIFEST_FILE))
+
+
+class FlatEnsemble:
+    """
+    Ensemble carregado do layout plano; predição equivalente ao VotingRegressor
+
+    Com `mmap_mode='r'` os arrays ficam no page cache e são compartilhados
+    entre processos; nenhum worker mantém cópia privada das árvores.
+    """
+
+    def __init__(self, manifest: Dict, arrays: Dict[str, np.ndarray]):
+        if manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(
+                f"Versão de artefato não suportada: {manifest.get('format_version')}"
+            )
+        self.feature_names_in_ = np.asarray(manifest["feature_names"], dtype=object)
+        self.max_depth = int(manifest["max_depth"])
+        self.members = manifest["members"]
+        self.arrays = arrays
+
+        total_weight = sum(member["weight"] for member in self.members)
+        # Coeficiente por árvore: peso do membro * escala (1/n no RF)
+        tree_coef = np.zeros(len(arrays["roots"]))
+        self.bias = 0.0
+        for member in self.members:
+            start = member["first_tree"]
+            end = start + member["n_trees"]
+            coef = member["weight"] * member["scale"] / total_weight
+            tree_coef[start:end] = coef
+            self.bias += member["weight"] * member["bias"] / total_weight
+        self.tree_coef = tree_coef
+
+    @classmethod
+    def load(cls, directory: str, mmap_mode: Optional[str] = "r") -> "FlatEnsemble":
+        """
+        Carrega artefato plano
+
+        Args:
+            directory: Diretório gerado por `export_flat_artifact`
+            mmap_mode: Modo do `np.load` ('r' compartilha; None copia para RAM)
+        """
+        with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in ARRAY_NAMES
+        }
+        return cls(manifest, arrays)
+
+    def _as_matrix(self, X) -> np.ndarray:
+        if isinstance(X, pd.DataFrame):
+            X = X[list(self.feature_names_in_)]
+        # float32 como no sklearn/XGBoost (entradas são inteiros pequenos)
+        return np.asarray(X, dtype=np.float32).astype(np.float64)
+
+    def predict(self, X) -> np.ndarray:
+        """Prediz scores para todas as linhas de X"""
+        matrix = self._as_matrix(X)
+        output = np.empty(len(matrix))
+        for start in range(0, len(matrix), PREDICT_CHUNK_ROWS):
+            chunk = matrix[start:start + PREDICT_CHUNK_ROWS]
+            output[start:start + len(chunk)] = self._predict_chunk(chunk)
+        return output
+
+    def _predict_chunk(self, matrix: np.ndarray) -> np.ndarray:
+        feature = self.arrays["feature"]
+        threshold = self.arrays["threshold"]
+        left = self.arrays["left"]
+        right = self.arrays["right"]
+
+        rows = np.arange(len(matrix))[:, None]
+        node = np.broadcast_to(self.arrays["roots"], (len(matrix), len(self.tree_coef)))
+        for _ in range(self.max_depth):
+            go_left = matrix[rows, feature[node]] <= threshold[node]
+            node = np.where(go_left, left[node], right[node])
+
+        return self.arrays["value"][node] @ self.tree_coef + self.bias
+
+    def nbytes(self) -> int:
+        """Tamanho total dos arrays das árvores"""
+        return int(sum(array.nbytes for array in self.arrays.values()))
@@ -0,0 +1,301 @@
+"""
+Monitoramento contínuo de drift das features de priorização
+
+No treino, um perfil de referência é salvo junto ao artefato do modelo:
+quantis de cada feature numérica e frequências das categóricas. Em produção,
+cada `PriorityRequest` pontuado atualiza, em memória constante:
+
+- Numéricas: histograma sobre as bordas de quantil da referência (mais
+  faixas de underflow/overflow) + média/variância de Welford e min/max
+- Categóricas: contagens por categoria (limitadas a MAX_CATEGORIES)
+
+O custo por requisição é uma busca binária por feature. A comparação usa o
+PSI (Population Stability Index) por feature, calculado sobre uma janela
+rotativa (janela atual + anterior), sem varrer logs.
+"""
+
+import json
+import math
+import os
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+NUMERIC_FEATURES = [
+    'performance_status', 'age', 'pain_score', 'nausea_score',
+    'fatigue_score', 'days_since_last_visit', 'treatment_cycle',
+]
+CATEGORICAL_FEATURES = ['cancer_type', 'stage']
+
+PROFILE_VERSION = 1
+PROFILE_FILE = "reference_profile.json"
+N_QUANTILE_BINS = 10
+MAX_CATEGORIES = 50
+OTHER_CATEGORY = "__other__"
+
+# Limiares usuais de PSI
+PSI_WARNING = 0.1
+PSI_DRIFT = 0.25
+# Amostras mínimas na janela antes de reportar drift
+MIN_SAMPLES = 200
+
+_EPSILON = 1e-4
+
+
+def build_reference_profile(df: pd.DataFrame) -> Dict:
+    """
+    Gera perfil de referência a partir dos dados de treino (features brutas)
+
+    Args:
+        df: DataFrame com NUMERIC_FEATURES e CATEGORICAL_FEATURES (antes do
+            encoding)
+
+    Returns:
+        Perfil serializável em JSON
+    """
+    numeric = {}
+    for name in NUMERIC_FEATURES:
+        values = df[name].to_numpy(dtype=float)
+        quantiles = np.quantile(values, np.linspace(0, 1, N_QUANTILE_BINS + 1))
+        # Features inteiras geram quantis repetidos; bordas precisam ser únicas
+        edges = sorted(set(float(q) for q in quantiles[1:-1]))
+        counts = _histogram(values, edges)
+        numeric[name] = {
+            "edges": edges,
+            "proportions": (counts / counts.sum()).tolist(),
+            "mean": float(values.mean()),
+            "std": float(values.std()),
+            "min": float(values.min()),
+            "max": float(values.max()),
+        }
+
+    categorical = {}
+    for name in CATEGORICAL_FEATURES:
+        frequencies = df[name].astype(str).value_counts(normalize=True)
+        categorical[name] = {
+            str(k): float(v) for k, v in frequencies.head(MAX_CATEGORIES).items()
+        }
+
+    return {
+        "version": PROFILE_VERSION,
+        "n_samples": int(len(df)),
+        "numeric": numeric,
+        "categorical": categorical,
+    }
+
+
+def _histogram(values: np.ndarray, edges: List[float]) -> np.ndarray:
+    """Contagem por faixa: (-inf, e0], (e0, e1], ..., (e_n, +inf)"""
+    bins = np.searchsorted(np.asarray(edges), values, side="left")
+    return np.bincount(bins, minlength=len(edges) + 1).astype(float)
+
+
+def profile_path_for(model_path: str) -> str:
+    """Caminho do perfil ao lado do artefato (diretório plano ou .pkl)"""
+    if os.path.isdir(model_path):
+        return os.path.join(model_path, PROFILE_FILE)
+    return os.path.splitext(model_path)[0] + ".profile.json"
+
+
+def save_reference_profile(profile: Dict, model_path: str):
+    with open(profile_path_for(model_path), "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
+
+
+def load_reference_profile(model_path: str) -> Optional[Dict]:
+    path = profile_path_for(model_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def psi(expected: List[float], actual_counts: List[float]) -> float:
+    """Population Stability Index entre proporções de referência e contagens"""
+    total = sum(actual_counts)
+    if total == 0:
+        return 0.0
+    value = 0.0
+    for e, count in zip(expected, actual_counts):
+        a = count / total
+        e = max(e, _EPSILON)
+        a = max(a, _EPSILON)
+        value += (a - e) * math.log(a / e)
+    return value
+
+
+def _status(value: float) -> str:
+    if value >= PSI_DRIFT:
+        return "drift"
+    if value >= PSI_WARNING:
+        return "warning"
+    return "ok"
+
+
+class _NumericSketch:
+    """Histograma nas bordas da referência + momentos de Welford"""
+
+    __slots__ = ("edges", "counts", "n", "mean", "m2", "min", "max")
+
+    def __init__(self, edges: List[float]):
+        self.edges = edges
+        self.counts = [0] * (len(edges) + 1)
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, value: float):
+        # bisect_left: faixa (e[i-1], e[i]], igual a `_histogram`
+        self.counts[bisect_left(self.edges, value)] += 1
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+
+class _Window:
+    """Sketches de todas as features para uma janela de requisições"""
+
+    def __init__(self, profile: Dict):
+        self.n = 0
+        self.numeric = {
+            name: _NumericSketch(ref["edges"])
+            for name, ref in profile["numeric"].items()
+        }
+        self.categorical: Dict[str, Dict[str, int]] = {
+            name: {} for name in profile["categorical"]
+        }
+
+    def update(self, features: Dict):
+        self.n += 1
+        for name, sketch in self.numeric.items():
+            value = features.get(name)
+            if value is not None:
+                sketch.update(float(value))
+        for name, counts in self.categorical.items():
+            value = features.get(name)
+            if value is None:
+                continue
+            value = str(value)
+            if value not in counts and len(counts) >= MAX_CATEGORIES:
+                value = OTHER_CATEGORY
+            counts[value] = counts.get(value, 0) + 1
+
+
+class DriftMonitor:
+    """
+    Compara features ao vivo com o perfil de referência do modelo
+
+    Mantém duas janelas de `window_size` requisições (atual e anterior);
+    o relatório usa as duas juntas, então reflete as últimas 1-2 janelas.
+    """
+
+    def __init__(self, window_size: int = 5000):
+        self.window_size = window_size
+        self.profile: Optional[Dict] = None
+        self._current: Optional[_Window] = None
+        self._previous: Optional[_Window] = None
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def set_reference(self, profile: Optional[Dict]):
+        """Define perfil de referência (chamado ao carregar o modelo)"""
+        with self._lock:
+            if profile is not None and profile.get("version") != PROFILE_VERSION:
+                raise ValueError(f"Versão de perfil não suportada: {profile.get('version')}")
+            self.profile = profile
+            self._current = _Window(profile) if profile else None
+            self._previous = None
+            self._total = 0
+
+    def observe(self, features: Dict):
+        """
+        Atualiza sketches com as features brutas de uma requisição pontuada
+
+        Args:
+            features: Valores de NUMERIC_FEATURES e CATEGORICAL_FEATURES
+        """
+        if self._current is None:
+            return
+        with self._lock:
+            if self._current is None:
+                return
+            if self._current.n >= self.window_size:
+                self._previous = self._current
+                self._current = _Window(self.profile)
+            self._current.update(features)
+            self._total += 1
+
+    def report(self) -> Dict:
+        """PSI e estatísticas por feature; indica se o retreino é recomendado"""
+        with self._lock:
+            if self.profile is None:
+                return {"reference_loaded": False}
+            windows = [w for w in (self._previous, self._current) if w is not None]
+            n_window = sum(w.n for w in windows)
+
+            numeric = {}
+            for name, ref in self.profile["numeric"].items():
+                sketches = [w.numeric[name] for w in windows]
+                counts = [sum(c) for c in zip(*(s.counts for s in sketches))]
+                value = psi(ref["proportions"], counts)
+                live = self._current.numeric[name]
+                numeric[name] = {
+                    "psi": round(value, 4),
+                    "status": _status(value),
+                    "live_proportions": [
+                        round(c / n_window, 4) for c in counts
+                    ] if n_window else None,
+                    "reference_proportions": [round(p, 4) for p in ref["proportions"]],
+                    "live_mean": round(live.mean, 3) if live.n else None,
+                    "reference_mean": round(ref["mean"], 3),
+                    "live_std": round(math.sqrt(live.m2 / live.n), 3) if live.n else None,
+                    "reference_std": round(ref["std"], 3),
+                    "live_min": live.min if live.n else None,
+                    "live_max": live.max if live.n else None,
+                }
+
+            categorical = {}
+            for name, ref in self.profile["categorical"].items():
+                merged: Dict[str, int] = {}
+                for w in windows:
+                    for category, count in w.categorical[name].items():
+                        merged[category] = merged.get(category, 0) + count
+                categories = sorted(set(ref) | set(merged))
+                value = psi(
+                    [ref.get(c, 0.0) for c in categories],
+                    [merged.get(c, 0) for c in categories],
+                )
+                categorical[name] = {
+                    "psi": round(value, 4),
+                    "status": _status(value),
+                    "unseen_categories": sorted(set(merged) - set(ref)),
+                }
+
+            enough = n_window >= MIN_SAMPLES
+            drifted = [
+                name for name, item in {**numeric, **categorical}.items()
+                if item["status"] == "drift"
+            ]
+            return {
+                "reference_loaded": True,
+                "reference_samples": self.profile["n_samples"],
+                "observed_total": self._total,
+                "observed_window": n_window,
+                "enough_samples": enough,
+                "drifted_features": drifted if enough else [],
+                "retrain_recommended": enough and bool(drifted),
+                "numeric": numeric,
+                "categorical": categorical,
+            }
+
+
+# Instância global do monitor (perfil definido ao carregar o modelo)
+drift_monitor = DriftMonitor(window_size=int(os.getenv("DRIFT_WINDOW_SIZE", "5000")))
@@ -0,0 +1,61 @@
+"""
+Codificação das features categóricas (tipo de câncer, estadiamento)
+
+Usa os LabelEncoders salvos pelo treino (`label_encoders.pkl`), para que a
+API codifique igual ao modelo servido. Sem o arquivo, usa as classes
+conhecidas em ordem alfabética, que é a ordem do LabelEncoder quando o
+dataset contém todas elas.
+"""
+
+import os
+from typing import Dict, List, Optional
+
+import joblib
+
+DEFAULT_CLASSES = {
+    'cancer_type': ['mama', 'pulmao', 'colorectal', 'prostata', 'kidney', 'bladder', 'testicular'],
+    'stage': ['I', 'II', 'III', 'IV'],
+}
+
+
+class CategoryEncoders:
+    """
+    Mapas categoria -> código por feature
+
+    Args:
+        classes: Classes por feature, na ordem dos códigos (padrão: classes
+            conhecidas em ordem alfabética)
+    """
+
+    def __init__(self, classes: Optional[Dict[str, List[str]]] = None):
+        self.source: Optional[str] = None
+        self._set_classes(classes or {
+            feature: sorted(values) for feature, values in DEFAULT_CLASSES.items()
+        })
+
+    def _set_classes(self, classes: Dict[str, List[str]]):
+        self._codes = {
+            feature: {str(value): code for code, value in enumerate(values)}
+            for feature, values in classes.items()
+        }
+
+    def load(self, path: str):
+        """
+        Carrega `label_encoders.pkl` (dict feature -> LabelEncoder)
+
+        Raises:
+            FileNotFoundError: Arquivo não encontrado
+        """
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Encoders não encontrados: {path}")
+        encoders = joblib.load(path)
+        self._set_classes({feature: list(encoder.classes_) for feature, encoder in encoders.items()})
+        self.source = path
+
+    def encode(self, feature: str, value: str) -> int:
+        """Código da categoria; categorias desconhecidas viram 0"""
+        return self._codes[feature].get(value, 0)
+
+
+# Instância global (encoders do treino carregados ao iniciar o serviço)
+category_encoders = CategoryEncoders()
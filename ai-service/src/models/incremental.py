@@ -0,0 +1,335 @@
+"""
+Atualização incremental do modelo de priorização com novos desfechos rotulados
+
+Em vez de retreinar o ensemble inteiro, os membros boosted (XGBoost e
+LightGBM) continuam o boosting a partir do modelo atual: cada atualização
+acrescenta um número fixo de árvores (`trees_per_update`), ajustadas de uma
+vez sobre os dados novos agregados, que corrigem o resíduo do modelo nesses
+dados. A Random Forest é mantida como está. Os dados são lidos em lotes e,
+acima de `max_rows`, uma amostra uniforme limita a memória; o tamanho do
+modelo (e a latência) cresce por atualização, não por lote.
+
+Antes de publicar a nova versão, uma checagem automática compara o MAE do
+modelo base e do atualizado em holdouts (dados novos e a partição de teste
+do treino original, salva ao lado do modelo), além de reportar árvores e latência por linha; se o
+MAE piorar além da tolerância em qualquer holdout, a atualização é rejeitada.
+"""
+
+import copy
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from lightgbm import LGBMRegressor
+from sklearn.metrics import mean_absolute_error
+from sklearn.utils import Bunch
+from xgboost import XGBRegressor
+
+from .artifact import FlatEnsemble
+from .priority_model import PriorityModel
+from .surrogate import LookupTable
+
+RAW_FEATURES = [
+    'cancer_type', 'stage', 'performance_status', 'age',
+    'pain_score', 'nausea_score', 'fatigue_score',
+    'days_since_last_visit', 'treatment_cycle',
+]
+TARGET = 'priority_score'
+
+DEFAULT_CHUNK_ROWS = 5000
+DEFAULT_TREES_PER_UPDATE = 20
+# Linhas novas usadas por atualização (acima disso, amostra uniforme)
+DEFAULT_MAX_UPDATE_ROWS = 200_000
+# Repetições ao medir a latência de uma requisição única
+SINGLE_ROW_REPEATS = 50
+# Uma a cada N linhas novas vai para o holdout quando não há arquivo próprio
+HOLDOUT_EVERY = 10
+MAX_HOLDOUT_ROWS = 20000
+# Amostra da partição de teste do treino salva ao lado do modelo
+MAX_REFERENCE_ROWS = 20000
+
+
+def encode_features(df: pd.DataFrame, encoders: Dict) -> pd.DataFrame:
+    """
+    Aplica os LabelEncoders do treino (mesmas colunas de train_priority_model.py)
+
+    Linhas com categoria desconhecida pelos encoders são descartadas.
+    """
+    X = df[RAW_FEATURES].copy()
+    known = (
+        X['cancer_type'].isin(encoders['cancer_type'].classes_)
+        & X['stage'].isin(encoders['stage'].classes_)
+    )
+    X = X[known]
+    X['cancer_type_encoded'] = encoders['cancer_type'].transform(X['cancer_type'])
+    X['stage_encoded'] = encoders['stage'].transform(X['stage'])
+    return X.drop(['cancer_type', 'stage'], axis=1)
+
+
+def iter_labeled_batches(
+    path: str,
+    encoders: Dict,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+) -> Iterator[Tuple[pd.DataFrame, pd.Series]]:
+    """
+    Lê desfechos rotulados de um CSV em lotes, sem carregar o arquivo inteiro
+
+    Yields:
+        (X codificado, y) por lote
+    """
+    for chunk in pd.read_csv(path, chunksize=chunk_rows):
+        chunk = chunk.dropna(subset=RAW_FEATURES + [TARGET])
+        X = encode_features(chunk, encoders)
+        if len(X):
+            yield X, chunk.loc[X.index, TARGET]
+
+
+def reserve_holdout(
+    batches: Iterable[Tuple[pd.DataFrame, pd.Series]],
+    sink: List[Tuple[pd.DataFrame, pd.Series]],
+    every: int = HOLDOUT_EVERY,
+    max_rows: int = MAX_HOLDOUT_ROWS,
+) -> Iterator[Tuple[pd.DataFrame, pd.Series]]:
+    """
+    Separa 1 a cada `every` linhas do fluxo para `sink` (holdout)
+
+    Os lotes restantes seguem para o treino; o holdout é limitado a `max_rows`.
+    """
+    seen = 0
+    held = 0
+    for X, y in batches:
+        mask = (np.arange(seen, seen + len(X)) % every) == 0
+        mask &= np.cumsum(mask) <= max_rows - held
+        seen += len(X)
+        if mask.any():
+            sink.append((X[mask], y[mask]))
+            held += int(mask.sum())
+        if (~mask).any():
+            yield X[~mask], y[~mask]
+
+
+def reference_holdout_path(model_path: str) -> str:
+    """Caminho do holdout de referência ao lado do .pkl"""
+    return os.path.splitext(model_path)[0] + ".holdout.csv"
+
+
+def save_reference_holdout(
+    X_test: pd.DataFrame,
+    y_test: pd.Series,
+    model_path: str,
+    max_rows: int = MAX_REFERENCE_ROWS,
+):
+    """
+    Salva (amostra limitada da) partição de teste do treino ao lado do modelo
+
+    As atualizações incrementais medem o modelo novo nela, na distribuição
+    em que o base foi treinado, sem reler o dataset de treino.
+    """
+    holdout = X_test.assign(**{TARGET: y_test})
+    if len(holdout) > max_rows:
+        holdout = holdout.sample(max_rows, random_state=0)
+    holdout.to_csv(reference_holdout_path(model_path), index=False)
+
+
+def load_reference_holdout(model_path: str) -> Optional[Tuple[pd.DataFrame, pd.Series]]:
+    """Holdout salvo por `save_reference_holdout` (None se não existir)"""
+    path = reference_holdout_path(model_path)
+    if not os.path.exists(path):
+        return None
+    holdout = pd.read_csv(path)
+    return holdout.drop(columns=[TARGET]), holdout[TARGET]
+
+
+def collect_update_rows(
+    batches: Iterable[Tuple[pd.DataFrame, pd.Series]],
+    max_rows: int = DEFAULT_MAX_UPDATE_ROWS,
+    seed: int = 0,
+) -> Tuple[pd.DataFrame, pd.Series, int]:
+    """
+    Agrega os lotes em um único conjunto de treino
+
+    Acima de `max_rows` linhas, mantém uma amostra uniforme do fluxo inteiro
+    (as `max_rows` menores chaves aleatórias), com memória limitada.
+
+    Returns:
+        (X, y, linhas vistas)
+    """
+    rng = np.random.default_rng(seed)
+    X_parts, y_parts, key_parts = [], [], []
+    kept = 0
+    seen = 0
+
+    def compact():
+        keys = np.concatenate(key_parts)
+        keep = np.sort(np.argpartition(keys, max_rows)[:max_rows])
+        X_parts[:] = [pd.concat(X_parts).iloc[keep]]
+        y_parts[:] = [pd.concat(y_parts).iloc[keep]]
+        key_parts[:] = [keys[keep]]
+
+    for X, y in batches:
+        seen += len(X)
+        X_parts.append(X)
+        y_parts.append(y)
+        key_parts.append(rng.random(len(X)))
+        kept += len(X)
+        # Compacta só ao dobrar o limite (custo amortizado por linha)
+        if kept > 2 * max_rows:
+            compact()
+            kept = max_rows
+    if not X_parts:
+        return pd.DataFrame(), pd.Series(dtype=float), 0
+    if kept > max_rows:
+        compact()
+    return pd.concat(X_parts), pd.concat(y_parts), seen
+
+
+def _boost_xgboost(regressor: XGBRegressor, X, y, n_trees: int) -> XGBRegressor:
+    updated = XGBRegressor(**{**regressor.get_params(), 'n_estimators': n_trees})
+    updated.fit(X, y, xgb_model=regressor.get_booster(), verbose=False)
+    return updated
+
+
+def _boost_lightgbm(regressor: LGBMRegressor, X, y, n_trees: int) -> LGBMRegressor:
+    updated = LGBMRegressor(**{**regressor.get_params(), 'n_estimators': n_trees})
+    updated.fit(X, y, init_model=regressor.booster_)
+    return updated
+
+
+def warm_start(
+    model: PriorityModel,
+    batches: Iterable[Tuple[pd.DataFrame, pd.Series]],
+    trees_per_update: int = DEFAULT_TREES_PER_UPDATE,
+    max_rows: int = DEFAULT_MAX_UPDATE_ROWS,
+) -> Tuple[PriorityModel, Dict]:
+    """
+    Acrescenta árvores aos membros boosted a partir de dados novos
+
+    Args:
+        model: Modelo treinado carregado do .pkl (o artefato plano não guarda
+            os boosters)
+        batches: Lotes (X, y), ex: `iter_labeled_batches`
+        trees_per_update: Árvores novas por membro boosted nesta atualização
+            (independe do número de lotes)
+        max_rows: Linhas novas usadas no ajuste (ver `collect_update_rows`)
+
+    Returns:
+        (novo PriorityModel, estatísticas); `model` não é alterado
+    """
+    if not model.is_trained:
+        raise ValueError("Modelo não foi treinado ainda")
+    if isinstance(model.model, (FlatEnsemble, LookupTable)):
+        raise ValueError("Atualização incremental requer o modelo .pkl")
+
+    ensemble = model.model
+    members = dict(ensemble.named_estimators_)
+    feature_names = list(ensemble.feature_names_in_)
+
+    start = time.perf_counter()
+    X, y, seen = collect_update_rows(batches, max_rows=max_rows)
+    if len(X):
+        X = X[feature_names]
+        members['xgb'] = _boost_xgboost(members['xgb'], X, y, trees_per_update)
+        members['lgbm'] = _boost_lightgbm(members['lgbm'], X, y, trees_per_update)
+
+    # Cópia rasa: a Random Forest é compartilhada, os boosters são novos
+    updated_ensemble = copy.copy(ensemble)
+    updated_ensemble.estimators_ = [members[name] for name, _ in ensemble.estimators]
+    updated_ensemble.named_estimators_ = Bunch(**members)
+
+    updated = PriorityModel(params=model.params)
+    updated.model = updated_ensemble
+    updated.is_trained = True
+
+    return updated, {
+        'rows': seen,
+        'rows_used': int(len(X)),
+        'trees_added_per_member': trees_per_update if len(X) else 0,
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+
+
+def tree_counts(model: PriorityModel) -> Dict[str, int]:
+    """Árvores por membro do ensemble"""
+    members = model.model.named_estimators_
+    return {
+        'rf': len(members['rf'].estimators_),
+        'xgb': int(members['xgb'].get_booster().num_boosted_rounds()),
+        'lgbm': int(members['lgbm'].booster_.num_trees()),
+    }
+
+
+def _timed_predict(model: PriorityModel, X: pd.DataFrame) -> Tuple[np.ndarray, float]:
+    start = time.perf_counter()
+    predictions = model.predict(X)
+    return predictions, time.perf_counter() - start
+
+
+def _single_row_ms(model: PriorityModel, X: pd.DataFrame) -> float:
+    row = X.iloc[:1]
+    model.predict(row)
+    start = time.perf_counter()
+    for _ in range(SINGLE_ROW_REPEATS):
+        model.predict(row)
+    return (time.perf_counter() - start) / SINGLE_ROW_REPEATS * 1000
+
+
+def holdout_check(
+    base: PriorityModel,
+    updated: PriorityModel,
+    holdouts: Dict[str, Tuple[pd.DataFrame, pd.Series]],
+    max_mae_increase: float = 0.05,
+) -> Dict:
+    """
+    Compara MAE, árvores e latência do modelo base e do atualizado
+
+    Args:
+        holdouts: Holdouts por nome, ex: {'new': dados novos, 'reference':
+            `load_reference_holdout`}; a checagem passa só se passar em todos
+        max_mae_increase: Piora relativa máxima aceita (0.05 = 5%)
+
+    Returns:
+        {'passed', 'holdouts': {nome: {'passed', 'base_mae', 'updated_mae',
+        'rows'}}, 'trees': {'base', 'updated'}, 'latency': {'base', 'updated'}}
+        com latência em µs por linha (lote) e ms por requisição única
+    """
+    results = {}
+    seconds = {'base': 0.0, 'updated': 0.0}
+    rows = 0
+    for name, (X_holdout, y_holdout) in holdouts.items():
+        base_pred, base_seconds = _timed_predict(base, X_holdout)
+        updated_pred, updated_seconds = _timed_predict(updated, X_holdout)
+        seconds['base'] += base_seconds
+        seconds['updated'] += updated_seconds
+        rows += len(y_holdout)
+
+        base_mae = mean_absolute_error(y_holdout, base_pred)
+        updated_mae = mean_absolute_error(y_holdout, updated_pred)
+        results[name] = {
+            'passed': bool(updated_mae <= base_mae * (1 + max_mae_increase)),
+            'base_mae': round(float(base_mae), 4),
+            'updated_mae': round(float(updated_mae), 4),
+            'rows': int(len(y_holdout)),
+        }
+
+    sample = next(iter(holdouts.values()))[0]
+    latency = {
+        name: {
+            'batch_us_per_row': round(seconds[name] / max(rows, 1) * 1e6, 2),
+            'single_row_ms': round(_single_row_ms(model, sample), 3),
+        }
+        for name, model in (('base', base), ('updated', updated))
+    }
+    return {
+        'passed': all(result['passed'] for result in results.values()),
+        'holdouts': results,
+        'trees': {'base': tree_counts(base), 'updated': tree_counts(updated)},
+        'latency': latency,
+    }
+
+
+def new_version(now: Optional[datetime] = None) -> str:
+    """Versão ordenável lexicograficamente (ver `ModelRegistry`)"""
+    return (now or datetime.now(timezone.utc)).strftime("%Y%m%dT%H%M%S")
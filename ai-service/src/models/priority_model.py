@@ -11,37 +11,45 @@ from lightgbm import LGBMRegressor
 import joblib
 import os
 
+from .artifact import FlatEnsemble, export_flat_artifact, is_flat_artifact
+from .surrogate import LookupTable, is_lookup_table
+
 
 class PriorityModel:
     """
     Modelo ensemble para calcular score de prioridade (0-100)
     """
     
-    def __init__(self):
+    # Hiperparâmetros padrão por membro do ensemble
+    DEFAULT_PARAMS = {
+        'rf': {'n_estimators': 100, 'max_depth': 10},
+        'xgb': {'n_estimators': 100, 'max_depth': 6},
+        'lgbm': {'n_estimators': 100, 'max_depth': 6},
+    }
+    WEIGHTS = [0.3, 0.4, 0.3]
+    
+    def __init__(self, params: Optional[Dict[str, Dict]] = None):
+        """
+        Args:
+            params: Hiperparâmetros por membro ('rf', 'xgb', 'lgbm'), ex: saída
+                de `tuning.tune_ensemble`; membros ausentes usam DEFAULT_PARAMS
+        """
+        self.params = {
+            name: {**defaults, **(params or {}).get(name, {})}
+            for name, defaults in self.DEFAULT_PARAMS.items()
+        }
         self.model = None
         self.is_trained = False
         
     def _create_ensemble(self):
         """Cria modelo ensemble"""
-        rf = RandomForestRegressor(
-            n_estimators=100,
-            max_depth=10,
-            random_state=42
-        )
-        xgb = XGBRegressor(
-            n_estimators=100,
-            max_depth=6,
-            random_state=42
-        )
-        lgbm = LGBMRegressor(
-            n_estimators=100,
-            max_depth=6,
-            random_state=42
-        )
+        rf = RandomForestRegressor(random_state=42, **self.params['rf'])
+        xgb = XGBRegressor(random_state=42, **self.params['xgb'])
+        lgbm = LGBMRegressor(random_state=42, **self.params['lgbm'])
         
         self.model = VotingRegressor(
             estimators=[('rf', rf), ('xgb', xgb), ('lgbm', lgbm)],
-            weights=[0.3, 0.4, 0.3]
+            weights=self.WEIGHTS
         )
     
     def train(self, X: pd.DataFrame, y: pd.Series):
@@ -63,7 +71,7 @@ class PriorityModel:
         Prediz score de prioridade
         
         Args:
-            X: Features (DataFrame)
+            X: Features (DataFrame, colunas em qualquer ordem)
             
         Returns:
             Array de scores (0-100)
@@ -71,6 +79,11 @@ class PriorityModel:
         if not self.is_trained:
             raise ValueError("Modelo não foi treinado ainda")
         
+        # Mesma ordem de colunas do treino (o .pkl valida os nomes na ordem)
+        feature_names = getattr(self.model, 'feature_names_in_', None)
+        if feature_names is not None and isinstance(X, pd.DataFrame):
+            X = X[list(feature_names)]
+        
         predictions = self.model.predict(X)
         # Garantir que scores estão entre 0-100
         predictions = np.clip(predictions, 0, 100)
@@ -102,12 +115,39 @@ class PriorityModel:
         
         joblib.dump(self.model, filepath)
     
-    def load(self, filepath: str):
-        """Carrega modelo treinado"""
+    def save_flat(self, directory: str):
+        """
+        Salva modelo no layout plano mapeável em memória (ver `artifact.py`)
+        
+        Args:
+            directory: Diretório de destino do artefato
+        """
+        if not self.is_trained:
+            raise ValueError("Modelo não foi treinado ainda")
+        if isinstance(self.model, (FlatEnsemble, LookupTable)):
+            raise ValueError("Modelo já está no formato plano")
+        
+        export_flat_artifact(self.model, directory)
+    
+    def load(self, filepath: str, mmap_mode: Optional[str] = "r"):
+        """
+        Carrega modelo treinado
+        
+        Args:
+            filepath: Arquivo .pkl (joblib), diretório de artefato plano ou
+                de tabela de lookup (ver `surrogate.py`)
+            mmap_mode: Para artefato plano ou tabela, 'r' compartilha os
+                arrays entre workers via page cache; None carrega cópia privada
+        """
         if not os.path.exists(filepath):
             raise FileNotFoundError(f"Modelo não encontrado: {filepath}")
         
-        self.model = joblib.load(filepath)
+        if is_flat_artifact(filepath):
+            self.model = FlatEnsemble.load(filepath, mmap_mode=mmap_mode)
+        elif is_lookup_table(filepath):
+            self.model = LookupTable.load(filepath, mmap_mode=mmap_mode)
+        else:
+            self.model = joblib.load(filepath)
         self.is_trained = True
 
 
@@ -0,0 +1,150 @@
+"""
+Regras de negócio de priorização (tabela declarativa única)
+
+As regras ficam em `priority_rules.json` e valem para os dois usos:
+- fallback de `/prioritize` quando não há modelo treinado
+- rótulos do dataset sintético (scripts/generate_synthetic_data.py)
+
+Cada regra soma `points` quando `feature <op> value`; o total é limitado a
+`max_score` e categorizado pelas faixas de `categories`. A tabela é compilada
+uma vez em operações NumPy por coluna, então o mesmo avaliador atende uma
+requisição, um lote ou milhões de linhas, sem laço Python por linha.
+"""
+
+import json
+import operator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional
+
+import numpy as np
+
+DEFAULT_RULES_PATH = Path(__file__).parent / "priority_rules.json"
+
+OPERATORS = {
+    '>=': operator.ge,
+    '>': operator.gt,
+    '<=': operator.le,
+    '<': operator.lt,
+    '==': operator.eq,
+    '!=': operator.ne,
+    'in': np.isin,
+}
+
+
+@dataclass(frozen=True)
+class Rule:
+    feature: str
+    op: str
+    value: Any
+    points: float
+    # Texto exibido na razão da prioridade (regras sem texto não aparecem)
+    reason: Optional[str] = None
+
+
+class PriorityRules:
+    """
+    Avaliador vetorizado da tabela de regras
+
+    Args:
+        rules: Regras na ordem da tabela
+        max_score: Limite superior do score
+        categories: Faixas (min_score, categoria), da maior para a menor
+        default_category: Categoria abaixo de todas as faixas
+
+    Raises:
+        ValueError: Operador desconhecido
+    """
+
+    def __init__(
+        self,
+        rules: List[Rule],
+        max_score: float = 100,
+        categories: Optional[List[tuple]] = None,
+        default_category: str = 'baixo',
+    ):
+        for rule in rules:
+            if rule.op not in OPERATORS:
+                raise ValueError(f"Operador desconhecido na regra de {rule.feature}: {rule.op}")
+        self.rules = rules
+        self.max_score = max_score
+        self.categories = sorted(categories or [], key=lambda band: band[0], reverse=True)
+        self.default_category = default_category
+        self.features = sorted({rule.feature for rule in rules})
+        # Pontos inteiros mantêm o score inteiro (como no dataset original)
+        self._dtype = np.result_type(*[np.asarray(rule.points).dtype for rule in rules])
+        self._compiled = [
+            (rule.feature, OPERATORS[rule.op], rule.value, rule.points) for rule in rules
+        ]
+
+    @classmethod
+    def from_dict(cls, table: Dict) -> "PriorityRules":
+        return cls(
+            rules=[Rule(**rule) for rule in table['rules']],
+            max_score=table.get('max_score', 100),
+            categories=[(band['min_score'], band['category']) for band in table.get('categories', [])],
+            default_category=table.get('default_category', 'baixo'),
+        )
+
+    @classmethod
+    def from_file(cls, path=DEFAULT_RULES_PATH) -> "PriorityRules":
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+    def _columns(self, data: Mapping) -> Dict[str, np.ndarray]:
+        return {feature: np.asarray(data[feature]) for feature in self.features}
+
+    def matches(self, data: Mapping) -> np.ndarray:
+        """
+        Regras satisfeitas por linha
+
+        Args:
+            data: DataFrame ou dict de colunas com as features das regras
+
+        Returns:
+            Matriz booleana (linhas, regras)
+        """
+        columns = self._columns(data)
+        return np.column_stack([
+            np.asarray(compare(columns[feature], value), dtype=bool)
+            for feature, compare, value, _ in self._compiled
+        ])
+
+    def score(self, data: Mapping) -> np.ndarray:
+        """
+        Score de prioridade por linha (0 a `max_score`)
+
+        Args:
+            data: DataFrame ou dict de colunas com as features das regras
+        """
+        columns = self._columns(data)
+        n_rows = len(next(iter(columns.values())))
+        scores = np.zeros(n_rows, dtype=self._dtype)
+        for feature, compare, value, points in self._compiled:
+            np.add(scores, points, out=scores, where=compare(columns[feature], value))
+        return np.minimum(scores, self.max_score, out=scores)
+
+    def categorize(self, scores: np.ndarray) -> np.ndarray:
+        """Categoria por score, pelas faixas da tabela"""
+        scores = np.asarray(scores)
+        return np.select(
+            [scores >= min_score for min_score, _ in self.categories],
+            [category for _, category in self.categories],
+            default=self.default_category,
+        )
+
+    def score_one(self, row: Mapping) -> float:
+        """Score de uma linha (dict de valores escalares)"""
+        return float(self.score({feature: [row[feature]] for feature in self.features})[0])
+
+    def reasons(self, row: Mapping) -> List[str]:
+        """Razões das regras satisfeitas por uma linha, na ordem da tabela"""
+        matched = self.matches({feature: [row[feature]] for feature in self.features})[0]
+        return [
+            rule.reason for rule, hit in zip(self.rules, matched)
+            if hit and rule.reason
+        ]
+
+
+# Tabela padrão (priority_rules.json)
+priority_rules = PriorityRules.from_file()
@@ -0,0 +1,345 @@
+"""
+Registro multi-tenant de modelos de priorização com despejo LRU
+
+Cada tenant (hospital/centro oncológico) pode ter modelos calibrados próprios,
+organizados em disco como:
+
+    {MODEL_REGISTRY_DIR}/{tenant_id}/{versão}/   (artefato plano, ver artifact.py)
+    {MODEL_REGISTRY_DIR}/{tenant_id}/{versão}.pkl
+
+Os modelos são carregados sob demanda no primeiro uso e despejados do menos
+recentemente usado para o mais recente quando a soma dos tamanhos passa do
+orçamento de memória. Tenants sem modelo próprio usam o modelo global.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from .priority_model import PriorityModel, priority_model
+
+logger = logging.getLogger(__name__)
+
+# Letras, dígitos, "_", "-" e "."; nomes só de pontos ("." e "..") não
+_SAFE_NAME = re.compile(r"^(?!\.+$)[A-Za-z0-9_.-]+$")
+
+# Por quanto tempo a resolução (tenant, versão) -> caminho fica em cache,
+# evitando listar o diretório do tenant a cada requisição
+RESOLVE_TTL_SECONDS = 60.0
+# Resoluções em cache no máximo (tenant/versão vêm do cliente)
+RESOLVE_CACHE_SIZE = 4096
+
+
+class InvalidModelIdentifier(ValueError):
+    """tenant_id ou versão com caracteres não permitidos"""
+
+
+@dataclass
+class _ResidentModel:
+    model: PriorityModel
+    path: str
+    size_bytes: int
+    load_seconds: float
+    loaded_at: float
+    last_used: float
+    hits: int = 0
+
+
+@dataclass
+class _TenantStats:
+    loads: int = 0
+    total_load_seconds: float = 0.0
+    last_load_seconds: float = 0.0
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    versions: List[str] = field(default_factory=list)
+
+
+def _path_size(path: str) -> int:
+    """Tamanho em disco do artefato (arquivo ou diretório)"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for entry in os.scandir(path):
+        if entry.is_file():
+            total += entry.stat().st_size
+    return total
+
+
+class ModelRegistry:
+    """
+    Cache LRU de modelos por (tenant, versão) com orçamento de memória
+    """
+
+    def __init__(
+        self,
+        root_dir: str,
+        memory_budget_bytes: int,
+        fallback: Optional[PriorityModel] = None,
+    ):
+        self.root_dir = root_dir
+        self.memory_budget_bytes = memory_budget_bytes
+        self.fallback = fallback
+        self._models: "OrderedDict[Tuple[str, str], _ResidentModel]" = OrderedDict()
+        self._stats: Dict[str, _TenantStats] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._resolved: "OrderedDict[Tuple[str, Optional[str]], Tuple[float, Optional[Tuple[str, str]]]]" = OrderedDict()
+        # Requisições sem modelo próprio (contador único: tenants sem modelo
+        # não ganham entrada em _stats)
+        self._fallbacks = 0
+
+    def _tenant_stats(self, tenant_id: str) -> _TenantStats:
+        if tenant_id not in self._stats:
+            self._stats[tenant_id] = _TenantStats()
+        return self._stats[tenant_id]
+
+    def _cached_resolution(self, tenant_id: str, version: Optional[str]):
+        """
+        Resolução em cache e ainda válida: ((versão, caminho) ou None,) ou
+        None se precisa consultar o disco
+
+        Raises:
+            InvalidModelIdentifier: tenant_id ou versão inválidos
+        """
+        for name in (tenant_id, version):
+            if name is not None and not _SAFE_NAME.match(name):
+                raise InvalidModelIdentifier(f"Identificador inválido: {name}")
+
+        with self._lock:
+            cached = self._resolved.get((tenant_id, version))
+        if cached is not None and cached[0] > time.monotonic():
+            return (cached[1],)
+        return None
+
+    def _resolve(self, tenant_id: str, version: Optional[str]) -> Optional[Tuple[str, str]]:
+        """
+        Localiza artefato do tenant em disco (com cache de RESOLVE_TTL_SECONDS)
+
+        Returns:
+            (versão, caminho) ou None se o tenant não tem modelo próprio
+        """
+        cached = self._cached_resolution(tenant_id, version)
+        if cached is not None:
+            return cached[0]
+
+        resolved = self._resolve_on_disk(tenant_id, version)
+        with self._lock:
+            key = (tenant_id, version)
+            self._resolved[key] = (time.monotonic() + RESOLVE_TTL_SECONDS, resolved)
+            self._resolved.move_to_end(key)
+            while len(self._resolved) > RESOLVE_CACHE_SIZE:
+                self._resolved.popitem(last=False)
+        return resolved
+
+    def _resolve_on_disk(self, tenant_id: str, version: Optional[str]) -> Optional[Tuple[str, str]]:
+        tenant_dir = os.path.join(self.root_dir, tenant_id)
+        if not os.path.isdir(tenant_dir):
+            return None
+
+        if version is None:
+            # Sem versão explícita: a maior versão em ordem lexicográfica
+            versions = sorted(
+                entry.name[:-4] if entry.name.endswith(".pkl") else entry.name
+                for entry in os.scandir(tenant_dir)
+                if entry.is_dir() or entry.name.endswith(".pkl")
+            )
+            if not versions:
+                return None
+            version = versions[-1]
+
+        for candidate in (
+            os.path.join(tenant_dir, version),
+            os.path.join(tenant_dir, f"{version}.pkl"),
+        ):
+            if os.path.exists(candidate):
+                return version, candidate
+        return None
+
+    def get_resident(self, tenant_id: Optional[str], version: Optional[str] = None) -> Optional[PriorityModel]:
+        """
+        Retorna o modelo sem acessar o disco, se já resolvido e carregado
+
+        Para uso no event loop: None indica que é preciso chamar `get` fora
+        dele (ex: `run_in_threadpool`), pois haverá leitura de disco.
+
+        Raises:
+            InvalidModelIdentifier: tenant_id ou versão inválidos
+        """
+        if tenant_id is None:
+            return self.fallback
+
+        cached = self._cached_resolution(tenant_id, version)
+        if cached is None:
+            return None
+        if cached[0] is None:
+            with self._lock:
+                self._fallbacks += 1
+            return self.fallback
+
+        with self._lock:
+            resident = self._touch((tenant_id, cached[0][0]))
+        return resident.model if resident is not None else None
+
+    def get(self, tenant_id: Optional[str], version: Optional[str] = None) -> PriorityModel:
+        """
+        Retorna modelo do tenant, carregando sob demanda (pode ler o disco)
+
+        Args:
+            tenant_id: ID do tenant (None usa o modelo global)
+            version: Versão do modelo (None = mais recente)
+
+        Returns:
+            Modelo do tenant ou modelo global de fallback
+
+        Raises:
+            InvalidModelIdentifier: tenant_id ou versão inválidos
+        """
+        if tenant_id is None:
+            return self.fallback
+
+        resolved = self._resolve(tenant_id, version)
+        if resolved is None:
+            with self._lock:
+                self._fallbacks += 1
+            return self.fallback
+
+        version, path = resolved
+        key = (tenant_id, version)
+
+        with self._lock:
+            resident = self._touch(key)
+            if resident is not None:
+                return resident.model
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Lock por chave: requisições concorrentes não carregam em duplicidade
+        with load_lock:
+            with self._lock:
+                resident = self._touch(key)
+                if resident is not None:
+                    return resident.model
+
+            start = time.perf_counter()
+            model = PriorityModel()
+            model.load(path)
+            load_seconds = time.perf_counter() - start
+
+            with self._lock:
+                now = time.time()
+                self._models[key] = _ResidentModel(
+                    model=model,
+                    path=path,
+                    size_bytes=_path_size(path),
+                    load_seconds=load_seconds,
+                    loaded_at=now,
+                    last_used=now,
+                    hits=1,
+                )
+                stats = self._tenant_stats(tenant_id)
+                stats.misses += 1
+                stats.loads += 1
+                stats.total_load_seconds += load_seconds
+                stats.last_load_seconds = load_seconds
+                if version not in stats.versions:
+                    stats.versions.append(version)
+                self._load_locks.pop(key, None)
+                self._evict(keep=key)
+
+        logger.info(
+            f"Modelo carregado: tenant={tenant_id} versão={version} "
+            f"({load_seconds * 1000:.1f} ms)"
+        )
+        return model
+
+    def _touch(self, key: Tuple[str, str]) -> Optional[_ResidentModel]:
+        """Marca uso de modelo residente (chamar com _lock)"""
+        resident = self._models.get(key)
+        if resident is None:
+            return None
+        self._models.move_to_end(key)
+        resident.last_used = time.time()
+        resident.hits += 1
+        self._tenant_stats(key[0]).hits += 1
+        return resident
+
+    def _evict(self, keep: Tuple[str, str]):
+        """Despeja LRU até caber no orçamento (chamar com _lock)"""
+        while self.resident_bytes() > self.memory_budget_bytes and len(self._models) > 1:
+            key = next(iter(self._models))
+            if key == keep:
+                break
+            evicted = self._models.pop(key)
+            self._tenant_stats(key[0]).evictions += 1
+            logger.info(
+                f"Modelo despejado: tenant={key[0]} versão={key[1]} "
+                f"({evicted.size_bytes / 1024 / 1024:.1f} MB)"
+            )
+
+    def resident_bytes(self) -> int:
+        return sum(resident.size_bytes for resident in self._models.values())
+
+    def preload(self, tenant_ids: List[str]):
+        """
+        Carrega modelos dos tenants mais usados na inicialização
+
+        Args:
+            tenant_ids: Tenants em ordem decrescente de tráfego
+        """
+        # Carregar do menos quente para o mais quente: os mais quentes ficam
+        # no fim da fila LRU e são os últimos a serem despejados
+        for tenant_id in reversed(tenant_ids):
+            try:
+                self.get(tenant_id)
+            except Exception as e:
+                logger.error(f"Erro ao pré-carregar modelo do tenant {tenant_id}: {e}")
+
+    def stats(self) -> Dict:
+        """Residência do cache e latência de carga por tenant"""
+        with self._lock:
+            resident = [
+                {
+                    "tenant_id": tenant_id,
+                    "version": version,
+                    "size_bytes": model.size_bytes,
+                    "load_ms": round(model.load_seconds * 1000, 2),
+                    "hits": model.hits,
+                    "idle_seconds": round(time.time() - model.last_used, 1),
+                }
+                for (tenant_id, version), model in reversed(self._models.items())
+            ]
+            tenants = {
+                tenant_id: {
+                    "loads": stats.loads,
+                    "avg_load_ms": round(
+                        stats.total_load_seconds / stats.loads * 1000, 2
+                    ) if stats.loads else None,
+                    "last_load_ms": round(stats.last_load_seconds * 1000, 2),
+                    "hits": stats.hits,
+                    "misses": stats.misses,
+                    "evictions": stats.evictions,
+                    "versions": list(stats.versions),
+                }
+                for tenant_id, stats in self._stats.items()
+            }
+            return {
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "resident_bytes": self.resident_bytes(),
+                "resident_models": resident,
+                "fallbacks": self._fallbacks,
+                "tenants": tenants,
+            }
+
+
+# Instância global do registro
+model_registry = ModelRegistry(
+    root_dir=os.getenv("MODEL_REGISTRY_DIR", "models/tenants"),
+    memory_budget_bytes=int(os.getenv("MODEL_REGISTRY_MEMORY_MB", "512")) * 1024 * 1024,
+    fallback=priority_model,
+)
@@ -0,0 +1,280 @@
+"""
+Avaliação em modo sombra de um modelo candidato de priorização
+
+O candidato é carregado ao lado do `priority_model` e pontua as mesmas
+features do tráfego real, fora do caminho da resposta: `/prioritize` só
+enfileira (features, score ao vivo) em uma fila limitada, sem bloquear; se a
+fila estiver cheia, a amostra é descartada e contada.
+
+Uma thread de fundo consome a fila em lotes (esperando até `linger_seconds`
+para completar o lote) e os envia a um processo filho dedicado, que carrega
+o candidato e devolve os scores. A predição roda fora do processo do
+serviço, então não disputa o GIL com o event loop; a thread só espera o
+resultado e acumula, em memória constante:
+
+- Divergência de score: histograma de |candidato - ao vivo| em faixas fixas
+  + média/variância de Welford da diferença com sinal
+- Confusão de categoria: contagens (categoria ao vivo, categoria candidata)
+"""
+
+import logging
+import math
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from .priority_model import PriorityModel, priority_model
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ['critico', 'alto', 'medio', 'baixo']
+# Limites superiores das faixas de |diferença| de score (última: > 50)
+DIFF_BUCKETS = [0.5, 1, 2, 5, 10, 20, 50]
+
+# Prioridade reduzida do processo filho: em CPU disputada, cede ao serviço
+CHILD_NICENESS = 10
+
+_STOP = object()
+
+# Candidato carregado no processo filho
+_candidate: Optional[PriorityModel] = None
+
+
+def _load_candidate(model_path: str):
+    global _candidate
+    os.nice(CHILD_NICENESS)
+    _candidate = PriorityModel()
+    _candidate.load(model_path)
+
+
+def _ready() -> bool:
+    return _candidate is not None
+
+
+def _predict_batch(rows: List[Dict]) -> List[float]:
+    return _candidate.predict(pd.DataFrame(rows)).tolist()
+
+
+def _bucket_labels() -> List[str]:
+    labels = []
+    lower = 0
+    for upper in DIFF_BUCKETS:
+        labels.append(f"{lower}-{upper}")
+        lower = upper
+    labels.append(f">{lower}")
+    return labels
+
+
+class ShadowEvaluator:
+    """
+    Pontua o tráfego de `/prioritize` com um modelo candidato em background
+
+    Args:
+        queue_size: Amostras pendentes no máximo; excedentes são descartadas
+        batch_size: Amostras pontuadas por chamada ao candidato
+        linger_seconds: Espera máxima para completar um lote
+    """
+
+    def __init__(self, queue_size: int = 1000, batch_size: int = 64, linger_seconds: float = 0.5):
+        self.batch_size = batch_size
+        self.linger_seconds = linger_seconds
+        self.candidate: Optional[str] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.submitted = 0
+        self.dropped = 0
+        self.scored = 0
+        self.errors = 0
+        self.batches = 0
+        self.score_seconds = 0.0
+        self.load_error: Optional[str] = None
+        self._diff_counts = [0] * (len(DIFF_BUCKETS) + 1)
+        self._diff_mean = 0.0
+        self._diff_m2 = 0.0
+        self._diff_max = 0.0
+        self._confusion: Dict[tuple, int] = {}
+
+    def set_candidate(self, model_path: Optional[str]):
+        """
+        Carrega o candidato no processo filho (ou desativa, com None)
+
+        Args:
+            model_path: Artefato do candidato (diretório plano ou .pkl)
+
+        Raises:
+            FileNotFoundError: Artefato não encontrado
+        """
+        if model_path is not None and not os.path.exists(model_path):
+            raise FileNotFoundError(f"Modelo não encontrado: {model_path}")
+        self.stop()
+        with self._lock:
+            self.candidate = model_path
+            self._reset_stats()
+        if model_path is None:
+            return
+
+        # spawn: o filho não herda o estado (threads, event loop) do serviço
+        self._executor = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=mp.get_context("spawn"),
+            initializer=_load_candidate,
+            initargs=(model_path,),
+        )
+        self._thread = threading.Thread(
+            target=self._run, args=(self._executor,), name="shadow-evaluator", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Encerra thread e processo filho (amostras pendentes são descartadas)"""
+        if self._thread is None:
+            return
+        while True:
+            try:
+                self._queue.put_nowait(_STOP)
+                break
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+        self._thread.join(timeout)
+        self._thread = None
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        # Descarta o que sobrou para não misturar com o próximo candidato
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+    def submit(self, features: Dict, live_score: float) -> bool:
+        """
+        Enfileira amostra para o candidato, sem bloquear
+
+        Args:
+            features: Linha de features codificadas (mesmas colunas do modelo)
+            live_score: Score devolvido pelo modelo ao vivo
+
+        Returns:
+            False se não há candidato ou a fila está cheia (amostra descartada)
+        """
+        if self.candidate is None:
+            return False
+        self.submitted += 1
+        try:
+            self._queue.put_nowait((features, live_score))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def _run(self, executor: ProcessPoolExecutor):
+        # Espera o filho carregar o candidato (a carga não entra nas métricas)
+        try:
+            executor.submit(_ready).result()
+        except Exception as e:
+            self.load_error = str(e)
+            logger.warning(f"Falha ao carregar modelo sombra: {e}")
+            return
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.linger_seconds
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    return
+                batch.append(item)
+            self._score(executor, batch)
+
+    def _score(self, executor: ProcessPoolExecutor, batch: List[tuple]):
+        start = time.perf_counter()
+        try:
+            scores = executor.submit(_predict_batch, [features for features, _ in batch]).result()
+        except Exception as e:
+            with self._lock:
+                self.errors += len(batch)
+            logger.warning(f"Falha ao pontuar lote no modelo sombra: {e}")
+            return
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self.batches += 1
+            self.score_seconds += elapsed
+            for (_, live_score), shadow_score in zip(batch, scores):
+                shadow_score = float(shadow_score)
+                diff = shadow_score - live_score
+                self.scored += 1
+                delta = diff - self._diff_mean
+                self._diff_mean += delta / self.scored
+                self._diff_m2 += delta * (diff - self._diff_mean)
+                self._diff_max = max(self._diff_max, abs(diff))
+                self._diff_counts[bisect_right(DIFF_BUCKETS, abs(diff))] += 1
+                key = (
+                    priority_model.categorize_priority(live_score),
+                    priority_model.categorize_priority(shadow_score),
+                )
+                self._confusion[key] = self._confusion.get(key, 0) + 1
+
+    def report(self) -> Dict:
+        """Divergência de score e confusão de categoria candidato x ao vivo"""
+        with self._lock:
+            if self.candidate is None:
+                return {"candidate_loaded": False}
+            n = self.scored
+            agree = sum(
+                count for (live, shadow), count in self._confusion.items() if live == shadow
+            )
+            return {
+                "candidate_loaded": True,
+                "candidate": self.candidate,
+                "submitted": self.submitted,
+                "dropped": self.dropped,
+                "scored": n,
+                "errors": self.errors,
+                "load_error": self.load_error,
+                "queue_depth": self._queue.qsize(),
+                "mean_batch_ms": round(self.score_seconds / self.batches * 1000, 3)
+                if self.batches else None,
+                "score_diff": {
+                    "mean": round(self._diff_mean, 3) if n else None,
+                    "std": round(math.sqrt(self._diff_m2 / n), 3) if n else None,
+                    "max_abs": round(self._diff_max, 3) if n else None,
+                    "abs_histogram": dict(zip(_bucket_labels(), self._diff_counts)),
+                },
+                "category_agreement": round(agree / n, 4) if n else None,
+                "category_confusion": {
+                    live: {
+                        shadow: self._confusion.get((live, shadow), 0)
+                        for shadow in CATEGORIES
+                    }
+                    for live in CATEGORIES
+                },
+            }
+
+
+# Instância global (candidato definido ao iniciar o serviço, se configurado)
+shadow_evaluator = ShadowEvaluator(
+    queue_size=int(os.getenv("SHADOW_QUEUE_SIZE", "1000")),
+    batch_size=int(os.getenv("SHADOW_BATCH_SIZE", "64")),
+    linger_seconds=float(os.getenv("SHADOW_LINGER_SECONDS", "0.5")),
+)
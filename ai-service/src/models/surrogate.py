@@ -0,0 +1,417 @@
+"""
+Destilação do ensemble de priorização em um substituto (surrogate) barato
+
+As entradas do modelo são quase todas inteiros pequenos e categorias, então
+o ensemble (centenas de árvores) pode ser aproximado por:
+
+- Tabela de lookup: o ensemble é avaliado uma vez em uma grade densa de
+  features discretizadas (valores exatos quando cabem, senão faixas de
+  quantil); servir é uma busca binária por feature + um índice no array.
+  O orçamento de células é distribuído pela importância das features: as
+  menos importantes perdem níveis primeiro.
+- Boosting raso: um único LightGBM de baixa profundidade treinado nas
+  predições do próprio ensemble (dados de treino + amostras sintéticas das
+  marginais), exportado no layout plano de `artifact.py`.
+
+`distill` gera os dois, mede fidelidade ao ensemble, precisão, latência e
+memória, e salva o mais rápido que respeita a tolerância de erro e a
+concordância mínima de categoria com o ensemble. O relatório guarda a
+impressão digital (`model_fingerprint`) do ensemble de origem, para que o
+serviço não sirva o substituto de um modelo antigo após retreino/atualização.
+"""
+
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+from typing import Dict, Optional, Sequence, Tuple
+
+import joblib
+import numpy as np
+import pandas as pd
+from lightgbm import LGBMRegressor
+from sklearn.metrics import mean_absolute_error
+
+from .artifact import (
+    ARRAY_NAMES,
+    MANIFEST_FILE,
+    FlatEnsemble,
+    export_flat_artifact,
+    export_flat_members,
+)
+
+TABLE_FORMAT_VERSION = 1
+TABLE_MANIFEST_FILE = "lookup_table.json"
+TABLE_FILE = "table.npy"
+REPORT_FILE = "distillation.json"
+
+DEFAULT_MAX_CELLS = 2_000_000
+# Fração mínima de amostras com a mesma categoria do ensemble: um MAE médio
+# baixo ainda pode esconder trocas de categoria perto dos limites
+DEFAULT_MIN_AGREEMENT = 0.98
+# Níveis máximos por feature antes de discretizar em faixas de quantil
+MAX_EXACT_LEVELS = 16
+GRID_CHUNK_ROWS = 200_000
+
+SHALLOW_PARAMS = {
+    'n_estimators': 200,
+    'max_depth': 4,
+    'num_leaves': 15,
+    'learning_rate': 0.1,
+}
+SYNTHETIC_SAMPLES = 50_000
+
+
+class LookupTable:
+    """
+    Score pré-computado em uma grade de features discretizadas
+
+    Cada feature tem bordas (`x <= borda` vai para o nível de baixo) e o
+    score de cada célula é a predição do ensemble no centro da célula.
+    """
+
+    def __init__(self, manifest: Dict, table: np.ndarray):
+        if manifest.get("format_version") != TABLE_FORMAT_VERSION:
+            raise ValueError(
+                f"Versão de tabela não suportada: {manifest.get('format_version')}"
+            )
+        self.feature_names_in_ = np.asarray(manifest["feature_names"], dtype=object)
+        self.edges = [np.asarray(edges, dtype=np.float64) for edges in manifest["edges"]]
+        self.table = table
+
+    @classmethod
+    def load(cls, directory: str, mmap_mode: Optional[str] = "r") -> "LookupTable":
+        with open(os.path.join(directory, TABLE_MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+        table = np.load(os.path.join(directory, TABLE_FILE), mmap_mode=mmap_mode)
+        return cls(manifest, table)
+
+    def save(self, directory: str, extra: Optional[Dict] = None):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, TABLE_FILE), np.asarray(self.table))
+        manifest = {
+            "format_version": TABLE_FORMAT_VERSION,
+            "feature_names": [str(name) for name in self.feature_names_in_],
+            "edges": [edges.tolist() for edges in self.edges],
+            "shape": list(self.table.shape),
+            **(extra or {}),
+        }
+        with open(os.path.join(directory, TABLE_MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+    def predict(self, X) -> np.ndarray:
+        if isinstance(X, pd.DataFrame):
+            X = X[list(self.feature_names_in_)]
+        matrix = np.asarray(X, dtype=np.float64)
+        index = tuple(
+            np.searchsorted(edges, matrix[:, i], side="left")
+            for i, edges in enumerate(self.edges)
+        )
+        return np.asarray(self.table[index], dtype=np.float64)
+
+    def nbytes(self) -> int:
+        return int(self.table.nbytes + sum(edges.nbytes for edges in self.edges))
+
+
+def is_lookup_table(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, TABLE_MANIFEST_FILE))
+
+
+def _levels(values: np.ndarray, n_levels: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Discretiza uma feature em até `n_levels` níveis
+
+    Returns:
+        (bordas, centros): valor exato por nível se couber, senão faixas de
+        quantil com a mediana como centro
+    """
+    uniques = np.unique(values)
+    if len(uniques) <= n_levels:
+        return (uniques[:-1] + uniques[1:]) / 2, uniques.astype(np.float64)
+
+    quantiles = np.quantile(values, np.linspace(0, 1, n_levels + 1)[1:-1])
+    edges = np.unique(quantiles)
+    bins = np.searchsorted(edges, values, side="left")
+    # Bordas interpoladas podem deixar faixas vazias: junta com a vizinha
+    counts = np.bincount(bins, minlength=len(edges) + 1)
+    while len(edges) and (counts == 0).any():
+        empty = int(np.flatnonzero(counts == 0)[0])
+        edges = np.delete(edges, min(empty, len(edges) - 1))
+        bins = np.searchsorted(edges, values, side="left")
+        counts = np.bincount(bins, minlength=len(edges) + 1)
+    centers = np.array([np.median(values[bins == b]) for b in range(len(edges) + 1)])
+    return edges, centers
+
+
+def _feature_importances(ensemble, n_features: int) -> np.ndarray:
+    """Importância média normalizada dos membros do ensemble"""
+    importances = np.zeros(n_features)
+    estimators = getattr(ensemble, "estimators_", [ensemble])
+    for estimator in estimators:
+        values = np.asarray(getattr(estimator, "feature_importances_", np.ones(n_features)), dtype=float)
+        if values.sum() > 0:
+            importances += values / values.sum()
+    return importances / max(importances.sum(), 1e-12)
+
+
+def build_lookup_table(
+    ensemble,
+    X: pd.DataFrame,
+    max_cells: int = DEFAULT_MAX_CELLS,
+) -> LookupTable:
+    """
+    Avalia o ensemble em uma grade discretizada das features de X
+
+    Args:
+        ensemble: Modelo com `predict` (ex: VotingRegressor de PriorityModel)
+        X: Features de treino (definem níveis e faixas)
+        max_cells: Limite de células da tabela (float32 = 4 bytes cada)
+    """
+    names = list(X.columns)
+    values = [X[name].to_numpy(dtype=np.float64) for name in names]
+    importances = _feature_importances(ensemble, len(names))
+    n_levels = [min(len(np.unique(v)), MAX_EXACT_LEVELS) for v in values]
+    grids = [_levels(v, n) for v, n in zip(values, n_levels)]
+
+    # Remove níveis da feature com mais níveis por unidade de importância
+    while np.prod([len(centers) for _, centers in grids], dtype=np.float64) > max_cells:
+        cost = [
+            len(centers) / (importance + 1e-6) if len(centers) > 1 else -1.0
+            for (_, centers), importance in zip(grids, importances)
+        ]
+        i = int(np.argmax(cost))
+        n_levels[i] = len(grids[i][1]) - 1
+        grids[i] = _levels(values[i], n_levels[i])
+
+    shape = tuple(len(centers) for _, centers in grids)
+    n_cells = int(np.prod(shape))
+    table = np.empty(n_cells, dtype=np.float32)
+    for start in range(0, n_cells, GRID_CHUNK_ROWS):
+        cells = np.arange(start, min(start + GRID_CHUNK_ROWS, n_cells))
+        index = np.unravel_index(cells, shape)
+        grid = pd.DataFrame({
+            name: centers[i] for name, (_, centers), i in zip(names, grids, index)
+        })
+        table[cells] = ensemble.predict(grid)
+
+    manifest = {
+        "format_version": TABLE_FORMAT_VERSION,
+        "feature_names": names,
+        "edges": [edges.tolist() for edges, _ in grids],
+    }
+    return LookupTable(manifest, table.reshape(shape))
+
+
+def distill_boosted(
+    ensemble,
+    X: pd.DataFrame,
+    n_synthetic: int = SYNTHETIC_SAMPLES,
+    params: Optional[Dict] = None,
+    seed: int = 42,
+) -> LGBMRegressor:
+    """
+    Treina um LightGBM raso nas predições do ensemble
+
+    Além das linhas de X, usa `n_synthetic` linhas com cada feature sorteada
+    da sua marginal em X, cobrindo combinações ausentes do treino.
+    """
+    rng = np.random.default_rng(seed)
+    synthetic = pd.DataFrame({
+        name: rng.choice(X[name].to_numpy(), size=n_synthetic) for name in X.columns
+    })
+    X_distill = pd.concat([X, synthetic], ignore_index=True)
+    y_distill = ensemble.predict(X_distill)
+
+    student = LGBMRegressor(random_state=seed, verbose=-1, **{**SHALLOW_PARAMS, **(params or {})})
+    student.fit(X_distill, y_distill)
+    return student
+
+
+def _latency(model, X: pd.DataFrame, repeats: int = 200) -> Dict:
+    """Latência de uma linha (DataFrame, como em /prioritize) e por linha em lote"""
+    single = []
+    for i in range(repeats):
+        row = X.iloc[[i % len(X)]]
+        start = time.perf_counter()
+        model.predict(row)
+        single.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    model.predict(X)
+    batch = time.perf_counter() - start
+    return {
+        "single_row_p50_us": round(float(np.median(single)) * 1e6, 1),
+        "single_row_p99_us": round(float(np.percentile(single, 99)) * 1e6, 1),
+        "batch_per_row_us": round(batch / len(X) * 1e6, 2),
+    }
+
+
+def _pickled_size(model) -> int:
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    return buffer.tell()
+
+
+def _categories(scores: np.ndarray) -> np.ndarray:
+    """Mesmas faixas de `PriorityModel.categorize_priority`"""
+    return np.digitize(scores, [25, 50, 75])
+
+
+def _evaluate(model, reference: np.ndarray, X: pd.DataFrame, y: pd.Series, nbytes: int) -> Dict:
+    predictions = np.clip(model.predict(X), 0, 100)
+    return {
+        "mae": round(float(mean_absolute_error(y, predictions)), 4),
+        "fidelity_mae": round(float(np.mean(np.abs(predictions - reference))), 4),
+        "fidelity_max_abs": round(float(np.max(np.abs(predictions - reference))), 4),
+        "category_agreement": round(
+            float(np.mean(_categories(predictions) == _categories(reference))), 4
+        ),
+        "memory_bytes": int(nbytes),
+        **_latency(model, X),
+    }
+
+
+def model_fingerprint(path: str) -> Optional[str]:
+    """
+    SHA-256 do artefato do modelo: o .pkl ou, no diretório plano, manifesto
+    + arrays (None se não existir)
+    """
+    if os.path.isdir(path):
+        files = [MANIFEST_FILE] + [f"{name}.npy" for name in ARRAY_NAMES]
+        files = [os.path.join(path, name) for name in files]
+    else:
+        files = [path]
+    files = [name for name in files if os.path.isfile(name)]
+    if not files:
+        return None
+    digest = hashlib.sha256()
+    for name in files:
+        with open(name, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def within_tolerance(metrics: Dict, tolerance: float, min_agreement: float) -> bool:
+    """Substituto elegível: fidelidade (MAE) e concordância de categoria"""
+    return (
+        metrics["fidelity_mae"] <= tolerance
+        and metrics["category_agreement"] >= min_agreement
+    )
+
+
+def distill(
+    ensemble,
+    X_train: pd.DataFrame,
+    X_test: pd.DataFrame,
+    y_test: pd.Series,
+    directory: str,
+    tolerance: float = 1.0,
+    max_cells: int = DEFAULT_MAX_CELLS,
+    min_agreement: float = DEFAULT_MIN_AGREEMENT,
+    source_paths: Sequence[str] = (),
+) -> Dict:
+    """
+    Destila o ensemble, compara os substitutos e salva o escolhido
+
+    Args:
+        ensemble: VotingRegressor treinado
+        X_train: Features de treino (grade da tabela e dados da destilação)
+        X_test, y_test: Conjunto de avaliação
+        directory: Destino do substituto escolhido (+ relatório)
+        tolerance: MAE máximo em relação ao ensemble (fidelidade) para um
+            substituto ser elegível; entre os elegíveis, fica o mais rápido
+        max_cells: Limite de células da tabela de lookup
+        min_agreement: Concordância mínima de categoria com o ensemble para
+            ser elegível (0.98 = 98% das amostras)
+        source_paths: Artefatos salvos do ensemble (.pkl, diretório plano);
+            suas impressões digitais vão para o relatório
+
+    Returns:
+        Relatório (também salvo em `{directory}/distillation.json`)
+    """
+    reference = np.clip(ensemble.predict(X_test), 0, 100)
+    feature_names = list(X_train.columns)
+
+    start = time.perf_counter()
+    table = build_lookup_table(ensemble, X_train, max_cells=max_cells)
+    table_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    student = distill_boosted(ensemble, X_train)
+    boosted_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Ensemble e boosting raso medidos no layout plano, como em produção
+        export_flat_artifact(ensemble, os.path.join(tmp, "ensemble"))
+        flat = FlatEnsemble.load(os.path.join(tmp, "ensemble"), mmap_mode=None)
+        export_flat_members([("lgbm", student, 1.0)], feature_names, os.path.join(tmp, "boosted"))
+        boosted = FlatEnsemble.load(os.path.join(tmp, "boosted"), mmap_mode=None)
+
+    report = {
+        "tolerance": tolerance,
+        "min_agreement": min_agreement,
+        "source_fingerprints": [
+            fingerprint for fingerprint in map(model_fingerprint, source_paths) if fingerprint
+        ],
+        "test_samples": int(len(X_test)),
+        "models": {
+            "ensemble": _evaluate(
+                ensemble, reference, X_test, y_test, _pickled_size(ensemble)
+            ),
+            "ensemble_flat": _evaluate(flat, reference, X_test, y_test, flat.nbytes()),
+            "lookup_table": {
+                **_evaluate(table, reference, X_test, y_test, table.nbytes()),
+                "shape": dict(zip(feature_names, table.table.shape)),
+                "build_seconds": round(table_seconds, 2),
+            },
+            "shallow_boosted": {
+                **_evaluate(boosted, reference, X_test, y_test, boosted.nbytes()),
+                "params": {**SHALLOW_PARAMS},
+                "build_seconds": round(boosted_seconds, 2),
+            },
+        },
+    }
+
+    eligible = [
+        name for name in ("lookup_table", "shallow_boosted")
+        if within_tolerance(report["models"][name], tolerance, min_agreement)
+    ]
+    selected = min(
+        eligible, key=lambda name: report["models"][name]["single_row_p50_us"]
+    ) if eligible else None
+    report["selected"] = selected
+
+    # Remove substituto anterior (de qualquer formato) antes de salvar
+    previous = [MANIFEST_FILE, TABLE_MANIFEST_FILE, TABLE_FILE]
+    previous += [f"{name}.npy" for name in ARRAY_NAMES]
+    for name in previous:
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            os.remove(path)
+    if selected == "lookup_table":
+        table.save(directory)
+    elif selected == "shallow_boosted":
+        export_flat_members([("lgbm", student, 1.0)], feature_names, directory)
+
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, REPORT_FILE), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def distilled_from(report: Dict, model_path: str) -> bool:
+    """Substituto foi destilado do modelo em `model_path`"""
+    fingerprint = model_fingerprint(model_path)
+    return fingerprint is not None and fingerprint in report.get("source_fingerprints", [])
+
+
+def load_distillation_report(directory: str) -> Optional[Dict]:
+    path = os.path.join(directory, REPORT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
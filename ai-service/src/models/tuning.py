@@ -0,0 +1,272 @@
+"""
+Busca de hiperparâmetros do ensemble de priorização com orçamento de tempo
+
+Successive halving sobre configurações aleatórias do ensemble (rf, xgb, lgbm):
+cada rodada avalia os candidatos com validação cruzada em uma fração das
+linhas de treino, mantém o melhor 1/eta e multiplica as linhas por eta. Os
+boosters usam early stopping em uma validação interna, então o número de
+árvores final é o necessário, não o máximo amostrado.
+
+O objetivo combina MAE e latência de inferência medida por linha, para
+preferir ensembles menores e mais rápidos com a mesma precisão. As avaliações
+rodam em paralelo (joblib) e a busca para no limite de tempo de parede.
+"""
+
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from lightgbm import LGBMRegressor, early_stopping
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import mean_absolute_error
+from sklearn.model_selection import KFold
+from xgboost import XGBRegressor
+
+from .priority_model import PriorityModel
+
+EARLY_STOPPING_ROUNDS = 20
+MAX_BOOSTER_ESTIMATORS = 400
+INNER_VALIDATION_FRACTION = 0.1
+
+SEARCH_SPACE = {
+    'rf': {
+        'n_estimators': [25, 50, 100, 200],
+        'max_depth': [4, 6, 8, 10, None],
+    },
+    'xgb': {
+        'max_depth': [3, 4, 6, 8],
+        'learning_rate': [0.05, 0.1, 0.3],
+    },
+    'lgbm': {
+        'max_depth': [3, 4, 6, -1],
+        'num_leaves': [7, 15, 31],
+        'learning_rate': [0.05, 0.1, 0.3],
+    },
+}
+
+
+@dataclass
+class TuningResult:
+    params: Dict[str, Dict]
+    leaderboard: List[Dict] = field(default_factory=list)
+    rungs_completed: int = 0
+    elapsed_seconds: float = 0.0
+
+
+def _sample_candidates(n_candidates: int, seed: int) -> List[Dict[str, Dict]]:
+    """Amostra configurações; a primeira é a configuração padrão atual"""
+    rng = np.random.default_rng(seed)
+    candidates = [{
+        name: dict(params) for name, params in PriorityModel.DEFAULT_PARAMS.items()
+    }]
+    while len(candidates) < n_candidates:
+        candidate = {
+            member: {
+                param: values[rng.integers(len(values))]
+                for param, values in space.items()
+            }
+            for member, space in SEARCH_SPACE.items()
+        }
+        if candidate not in candidates:
+            candidates.append(candidate)
+    return candidates
+
+
+def _booster_params(params: Dict) -> Dict:
+    # Teto de árvores; o early stopping define o número efetivo
+    return {**params, 'n_estimators': MAX_BOOSTER_ESTIMATORS}
+
+
+def _fit_members(candidate: Dict[str, Dict], X: pd.DataFrame, y: pd.Series):
+    """Treina os três membros; boosters com early stopping em validação interna"""
+    n_inner = max(1, int(len(X) * INNER_VALIDATION_FRACTION))
+    X_fit, y_fit = X.iloc[n_inner:], y.iloc[n_inner:]
+    X_inner, y_inner = X.iloc[:n_inner], y.iloc[:n_inner]
+
+    rf = RandomForestRegressor(random_state=42, n_jobs=1, **candidate['rf'])
+    rf.fit(X, y)
+
+    xgb = XGBRegressor(
+        random_state=42,
+        n_jobs=1,
+        early_stopping_rounds=EARLY_STOPPING_ROUNDS,
+        **_booster_params(candidate['xgb']),
+    )
+    xgb.fit(X_fit, y_fit, eval_set=[(X_inner, y_inner)], verbose=False)
+
+    lgbm = LGBMRegressor(
+        random_state=42, n_jobs=1, verbose=-1, **_booster_params(candidate['lgbm'])
+    )
+    lgbm.fit(
+        X_fit, y_fit,
+        eval_set=[(X_inner, y_inner)],
+        callbacks=[early_stopping(EARLY_STOPPING_ROUNDS, verbose=False)],
+    )
+
+    best_iterations = {
+        'xgb': int(xgb.best_iteration) + 1,
+        'lgbm': int(lgbm.best_iteration_ or MAX_BOOSTER_ESTIMATORS),
+    }
+    return (rf, xgb, lgbm), best_iterations
+
+
+def _predict(members, X: pd.DataFrame) -> np.ndarray:
+    """Média ponderada igual à do VotingRegressor de PriorityModel"""
+    predictions = np.column_stack([member.predict(X) for member in members])
+    return np.average(predictions, axis=1, weights=PriorityModel.WEIGHTS)
+
+
+def _evaluate(
+    candidate: Dict[str, Dict],
+    X: pd.DataFrame,
+    y: pd.Series,
+    train_idx: np.ndarray,
+    val_idx: np.ndarray,
+    deadline: float,
+) -> Optional[Dict]:
+    """Treina em um fold e mede MAE e latência por linha (None se estourou o tempo)"""
+    if time.time() > deadline:
+        return None
+
+    members, best_iterations = _fit_members(candidate, X.iloc[train_idx], y.iloc[train_idx])
+    X_val = X.iloc[val_idx]
+
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        predictions = _predict(members, X_val)
+        timings.append(time.perf_counter() - start)
+
+    return {
+        'mae': mean_absolute_error(y.iloc[val_idx], predictions),
+        'latency_per_row': min(timings) / len(val_idx),
+        'best_iterations': best_iterations,
+    }
+
+
+def _objective(mae: float, latency_per_row: float, latency_weight: float) -> float:
+    """MAE penalizado pela latência (latency_weight pontos de MAE por ms/linha)"""
+    return mae + latency_weight * latency_per_row * 1000
+
+
+def tune_ensemble(
+    X: pd.DataFrame,
+    y: pd.Series,
+    budget_seconds: float = 300.0,
+    n_candidates: int = 27,
+    eta: int = 3,
+    cv: int = 3,
+    n_jobs: int = -1,
+    latency_weight: float = 1.0,
+    mae_tolerance: float = 0.05,
+    min_rows: int = 200,
+    seed: int = 42,
+) -> TuningResult:
+    """
+    Successive halving com CV paralela sob orçamento de tempo
+
+    Args:
+        X: Features de treino
+        y: Scores de prioridade
+        budget_seconds: Limite de tempo de parede da busca
+        n_candidates: Configurações na primeira rodada
+        eta: Fator de eliminação/crescimento entre rodadas
+        cv: Número de folds
+        n_jobs: Processos paralelos (-1 = todos os núcleos)
+        latency_weight: Peso da latência por linha (ms) no objetivo
+        mae_tolerance: Na escolha final, aceita MAE até (1 + tol) * melhor MAE
+            e fica com o candidato mais rápido
+        min_rows: Linhas de treino mínimas na primeira rodada
+        seed: Semente da amostragem de candidatos
+
+    Returns:
+        TuningResult com `params` prontos para `PriorityModel(params=...)`
+    """
+    start = time.time()
+    deadline = start + budget_seconds
+
+    X = X.reset_index(drop=True)
+    y = y.reset_index(drop=True)
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(X))
+    X, y = X.iloc[order].reset_index(drop=True), y.iloc[order].reset_index(drop=True)
+
+    folds = list(KFold(n_splits=cv, shuffle=True, random_state=seed).split(X))
+    max_rows = min(len(train_idx) for train_idx, _ in folds)
+
+    candidates = _sample_candidates(n_candidates, seed)
+    n_rungs = max(1, int(math.log(len(candidates), eta)) + 1)
+    rows = max(min(min_rows, max_rows), int(max_rows / eta ** (n_rungs - 1)))
+
+    result = TuningResult(params={
+        name: dict(p) for name, p in PriorityModel.DEFAULT_PARAMS.items()
+    })
+    leaderboard: List[Dict] = []
+
+    with Parallel(n_jobs=n_jobs) as parallel:
+        for rung in range(n_rungs):
+            if time.time() > deadline:
+                break
+
+            evaluations = parallel(
+                delayed(_evaluate)(candidate, X, y, train_idx[:rows], val_idx, deadline)
+                for candidate in candidates
+                for train_idx, val_idx in folds
+            )
+
+            rung_board = []
+            for i, candidate in enumerate(candidates):
+                folds_eval = evaluations[i * cv:(i + 1) * cv]
+                if any(e is None for e in folds_eval):
+                    continue
+                mae = float(np.mean([e['mae'] for e in folds_eval]))
+                latency = float(np.mean([e['latency_per_row'] for e in folds_eval]))
+                rung_board.append({
+                    'candidate': candidate,
+                    'rung': rung,
+                    'rows': rows,
+                    'mae': mae,
+                    'latency_per_row_ms': latency * 1000,
+                    'objective': _objective(mae, latency, latency_weight),
+                    'best_iterations': {
+                        name: max(e['best_iterations'][name] for e in folds_eval)
+                        for name in ('xgb', 'lgbm')
+                    },
+                })
+
+            # Rodada interrompida pelo prazo: fica com a última completa
+            if len(rung_board) < len(candidates) and leaderboard:
+                break
+            if not rung_board:
+                break
+
+            rung_board.sort(key=lambda entry: entry['objective'])
+            leaderboard = rung_board
+            result.rungs_completed = rung + 1
+
+            keep = max(1, math.ceil(len(rung_board) / eta))
+            candidates = [entry['candidate'] for entry in rung_board[:keep]]
+            rows = min(max_rows, rows * eta)
+            if len(candidates) == 1 and rows == max_rows and rung_board[0]['rows'] == max_rows:
+                break
+
+    if leaderboard:
+        best_mae = min(entry['mae'] for entry in leaderboard)
+        eligible = [e for e in leaderboard if e['mae'] <= best_mae * (1 + mae_tolerance)]
+        chosen = min(eligible, key=lambda entry: entry['latency_per_row_ms'])
+        params = {name: dict(p) for name, p in chosen['candidate'].items()}
+        for name in ('xgb', 'lgbm'):
+            params[name]['n_estimators'] = chosen['best_iterations'][name]
+        result.params = params
+
+    result.leaderboard = [
+        {key: value for key, value in entry.items() if key != 'candidate'}
+        | {'params': entry['candidate']}
+        for entry in leaderboard
+    ]
+    result.elapsed_seconds = time.time() - start
+    return result
@@ -50,6 +50,22 @@ class BackendClient:
             logger.error("BACKEND_SERVICE_TOKEN não configurado")
             return None
 
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            return await self._post_alert(
+                client, patient_id, alert_type, severity, message, context, tenant_id
+            )
+
+    async def _post_alert(
+        self,
+        client: httpx.AsyncClient,
+        patient_id: str,
+        alert_type: str,
+        severity: str,
+        message: str,
+        context: Optional[Dict] = None,
+        tenant_id: Optional[str] = None,
+    ) -> Optional[Dict]:
+        """Envia um alerta usando o cliente HTTP informado"""
         url = f"{self.base_url}/api/v1/alerts"
 
         headers = {
@@ -72,12 +88,11 @@ class BackendClient:
             payload["context"] = context
 
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(url, json=payload, headers=headers)
-                response.raise_for_status()
-                alert = response.json()
-                logger.info(f"✅ Alerta criado: {alert.get('id')}")
-                return alert
+            response = await client.post(url, json=payload, headers=headers)
+            response.raise_for_status()
+            alert = response.json()
+            logger.info(f"✅ Alerta criado: {alert.get('id')}")
+            return alert
         except httpx.HTTPStatusError as e:
             if e.response.status_code == 404:
                 logger.error(f"❌ Paciente {patient_id} não encontrado")
@@ -92,6 +107,41 @@ class BackendClient:
             logger.error(f"❌ Erro ao criar alerta: {e}")
             return None
 
+    async def create_alerts_bulk(
+        self,
+        alerts: List[Dict],
+        max_concurrency: int = 10,
+    ) -> List[Optional[Dict]]:
+        """
+        Cria vários alertas por um único cliente HTTP (pool de conexões)
+
+        O backend não tem endpoint de criação em lote; os POSTs saem em
+        paralelo (até `max_concurrency`) pelo mesmo cliente.
+
+        Args:
+            alerts: Dicts com os argumentos de `create_alert` (patient_id,
+                alert_type, severity, message, context, tenant_id)
+            max_concurrency: Requisições simultâneas ao backend
+
+        Returns:
+            Lista alinhada com `alerts`: alerta criado ou None se erro
+        """
+        if not alerts:
+            return []
+        if not self.service_token:
+            logger.error("BACKEND_SERVICE_TOKEN não configurado")
+            return [None] * len(alerts)
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+        limits = httpx.Limits(max_connections=max_concurrency)
+
+        async with httpx.AsyncClient(timeout=30.0, limits=limits) as client:
+            async def send(alert: Dict) -> Optional[Dict]:
+                async with semaphore:
+                    return await self._post_alert(client, **alert)
+
+            return list(await asyncio.gather(*(send(alert) for alert in alerts)))
+
     async def create_critical_symptom_alert(
         self,
         patient_id: str,
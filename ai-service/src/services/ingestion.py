@@ -0,0 +1,400 @@
+"""
+Worker de ingestão de mensagens recebidas em lote
+
+Consome mensagens de pacientes de uma `MessageQueue` (Redis Streams em
+produção, `LocalQueue` em desenvolvimento) em lotes de até `batch_size`:
+
+1. Detecção de sintomas críticos e extração local vetorizadas sobre o lote
+2. Alertas dos sintomas críticos detectados enviados juntos ao backend, logo
+   após a detecção e em paralelo com o LLM: uma falha ou lentidão do LLM não
+   atrasa nem impede o alerta
+3. Chamadas ao LLM em paralelo, limitadas a `llm_concurrency` (o escalonador
+   do agente continua aplicando o rate limit do provedor); com o LLM
+   indisponível, o agente devolve a resposta padrão
+4. Respostas publicadas na fila de resultados (se configurada) e ACK
+
+Entrega "pelo menos uma vez": alerta e resposta são acompanhados
+separadamente por mensagem, e o ACK só ocorre quando os dois estão
+concluídos; se um falhar (ou o worker cair no meio), a mensagem é
+reentregue e só a etapa pendente é refeita. O contexto do alerta leva
+`messageId`, que o backend usa como chave de idempotência (única por tenant):
+o reenvio após um reinício devolve o alerta já criado. Mensagens
+inválidas ou que excederam `max_deliveries` vão para a fila de descartes
+(dead letter) e são confirmadas.
+
+Formato do payload:
+    {"patient_id", "message", "patient_context", "conversation_history",
+     "tenant_id", "conversation_id", "message_id"}
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from ..agent.scheduler import is_valid_tenant_id
+from ..agent.whatsapp_agent import WhatsAppAgent, whatsapp_agent
+from .backend_client import BackendClient, backend_client
+from .message_queue import MessageQueue, QueuedMessage
+
+logger = logging.getLogger(__name__)
+
+# 'alerts' e 'llm' correm em paralelo (tempos sobrepostos)
+STAGES = ['read', 'detect', 'llm', 'alerts', 'publish', 'ack']
+# Lotes considerados na vazão recente
+THROUGHPUT_WINDOW = 50
+# Mensagens sem ACK com etapas já concluídas (alerta/resposta), em LRU
+COMPLETED_CACHE_SIZE = 10000
+ALERT = 'alert'
+REPLY = 'reply'
+
+
+class InvalidMessage(ValueError):
+    pass
+
+
+def _validate(payload: Dict):
+    for field in ('patient_id', 'message'):
+        if not isinstance(payload.get(field), str) or not payload[field]:
+            raise InvalidMessage(f"Campo obrigatório ausente: {field}")
+    tenant_id = payload.get('tenant_id')
+    if tenant_id is not None and not is_valid_tenant_id(tenant_id):
+        raise InvalidMessage("tenant_id inválido")
+
+
+class IngestionWorker:
+    """
+    Processa mensagens da fila em lotes
+
+    Args:
+        agent: Agente conversacional
+        backend: Cliente do backend (alertas)
+        batch_size: Mensagens lidas por lote
+        llm_concurrency: Chamadas simultâneas ao LLM
+        alert_concurrency: Requisições simultâneas de alerta ao backend
+        block_seconds: Espera máxima por mensagens com a fila vazia
+        max_deliveries: Entregas antes de mandar a mensagem para descartes
+    """
+
+    def __init__(
+        self,
+        agent: WhatsAppAgent,
+        backend: BackendClient,
+        batch_size: int = 32,
+        llm_concurrency: int = 8,
+        alert_concurrency: int = 10,
+        block_seconds: float = 1.0,
+        max_deliveries: int = 5,
+    ):
+        self.agent = agent
+        self.backend = backend
+        self.queue: Optional[MessageQueue] = None
+        self.results: Optional[MessageQueue] = None
+        self.dead_letters: Optional[MessageQueue] = None
+        self.batch_size = batch_size
+        self.llm_concurrency = llm_concurrency
+        self.alert_concurrency = alert_concurrency
+        self.block_seconds = block_seconds
+        self.max_deliveries = max_deliveries
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._running = False
+        self._task: Optional[asyncio.Task] = None
+        # id na fila -> etapas concluídas em entregas anteriores
+        self._completed: OrderedDict = OrderedDict()
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.batches = 0
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.dead_lettered = 0
+        self.redelivered = 0
+        self.alerts_sent = 0
+        self.alerts_failed = 0
+        self.stage_seconds = {stage: 0.0 for stage in STAGES}
+        # (mensagens, segundos) dos últimos lotes
+        self._recent: deque = deque(maxlen=THROUGHPUT_WINDOW)
+
+    def attach(
+        self,
+        queue: MessageQueue,
+        results: Optional[MessageQueue] = None,
+        dead_letters: Optional[MessageQueue] = None,
+    ):
+        """
+        Define as filas (a fila de entrada também recebe `POST /agent/messages/queue`)
+
+        Args:
+            queue: Fila de entrada
+            results: Fila onde publicar as respostas (opcional)
+            dead_letters: Fila de descartes (opcional; sem ela, só registra em log)
+        """
+        self.queue = queue
+        self.results = results
+        self.dead_letters = dead_letters
+        self._completed.clear()
+        self._reset_stats()
+
+    def start(self):
+        """Inicia o loop de consumo no event loop atual"""
+        if self.queue is None:
+            raise RuntimeError("Fila de ingestão não configurada")
+        if self._task is None:
+            self._running = True
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Termina o lote corrente e para (pendentes ficam na fila)"""
+        self._running = False
+        if self._task is not None:
+            await self._task
+            self._task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _llm_executor(self) -> ThreadPoolExecutor:
+        # Pool próprio: chamadas ao LLM não ocupam o threadpool das rotas
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.llm_concurrency, thread_name_prefix="ingestion-llm"
+            )
+        return self._executor
+
+    async def run(self):
+        while self._running:
+            try:
+                await self.run_once()
+            except Exception as e:
+                # Mensagens sem ACK serão reentregues
+                logger.error(f"Erro no lote de ingestão: {e}")
+                await asyncio.sleep(self.block_seconds)
+
+    async def run_once(self) -> int:
+        """
+        Lê e processa um lote
+
+        Returns:
+            Mensagens confirmadas (processadas + descartadas)
+        """
+        timings = {}
+        loop = asyncio.get_running_loop()
+
+        start = time.perf_counter()
+        batch = await loop.run_in_executor(
+            None, self.queue.read_batch, self.batch_size, self.block_seconds
+        )
+        timings['read'] = time.perf_counter() - start
+        if not batch:
+            return 0
+        batch_start = time.perf_counter()
+
+        self.redelivered += sum(1 for item in batch if item.deliveries > 1)
+        valid, rejected = self._triage(batch)
+
+        start = time.perf_counter()
+        texts = [item.payload['message'] for item in valid]
+        symptoms = self.agent.detect_critical_symptoms_batch(texts) if valid else []
+        extracted = self.agent.extract_structured_data_batch(texts) if valid else []
+        timings['detect'] = time.perf_counter() - start
+
+        # Alertas dependem só da detecção: saem já, sem esperar o LLM
+        alerts = asyncio.ensure_future(self._send_alerts([
+            (item, found) for item, found in zip(valid, symptoms)
+            if found and not self._is_done(item, ALERT)
+        ], timings))
+
+        start = time.perf_counter()
+        pending = [
+            (item, found, data) for item, found, data in zip(valid, symptoms, extracted)
+            if not self._is_done(item, REPLY)
+        ]
+        outcomes = await asyncio.gather(*(
+            loop.run_in_executor(self._llm_executor(), self._process, item, found, data)
+            for item, found, data in pending
+        ), return_exceptions=True)
+        timings['llm'] = time.perf_counter() - start
+        await alerts
+
+        replies = []
+        for (item, _, _), outcome in zip(pending, outcomes):
+            if isinstance(outcome, Exception):
+                logger.warning(f"Falha ao processar mensagem {item.message_id}: {outcome}")
+            else:
+                replies.append((item, outcome))
+
+        start = time.perf_counter()
+        await loop.run_in_executor(None, self._publish, replies, rejected)
+        for item, _ in replies:
+            self._mark_done(item, REPLY)
+        timings['publish'] = time.perf_counter() - start
+
+        # ACK só com alerta (se havia sintoma crítico) e resposta concluídos
+        completed = [
+            item for item, found in zip(valid, symptoms)
+            if self._is_done(item, REPLY) and (not found or self._is_done(item, ALERT))
+        ]
+        start = time.perf_counter()
+        acked = [item.message_id for item in completed] + [item.message_id for item, _ in rejected]
+        if acked:
+            await loop.run_in_executor(None, self.queue.ack, acked)
+        for message_id in acked:
+            self._completed.pop(message_id, None)
+        timings['ack'] = time.perf_counter() - start
+
+        self.batches += 1
+        self.received += len(batch)
+        self.processed += len(completed)
+        self.failed += len(valid) - len(completed)
+        self.dead_lettered += len(rejected)
+        for stage, seconds in timings.items():
+            self.stage_seconds[stage] += seconds
+        self._recent.append((len(batch), time.perf_counter() - batch_start))
+        return len(acked)
+
+    def _is_done(self, item: QueuedMessage, stage: str) -> bool:
+        return stage in self._completed.get(item.message_id, ())
+
+    def _mark_done(self, item: QueuedMessage, stage: str):
+        self._completed.setdefault(item.message_id, set()).add(stage)
+        self._completed.move_to_end(item.message_id)
+        while len(self._completed) > COMPLETED_CACHE_SIZE:
+            self._completed.popitem(last=False)
+
+    def _triage(self, batch: List[QueuedMessage]):
+        valid, rejected = [], []
+        for item in batch:
+            try:
+                _validate(item.payload)
+            except InvalidMessage as e:
+                logger.error(f"Mensagem {item.message_id} inválida: {e}")
+                rejected.append((item, str(e)))
+                continue
+            if item.deliveries > self.max_deliveries:
+                logger.error(
+                    f"Mensagem {item.message_id} excedeu {self.max_deliveries} entregas"
+                )
+                rejected.append((item, "max_deliveries"))
+                continue
+            valid.append(item)
+        return valid, rejected
+
+    def _process(self, item: QueuedMessage, critical_symptoms: List[str], structured_data: Dict) -> Dict:
+        payload = item.payload
+        return self.agent.process_message(
+            message=payload['message'],
+            patient_context=payload.get('patient_context') or {},
+            conversation_history=payload.get('conversation_history') or [],
+            tenant_id=payload.get('tenant_id'),
+            critical_symptoms=critical_symptoms,
+            structured_data=structured_data,
+        )
+
+    def _message_id(self, item: QueuedMessage) -> str:
+        return item.payload.get('message_id') or item.message_id
+
+    async def _send_alerts(self, critical: List[tuple], timings: Dict):
+        """
+        Envia os alertas críticos do lote, a partir dos sintomas detectados
+
+        Alertas enviados ficam marcados e não são reenviados em reentregas;
+        os que falharam deixam a mensagem sem ACK (reentregue). Entre
+        reinícios, o backend deduplica pelo `messageId` do contexto.
+        """
+        start = time.perf_counter()
+        if not critical:
+            timings['alerts'] = 0.0
+            return
+
+        alerts = []
+        for item, symptoms in critical:
+            context = {
+                "symptoms": symptoms,
+                "detectedBy": "ai_agent",
+                "confidence": 1.0,
+                "messageId": self._message_id(item),
+            }
+            if item.payload.get('conversation_id'):
+                context["conversationId"] = item.payload['conversation_id']
+            alerts.append({
+                "patient_id": item.payload['patient_id'],
+                "alert_type": "CRITICAL_SYMPTOM",
+                "severity": "CRITICAL",
+                "message": f"Sintomas críticos detectados: {', '.join(symptoms)}",
+                "context": context,
+                "tenant_id": item.payload.get('tenant_id'),
+            })
+
+        created = await self.backend.create_alerts_bulk(alerts, self.alert_concurrency)
+        for (item, _), alert in zip(critical, created):
+            if alert is None:
+                self.alerts_failed += 1
+            else:
+                self.alerts_sent += 1
+                self._mark_done(item, ALERT)
+        timings['alerts'] = time.perf_counter() - start
+
+    def _publish(self, replies: List[tuple], rejected: List[tuple]):
+        """Publica respostas e descartes (chamadas bloqueantes, fora do event loop)"""
+        if self.results is not None:
+            for item, result in replies:
+                self.results.enqueue(self._result_payload(item, result))
+        if self.dead_letters is not None:
+            for item, reason in rejected:
+                self.dead_letters.enqueue({**item.payload, "error": reason})
+
+    def _result_payload(self, item: QueuedMessage, result: Dict) -> Dict:
+        return {
+            "message_id": self._message_id(item),
+            "patient_id": item.payload['patient_id'],
+            "conversation_id": item.payload.get('conversation_id'),
+            "tenant_id": item.payload.get('tenant_id'),
+            "response": result['response'],
+            "critical_symptoms": result['critical_symptoms'],
+            "structured_data": result['structured_data'],
+            "should_alert": result['should_alert'],
+        }
+
+    def stats(self) -> Dict:
+        """Contadores, tempo por etapa e vazão (mensagens/s) recente"""
+        messages = sum(count for count, _ in self._recent)
+        seconds = sum(elapsed for _, elapsed in self._recent)
+        if self.queue is None:
+            return {"configured": False}
+        try:
+            queue_stats = self.queue.stats()
+        except Exception as e:
+            queue_stats = {"error": str(e)}
+        return {
+            "configured": True,
+            "running": self._running,
+            "batches": self.batches,
+            "received": self.received,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dead_lettered": self.dead_lettered,
+            "redelivered": self.redelivered,
+            "alerts_sent": self.alerts_sent,
+            "alerts_failed": self.alerts_failed,
+            "mean_batch_size": round(self.received / self.batches, 2) if self.batches else None,
+            "messages_per_second": round(messages / seconds, 2) if seconds else None,
+            "stage_seconds": {
+                stage: round(seconds, 3) for stage, seconds in self.stage_seconds.items()
+            },
+            "queue": queue_stats,
+        }
+
+
+# Instância global (fila definida ao iniciar o serviço, ver main.py)
+ingestion_worker = IngestionWorker(
+    agent=whatsapp_agent,
+    backend=backend_client,
+    batch_size=int(os.getenv("INGESTION_BATCH_SIZE", "32")),
+    llm_concurrency=int(os.getenv("INGESTION_LLM_CONCURRENCY", "8")),
+    alert_concurrency=int(os.getenv("INGESTION_ALERT_CONCURRENCY", "10")),
+    max_deliveries=int(os.getenv("INGESTION_MAX_DELIVERIES", "5")),
+)
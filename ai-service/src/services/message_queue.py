@@ -0,0 +1,226 @@
+"""
+Filas de mensagens para o worker de ingestão
+
+Interface mínima com entrega "pelo menos uma vez": `read_batch` entrega
+mensagens que ficam pendentes até `ack`; se o consumidor cair ou não
+confirmar dentro de `visibility_timeout`, a mensagem é entregue de novo.
+
+- `LocalQueue`: em memória, no próprio processo (desenvolvimento e testes)
+- `RedisStreamQueue`: Redis Streams com consumer group (XREADGROUP/XACK/
+  XAUTOCLAIM); funciona com servidores compatíveis (Redis >= 6.2, Valkey)
+"""
+
+import itertools
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+
+@dataclass
+class QueuedMessage:
+    message_id: str
+    payload: Dict
+    # Número de entregas, incluindo a atual (> 1 = reentrega)
+    deliveries: int = 1
+
+
+class MessageQueue:
+    """Interface de fila com confirmação explícita"""
+
+    def enqueue(self, payload: Dict) -> str:
+        raise NotImplementedError
+
+    def read_batch(self, max_messages: int, block_seconds: float = 1.0) -> List[QueuedMessage]:
+        """Até `max_messages` mensagens; espera até `block_seconds` se vazia"""
+        raise NotImplementedError
+
+    def ack(self, message_ids: Sequence[str]):
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        raise NotImplementedError
+
+
+class LocalQueue(MessageQueue):
+    """
+    Fila em memória com reentrega após `visibility_timeout` sem confirmação
+    """
+
+    def __init__(self, visibility_timeout: float = 60.0):
+        self.visibility_timeout = visibility_timeout
+        self._pending: deque = deque()
+        # message_id -> (prazo de confirmação, mensagem)
+        self._inflight: Dict[str, tuple] = {}
+        self._ids = itertools.count(1)
+        self._condition = threading.Condition()
+
+    def enqueue(self, payload: Dict) -> str:
+        with self._condition:
+            message = QueuedMessage(message_id=str(next(self._ids)), payload=payload, deliveries=0)
+            self._pending.append(message)
+            self._condition.notify()
+            return message.message_id
+
+    def _reclaim_expired(self, now: float):
+        expired = [
+            message_id for message_id, (deadline, _) in self._inflight.items()
+            if deadline <= now
+        ]
+        # Reentregas vão para a frente da fila
+        for message_id in reversed(expired):
+            self._pending.appendleft(self._inflight.pop(message_id)[1])
+
+    def read_batch(self, max_messages: int, block_seconds: float = 1.0) -> List[QueuedMessage]:
+        deadline = time.monotonic() + block_seconds
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._reclaim_expired(now)
+                if self._pending or now >= deadline:
+                    break
+                self._condition.wait(deadline - now)
+
+            batch = []
+            while self._pending and len(batch) < max_messages:
+                message = self._pending.popleft()
+                message.deliveries += 1
+                self._inflight[message.message_id] = (now + self.visibility_timeout, message)
+                batch.append(QueuedMessage(message.message_id, message.payload, message.deliveries))
+            return batch
+
+    def ack(self, message_ids: Sequence[str]):
+        with self._condition:
+            for message_id in message_ids:
+                self._inflight.pop(message_id, None)
+
+    def stats(self) -> Dict:
+        with self._condition:
+            return {
+                "backend": "local",
+                "pending": len(self._pending),
+                "inflight": len(self._inflight),
+            }
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class RedisStreamQueue(MessageQueue):
+    """
+    Fila sobre Redis Streams com consumer group
+
+    Args:
+        client: Cliente síncrono compatível com redis-py
+        stream: Nome do stream
+        group: Consumer group (workers do mesmo grupo dividem as mensagens)
+        consumer: Nome deste consumidor (padrão: host-pid)
+        visibility_timeout: Segundos pendente sem ACK antes de outro
+            consumidor poder reivindicar a mensagem (XAUTOCLAIM)
+    """
+
+    def __init__(
+        self,
+        client,
+        stream: str = "onconav:inbound-messages",
+        group: str = "ai-ingestion",
+        consumer: Optional[str] = None,
+        visibility_timeout: float = 60.0,
+    ):
+        self.client = client
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.visibility_timeout = visibility_timeout
+        try:
+            client.xgroup_create(stream, group, id="0", mkstream=True)
+        except Exception as e:
+            # Grupo já existe
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisStreamQueue":
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("Pacote 'redis' não instalado (pip install redis)") from e
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def enqueue(self, payload: Dict) -> str:
+        return _text(self.client.xadd(self.stream, {"payload": json.dumps(payload)}))
+
+    def _deliveries(self, message_id: str) -> int:
+        pending = self.client.xpending_range(
+            self.stream, self.group, min=message_id, max=message_id, count=1
+        )
+        return int(pending[0]["times_delivered"]) if pending else 1
+
+    def _parse(self, entries, reclaimed: bool) -> List[QueuedMessage]:
+        messages = []
+        for message_id, fields in entries:
+            message_id = _text(message_id)
+            if not fields:
+                # Entrada apagada do stream enquanto pendente
+                self.client.xack(self.stream, self.group, message_id)
+                continue
+            payload = json.loads(_text(fields.get(b"payload", fields.get("payload"))))
+            deliveries = self._deliveries(message_id) if reclaimed else 1
+            messages.append(QueuedMessage(message_id, payload, deliveries))
+        return messages
+
+    def read_batch(self, max_messages: int, block_seconds: float = 1.0) -> List[QueuedMessage]:
+        # Primeiro, pendentes sem ACK há mais que o timeout (consumidor caiu)
+        claimed = self.client.xautoclaim(
+            self.stream, self.group, self.consumer,
+            min_idle_time=int(self.visibility_timeout * 1000),
+            start_id="0-0",
+            count=max_messages,
+        )
+        messages = self._parse(claimed[1], reclaimed=True)
+
+        if len(messages) < max_messages:
+            response = self.client.xreadgroup(
+                self.group, self.consumer, {self.stream: ">"},
+                count=max_messages - len(messages),
+                block=None if messages else max(1, int(block_seconds * 1000)),
+            )
+            for _, entries in response or []:
+                messages.extend(self._parse(entries, reclaimed=False))
+        return messages
+
+    def ack(self, message_ids: Sequence[str]):
+        if not message_ids:
+            return
+        pipeline = self.client.pipeline()
+        pipeline.xack(self.stream, self.group, *message_ids)
+        pipeline.xdel(self.stream, *message_ids)
+        pipeline.execute()
+
+    def stats(self) -> Dict:
+        pending = self.client.xpending(self.stream, self.group)
+        return {
+            "backend": "redis",
+            "stream": self.stream,
+            "group": self.group,
+            "length": int(self.client.xlen(self.stream)),
+            "inflight": int(pending["pending"]),
+        }
+
+
+def create_queue(url: str, **kwargs) -> MessageQueue:
+    """
+    Cria fila a partir da URL: "local" ou "redis://host:porta/db"
+
+    kwargs vão para o construtor (ex: stream, visibility_timeout).
+    """
+    if url == "local":
+        return LocalQueue(visibility_timeout=kwargs.get("visibility_timeout", 60.0))
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisStreamQueue.from_url(url, **kwargs)
+    raise ValueError(f"URL de fila não suportada: {url}")
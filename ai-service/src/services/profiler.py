@@ -0,0 +1,281 @@
+"""
+Profiler estatístico por amostragem, ativado sob demanda em produção
+
+Uma thread de amostragem lê `sys._current_frames()` a cada intervalo e
+agrega as pilhas no formato "collapsed" (entrada do flamegraph.pl /
+speedscope), separadas por rota. Nenhum hook é instalado no interpretador:
+fora de uma sessão o custo é uma checagem de atributo por requisição, e
+durante a sessão o custo fica na thread de amostragem.
+
+Atribuição de pilhas a requisições:
+- Event loop: o middleware registra a task asyncio de cada requisição
+  amostrada; a amostra vale para a task em execução no momento
+- Threadpool: funções enviadas com `bind_thread` registram a thread
+  trabalhadora com a rota da requisição que as chamou
+"""
+
+import asyncio
+import contextvars
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+# Limites para manter o custo previsível sob carga
+MAX_DURATION_SECONDS = 120.0
+MIN_INTERVAL_SECONDS = 0.001
+MAX_STACK_DEPTH = 128
+MAX_DISTINCT_STACKS = 20000
+
+UNATTRIBUTED = "(unattributed)"
+
+# Scope ASGI da requisição amostrada (propagado para o threadpool)
+_current_scope: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar(
+    "profiled_scope", default=None
+)
+
+
+class ProfilerBusy(RuntimeError):
+    """Já existe uma sessão de profiling ativa"""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _route_label(scope: dict) -> str:
+    """Rota como template (ex: /agent/conversations/{conversation_id}/messages)"""
+    route = scope.get("route")
+    path = getattr(route, "path", None) or scope["path"]
+    return f"{scope['method']} {path}"
+
+
+def _collapse(frame) -> str:
+    """Pilha da raiz até o frame atual, separada por ';'"""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class ProfileSession:
+    """Uma coleta: duração fixa, fração de requisições amostradas"""
+
+    def __init__(self, duration: float, interval: float, fraction: float, include_unattributed: bool):
+        self.duration = duration
+        self.interval = interval
+        self.fraction = fraction
+        self.include_unattributed = include_unattributed
+        self.started_at = time.monotonic()
+        self.stacks: Dict[str, Counter] = {}
+        self.samples = 0
+        self.dropped = 0
+        self.sampled_requests = 0
+        self.done = threading.Event()
+        self._distinct = 0
+        self._lock = threading.Lock()
+
+    def record(self, route: str, stack: str):
+        with self._lock:
+            counter = self.stacks.setdefault(route, Counter())
+            if stack not in counter:
+                if self._distinct >= MAX_DISTINCT_STACKS:
+                    self.dropped += 1
+                    return
+                self._distinct += 1
+            counter[stack] += 1
+            self.samples += 1
+
+    def result(self) -> Dict:
+        elapsed = time.monotonic() - self.started_at
+        with self._lock:
+            return self._result(elapsed)
+
+    def _result(self, elapsed: float) -> Dict:
+        return {
+            "duration_seconds": round(min(elapsed, self.duration), 3),
+            "interval_ms": self.interval * 1000,
+            "request_fraction": self.fraction,
+            "sampled_requests": self.sampled_requests,
+            "samples": self.samples,
+            "dropped_samples": self.dropped,
+            "routes": {
+                route: {
+                    "samples": sum(counter.values()),
+                    "collapsed": "\n".join(
+                        f"{stack} {count}" for stack, count in counter.most_common()
+                    ),
+                }
+                for route, counter in self.stacks.items()
+            },
+        }
+
+    def collapsed(self) -> str:
+        """Todas as rotas em um único arquivo collapsed (rota como raiz)"""
+        with self._lock:
+            return "\n".join(
+                f"{route};{stack} {count}"
+                for route, counter in self.stacks.items()
+                for stack, count in counter.most_common()
+            )
+
+
+class SamplingProfiler:
+    """
+    Coordena sessões de profiling e a atribuição de pilhas a rotas
+    """
+
+    def __init__(self):
+        self.session: Optional[ProfileSession] = None
+        self.last_session: Optional[ProfileSession] = None
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._tasks: Dict[asyncio.Task, dict] = {}
+        self._threads: Dict[int, dict] = {}
+
+    def start(
+        self,
+        duration: float,
+        interval: float = 0.01,
+        fraction: float = 1.0,
+        include_unattributed: bool = True,
+    ) -> ProfileSession:
+        """
+        Inicia sessão de amostragem em background
+
+        Args:
+            duration: Segundos de coleta (limitado a MAX_DURATION_SECONDS)
+            interval: Segundos entre amostras
+            fraction: Fração das requisições amostradas (0-1)
+            include_unattributed: Incluir threads sem requisição associada
+
+        Raises:
+            ProfilerBusy: Outra sessão em andamento
+        """
+        with self._lock:
+            if self.session is not None:
+                raise ProfilerBusy("Sessão de profiling já em andamento")
+            session = ProfileSession(
+                duration=min(duration, MAX_DURATION_SECONDS),
+                interval=max(interval, MIN_INTERVAL_SECONDS),
+                fraction=min(max(fraction, 0.0), 1.0),
+                include_unattributed=include_unattributed,
+            )
+            self.session = session
+            self.last_session = session
+
+        thread = threading.Thread(
+            target=self._run, args=(session,), name="sampling-profiler", daemon=True
+        )
+        thread.start()
+        return session
+
+    def _run(self, session: ProfileSession):
+        own_id = threading.get_ident()
+        deadline = session.started_at + session.duration
+        try:
+            while time.monotonic() < deadline:
+                self._sample(session, own_id)
+                time.sleep(session.interval)
+        finally:
+            with self._lock:
+                self.session = None
+                self._tasks.clear()
+                self._threads.clear()
+            session.done.set()
+
+    def _sample(self, session: ProfileSession, own_id: int):
+        frames = sys._current_frames()
+        loop_scope = None
+        if self._loop is not None:
+            task = asyncio.current_task(self._loop)
+            if task is not None:
+                loop_scope = self._tasks.get(task)
+
+        for thread_id, frame in frames.items():
+            if thread_id == own_id:
+                continue
+            if thread_id == self._loop_thread_id:
+                scope = loop_scope
+            else:
+                scope = self._threads.get(thread_id)
+            if scope is not None:
+                route = _route_label(scope)
+            elif session.include_unattributed:
+                route = UNATTRIBUTED
+            else:
+                continue
+            session.record(route, _collapse(frame))
+
+    # Hooks de atribuição
+
+    def should_sample_request(self) -> bool:
+        session = self.session
+        return session is not None and random.random() < session.fraction
+
+    def register_task(self, scope: dict):
+        """Associa a task asyncio atual à requisição (chamado pelo middleware)"""
+        task = asyncio.current_task()
+        if self._loop is None:
+            self._loop = task.get_loop()
+            self._loop_thread_id = threading.get_ident()
+        self._tasks[task] = scope
+        if self.session is not None:
+            self.session.sampled_requests += 1
+        return _current_scope.set(scope)
+
+    def unregister_task(self, token):
+        self._tasks.pop(asyncio.current_task(), None)
+        _current_scope.reset(token)
+
+    def bind_thread(self, func: Callable) -> Callable:
+        """
+        Envolve função enviada ao threadpool para atribuir a thread à rota
+
+        O contexto (e a rota amostrada) é copiado para a thread trabalhadora.
+        """
+        def wrapper(*args, **kwargs):
+            scope = _current_scope.get()
+            if scope is None:
+                return func(*args, **kwargs)
+            thread_id = threading.get_ident()
+            self._threads[thread_id] = scope
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._threads.pop(thread_id, None)
+        return wrapper
+
+
+class ProfilerMiddleware:
+    """
+    Middleware ASGI que marca requisições amostradas durante uma sessão
+
+    ASGI puro (não BaseHTTPMiddleware) para que o endpoint rode na mesma
+    task registrada aqui.
+    """
+
+    def __init__(self, app, profiler: "SamplingProfiler"):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.should_sample_request():
+            await self.app(scope, receive, send)
+            return
+
+        token = self.profiler.register_task(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.profiler.unregister_task(token)
+
+
+# Instância global do profiler
+sampling_profiler = SamplingProfiler()
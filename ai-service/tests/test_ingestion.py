@@ -0,0 +1,109 @@
+"""
+Testes do worker de ingestão (LocalQueue, backend falso e StubProvider)
+"""
+
+import asyncio
+
+from src.agent.llm_router import LARGE, SMALL, LLMRouter, ModelRoute, StubProvider
+from src.agent.whatsapp_agent import WhatsAppAgent
+from src.services.ingestion import IngestionWorker
+from src.services.message_queue import LocalQueue
+
+CRITICAL_MESSAGE = "estou com febre alta e sangrando"
+ROUTES = [
+    ModelRoute(provider="openai", model="gpt-4o-mini", tier=SMALL),
+    ModelRoute(provider="openai", model="gpt-4", tier=LARGE),
+]
+
+
+class FakeBackend:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.alerts = []
+
+    async def create_alerts_bulk(self, alerts, max_concurrency=10):
+        if self.fail:
+            return [None] * len(alerts)
+        self.alerts.extend(alerts)
+        return [{"id": str(i)} for i, _ in enumerate(alerts)]
+
+
+def make_worker(llm_fail=False, backend_fail=False):
+    provider = StubProvider("openai", fail=llm_fail)
+    agent = WhatsAppAgent(router=LLMRouter({"openai": provider}, ROUTES))
+    backend = FakeBackend(fail=backend_fail)
+    worker = IngestionWorker(agent, backend, block_seconds=0.01)
+    queue, results = LocalQueue(visibility_timeout=0.0), LocalQueue()
+    worker.attach(queue, results=results)
+    return worker, queue, results, backend, provider
+
+
+def enqueue(queue, message=CRITICAL_MESSAGE):
+    return queue.enqueue({"patient_id": "p1", "message": message, "message_id": "m1"})
+
+
+def unacked(queue):
+    stats = queue.stats()
+    return stats["pending"] + stats["inflight"]
+
+
+def run_once(worker):
+    return asyncio.run(worker.run_once())
+
+
+def test_alert_is_sent_when_llm_fails():
+    worker, queue, results, backend, _ = make_worker(llm_fail=True)
+    enqueue(queue)
+
+    # LLM indisponível: resposta padrão do agente, alerta pelos sintomas locais
+    assert run_once(worker) == 1
+    assert len(backend.alerts) == 1
+    assert backend.alerts[0]["context"]["symptoms"]
+    assert backend.alerts[0]["context"]["messageId"] == "m1"
+    assert results.stats()["pending"] == 1
+
+
+def test_redelivery_retries_only_the_pending_reply(monkeypatch):
+    worker, queue, results, backend, _ = make_worker()
+    process_message = worker.agent.process_message
+
+    def fail(**kwargs):
+        raise RuntimeError("falha simulada")
+
+    monkeypatch.setattr(worker.agent, "process_message", fail)
+    enqueue(queue)
+    assert run_once(worker) == 0
+    # Sem resposta: mensagem fica sem ACK e não publica resultado
+    assert unacked(queue) == 1
+    assert results.stats()["pending"] == 0
+
+    monkeypatch.setattr(worker.agent, "process_message", process_message)
+    assert run_once(worker) == 1
+    # Alerta já enviado na primeira entrega não é reenviado
+    assert len(backend.alerts) == 1
+    assert results.stats()["pending"] == 1
+    assert unacked(queue) == 0
+
+
+def test_redelivery_retries_only_the_pending_alert():
+    worker, queue, results, backend, provider = make_worker(backend_fail=True)
+    enqueue(queue)
+    assert run_once(worker) == 0
+    assert worker.alerts_failed == 1
+    calls = len(provider.calls)
+
+    backend.fail = False
+    assert run_once(worker) == 1
+    assert len(backend.alerts) == 1
+    # Resposta já publicada na primeira entrega não é refeita
+    assert len(provider.calls) == calls
+    assert results.stats()["pending"] == 1
+
+
+def test_message_without_symptoms_is_acked_after_reply():
+    worker, queue, results, backend, _ = make_worker()
+    enqueue(queue, message="bom dia, tudo bem")
+
+    assert run_once(worker) == 1
+    assert backend.alerts == []
+    assert results.stats()["pending"] == 1
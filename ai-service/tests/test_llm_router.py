@@ -0,0 +1,235 @@
+"""
+Testes do roteador de LLM com provedores locais (StubProvider)
+"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from src.agent import llm_router
+from src.agent.llm_router import (
+    LARGE,
+    SMALL,
+    LLMRouter,
+    ModelRoute,
+    OpenAIProvider,
+    StubProvider,
+    classify_turn,
+)
+
+SYSTEM_PROMPT = "Você é um assistente."
+MESSAGES = [{"role": "user", "content": "Bom dia"}]
+
+ROUTES = [
+    ModelRoute(provider="openai", model="gpt-4o-mini", tier=SMALL),
+    ModelRoute(provider="openai", model="gpt-4", tier=LARGE),
+    ModelRoute(provider="anthropic", model="claude-3-5-haiku-latest", tier=SMALL),
+    ModelRoute(provider="anthropic", model="claude-3-5-sonnet-latest", tier=LARGE),
+]
+
+
+def make_router(openai_fail=False, anthropic_fail=False):
+    providers = {
+        "openai": StubProvider("openai", fail=openai_fail),
+        "anthropic": StubProvider("anthropic", fail=anthropic_fail),
+    }
+    return LLMRouter(providers, ROUTES), providers
+
+
+def complete(router, tier=SMALL, reason="simple"):
+    return router.complete(SYSTEM_PROMPT, MESSAGES, max_tokens=100, tier=tier, reason=reason)
+
+
+class TestClassifyTurn:
+    def test_simple_turn_goes_to_small(self):
+        assert classify_turn("Bom dia", history_messages=2, critical=False) == (SMALL, "simple")
+
+    def test_critical_turn_goes_to_large(self):
+        assert classify_turn("Estou com febre", history_messages=0, critical=True) == (LARGE, "critical")
+
+    def test_long_message_or_history_goes_to_large(self):
+        long_message = "x" * (llm_router.COMPLEX_MESSAGE_CHARS + 1)
+        assert classify_turn(long_message, 0, False) == (LARGE, "complex")
+        assert classify_turn("oi", llm_router.COMPLEX_HISTORY_MESSAGES + 1, False) == (LARGE, "complex")
+
+
+class TestRouting:
+    def test_small_tier_uses_small_model(self):
+        router, _ = make_router()
+        _, route = complete(router, tier=SMALL)
+        assert route.tier == SMALL
+
+    def test_large_tier_uses_large_model(self):
+        router, _ = make_router()
+        _, route = complete(router, tier=LARGE, reason="critical")
+        assert route.tier == LARGE
+
+    def test_routes_without_provider_are_ignored(self):
+        router = LLMRouter({"anthropic": StubProvider("anthropic")}, ROUTES)
+        _, route = complete(router)
+        assert route.provider == "anthropic"
+        assert all(r.provider == "anthropic" for r in router.routes)
+
+
+class TestFailover:
+    def test_failing_provider_fails_over_within_tier(self):
+        router, providers = make_router(openai_fail=True)
+        completion, route = complete(router, tier=SMALL)
+        assert route.key == "anthropic:claude-3-5-haiku-latest"
+        assert completion.text == "Resposta simulada"
+        assert providers["openai"].calls == ["gpt-4o-mini"]
+
+    def test_all_routes_failing_raises(self):
+        router, _ = make_router(openai_fail=True, anthropic_fail=True)
+        with pytest.raises(RuntimeError):
+            complete(router)
+
+    def test_failover_is_recorded_in_decisions(self):
+        router, _ = make_router(openai_fail=True)
+        complete(router)
+        decisions = router.stats()["decisions"]
+        assert decisions == [{
+            "tier": SMALL,
+            "reason": "simple",
+            "route": "anthropic:claude-3-5-haiku-latest",
+            "failover": True,
+            "count": 1,
+        }]
+
+
+def openai_client(arguments, text_reply="Olá"):
+    """
+    Cliente OpenAI falso: com ferramenta forçada responde só a chamada
+    (`content` None, como a API); sem ferramenta, responde `text_reply`
+    """
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        if "tools" in kwargs:
+            tool_call = SimpleNamespace(function=SimpleNamespace(arguments=arguments))
+            message = SimpleNamespace(content=None, tool_calls=[tool_call])
+        else:
+            message = SimpleNamespace(content=text_reply, tool_calls=None)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=message)],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5),
+        )
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    return client, calls
+
+
+def route_complete(router, tool):
+    return router.complete(
+        SYSTEM_PROMPT, MESSAGES, max_tokens=100, tier=SMALL, reason="simple", tool=tool
+    )
+
+
+class TestStructuredOutput:
+    TOOL = {"name": "registrar_turno", "description": "", "parameters": {}}
+
+    def test_tool_arguments_are_parsed(self):
+        client, _ = openai_client('{"reply": "Olá"}')
+        completion = OpenAIProvider(client).complete(
+            "gpt-4o-mini", SYSTEM_PROMPT, MESSAGES, 100, tool=self.TOOL
+        )
+        assert completion.structured == {"reply": "Olá"}
+        assert completion.reply == "Olá"
+
+    def test_malformed_tool_arguments_are_dropped(self):
+        client, _ = openai_client('{"reply": "Olá')
+        completion = OpenAIProvider(client).complete(
+            "gpt-4o-mini", SYSTEM_PROMPT, MESSAGES, 100, tool=self.TOOL
+        )
+        assert completion.structured is None
+        assert completion.reply == ""
+
+    def test_malformed_tool_arguments_retry_without_tool(self):
+        client, calls = openai_client('{"reply": "Olá, tudo')
+        router = LLMRouter({"openai": OpenAIProvider(client)}, ROUTES)
+        completion, route = route_complete(router, self.TOOL)
+
+        assert route.key == "openai:gpt-4o-mini"
+        assert completion.reply == "Olá"
+        assert ["tools" in call for call in calls] == [True, False]
+        stats = router.stats()["routes"][route.key]
+        assert stats["errors"] == 0
+        # Tokens da chamada descartada também contam
+        assert stats["input_tokens"] == 20
+
+    def test_tool_call_without_reply_retries_without_tool(self):
+        router, providers = make_router()
+        providers["openai"].structured = {"symptoms": {}, "scales": {}}
+        providers["anthropic"].structured = {"symptoms": {}, "scales": {}}
+        completion, _ = route_complete(router, self.TOOL)
+        assert completion.reply == "Resposta simulada"
+
+    def test_empty_reply_fails_over(self):
+        client, _ = openai_client("não é json", text_reply=None)
+        providers = {
+            "openai": OpenAIProvider(client),
+            "anthropic": StubProvider("anthropic"),
+        }
+        router = LLMRouter(providers, ROUTES)
+        completion, route = route_complete(router, self.TOOL)
+
+        assert route.provider == "anthropic"
+        assert completion.reply == "Resposta simulada"
+        assert router.stats()["routes"]["openai:gpt-4o-mini"]["errors"] == 1
+
+
+def fail_until_unhealthy(router, route_key="openai:gpt-4o-mini"):
+    """Chama até a média móvel de erros marcar a rota como não saudável"""
+    for _ in range(10):
+        if not router.stats()["routes"][route_key]["healthy"]:
+            return
+        complete(router)
+    raise AssertionError(f"{route_key} continuou saudável")
+
+
+class TestHealth:
+    def test_failed_route_is_unhealthy_and_skipped(self):
+        router, providers = make_router(openai_fail=True)
+        fail_until_unhealthy(router)
+        attempts = len(providers["openai"].calls)
+
+        _, route = complete(router)
+        assert route.key == "anthropic:claude-3-5-haiku-latest"
+        # Rota não saudável vai para o fim da lista e não é tentada
+        assert len(providers["openai"].calls) == attempts
+
+    def test_route_recovers_after_cooldown(self, monkeypatch):
+        router, providers = make_router(openai_fail=True)
+        fail_until_unhealthy(router)
+
+        monkeypatch.setattr(llm_router, "UNHEALTHY_COOLDOWN_SECONDS", 0.0)
+        providers["openai"].fail = False
+        assert router.stats()["routes"]["openai:gpt-4o-mini"]["healthy"] is True
+
+
+class TestAccounting:
+    def test_tokens_and_cost_are_accumulated(self):
+        router, _ = make_router()
+        completion, route = complete(router, tier=LARGE, reason="critical")
+        stats = router.stats()["routes"][route.key]
+        input_cost, output_cost = llm_router.MODEL_COSTS_PER_1K[route.model]
+        expected = (
+            completion.input_tokens * input_cost + completion.output_tokens * output_cost
+        ) / 1000
+        assert stats["calls"] == 1
+        assert stats["errors"] == 0
+        assert stats["input_tokens"] == completion.input_tokens
+        assert stats["output_tokens"] == completion.output_tokens
+        assert stats["cost_usd"] == round(expected, 4)
+
+    def test_decisions_are_counted_per_tier_and_reason(self):
+        router, _ = make_router()
+        complete(router, tier=SMALL, reason="simple")
+        complete(router, tier=SMALL, reason="simple")
+        complete(router, tier=LARGE, reason="critical")
+        counts = {}
+        for decision in router.stats()["decisions"]:
+            key = (decision["tier"], decision["reason"])
+            counts[key] = counts.get(key, 0) + decision["count"]
+        assert counts == {(SMALL, "simple"): 2, (LARGE, "critical"): 1}
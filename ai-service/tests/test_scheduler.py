@@ -0,0 +1,50 @@
+"""
+Testes do estado por tenant do escalonador do LLM
+"""
+
+import pytest
+
+from src.agent import scheduler
+from src.agent.scheduler import AdmissionTimeout, LLMScheduler, is_valid_tenant_id
+
+
+def test_tenant_state_is_dropped_once_queue_drains():
+    llm = LLMScheduler(tokens_per_minute=60_000)
+    for i in range(500):
+        llm.settle(llm.acquire(f"tenant-{i}", tokens=10), 10)
+
+    assert llm._tenant_queues == {}
+    assert llm._tenant_finish == {}
+
+
+def test_cancelled_ticket_does_not_leave_tenant_state():
+    # Bucket vazio: o ticket de rotina expira na fila
+    llm = LLMScheduler(tokens_per_minute=60, max_wait_seconds=0.01)
+    llm.acquire("a", tokens=60)
+    with pytest.raises(AdmissionTimeout):
+        llm.acquire("b", tokens=60)
+
+    assert llm._tenant_queues == {}
+    assert llm._tenant_finish == {}
+
+
+def test_wait_stats_per_tenant_are_bounded(monkeypatch):
+    monkeypatch.setattr(scheduler, "MAX_TENANT_STATS", 3)
+    llm = LLMScheduler(tokens_per_minute=60_000)
+    for tenant_id in ["a", "b", "c", "a", "d"]:
+        llm.acquire(tenant_id, tokens=1)
+
+    # "b" era o menos recente
+    assert list(llm.stats()["wait_by_tenant"]) == ["c", "a", "d"]
+
+
+@pytest.mark.parametrize("tenant_id, valid", [
+    ("hospA", True),
+    ("clinica_sul-2.rj", True),
+    ("", False),
+    ("a" * 65, False),
+    ("../etc", False),
+    ("tenant com espaço", False),
+])
+def test_tenant_id_validation(tenant_id, valid):
+    assert is_valid_tenant_id(tenant_id) is valid
@@ -0,0 +1,45 @@
+"""
+Testes do modelo sombra com candidato .pkl (ordem de colunas do treino)
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.models import shadow
+from src.models.priority_model import PriorityModel
+
+# Ordem do treino (train_priority_model.py): codificadas por último
+TRAINING_COLUMNS = [
+    'performance_status', 'age', 'pain_score', 'nausea_score', 'fatigue_score',
+    'days_since_last_visit', 'treatment_cycle', 'cancer_type_encoded', 'stage_encoded',
+]
+# Ordem de `/prioritize`: codificadas primeiro
+REQUEST_COLUMNS = TRAINING_COLUMNS[-2:] + TRAINING_COLUMNS[:-2]
+
+SMALL_PARAMS = {name: {'n_estimators': 5} for name in ('rf', 'xgb', 'lgbm')}
+
+
+@pytest.fixture
+def pkl_candidate(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(rng.integers(0, 10, size=(200, len(TRAINING_COLUMNS))), columns=TRAINING_COLUMNS)
+    y = X['pain_score'] * 8 + X['stage_encoded'] * 5
+    model = PriorityModel(params=SMALL_PARAMS)
+    model.train(X, y)
+    model_path = tmp_path / "candidate.pkl"
+    model.save(str(model_path))
+
+    candidate = PriorityModel()
+    candidate.load(str(model_path))
+    monkeypatch.setattr(shadow, "_candidate", candidate)
+    return candidate, X
+
+
+def test_request_rows_are_scored_in_training_order(pkl_candidate):
+    candidate, X = pkl_candidate
+    rows = [{column: int(row[column]) for column in REQUEST_COLUMNS} for _, row in X.head(5).iterrows()]
+
+    scores = shadow._predict_batch(rows)
+
+    assert scores == pytest.approx(candidate.predict(X.head(5)).tolist())
@@ -0,0 +1,44 @@
+"""
+Testes do agente com provedores locais (StubProvider)
+"""
+
+from src.agent.llm_router import LARGE, SMALL, LLMRouter, ModelRoute, StubProvider
+from src.agent.whatsapp_agent import WhatsAppAgent
+
+ROUTES = [
+    ModelRoute(provider="openai", model="gpt-4o-mini", tier=SMALL),
+    ModelRoute(provider="openai", model="gpt-4", tier=LARGE),
+]
+PATIENT = {"name": "Maria"}
+
+
+def make_agent(**provider_kwargs):
+    provider = StubProvider("openai", **provider_kwargs)
+    return WhatsAppAgent(router=LLMRouter({"openai": provider}, ROUTES)), provider
+
+
+def test_llm_failure_keeps_local_symptoms_and_alert():
+    agent, _ = make_agent(fail=True)
+    result = agent.process_message("estou com febre alta e sangrando", PATIENT, [])
+
+    assert result["llm_available"] is False
+    assert result["response"]
+    assert result["should_alert"] is True
+    assert result["critical_symptoms"]
+
+
+def test_llm_failure_keeps_local_extraction():
+    agent, _ = make_agent(fail=True)
+    result = agent.process_message("dor 7 de 10", PATIENT, [])
+
+    assert result["structured_data"]["symptoms"]["pain"] == 7
+    assert result["should_alert"] is False
+
+
+def test_tool_call_without_reply_never_returns_empty_response():
+    agent, provider = make_agent(structured={"symptoms": {"pain": 7}, "scales": {}})
+    result = agent.process_message("dor 7 de 10", PATIENT, [])
+
+    assert result["llm_available"] is True
+    assert result["response"] == provider.reply
+    assert result["structured_data"]["symptoms"]["pain"] == 7
@@ -0,0 +1,5 @@
+-- AlterTable
+ALTER TABLE "alerts" ADD COLUMN     "idempotencyKey" TEXT;
+
+-- CreateIndex
+CREATE UNIQUE INDEX "alerts_tenantId_idempotencyKey_key" ON "alerts"("tenantId", "idempotencyKey");
@@ -2,7 +2,7 @@ import { Injectable, NotFoundException } from '@nestjs/common';
 import { PrismaService } from '../prisma/prisma.service';
 import { CreateAlertDto } from './dto/create-alert.dto';
 import { UpdateAlertDto } from './dto/update-alert.dto';
-import { Alert, AlertStatus } from '@prisma/client';
+import { Alert, AlertStatus, Prisma } from '@prisma/client';
 import { AlertsGateway } from '../gateways/alerts.gateway';
 
 @Injectable()
@@ -79,6 +79,18 @@ export class AlertsService {
     createAlertDto: CreateAlertDto,
     tenantId: string
   ): Promise<Alert> {
+    // Reenvio do mesmo alerta (ex: mensagem reentregue na fila do ai-service):
+    // context.messageId identifica a mensagem de origem e devolve o existente
+    const messageId = createAlertDto.context?.messageId;
+    const idempotencyKey =
+      typeof messageId === 'string' && messageId ? messageId : undefined;
+    if (idempotencyKey) {
+      const existing = await this.findByIdempotencyKey(tenantId, idempotencyKey);
+      if (existing) {
+        return existing;
+      }
+    }
+
     // Verificar se paciente existe e pertence ao tenant
     const patient = await this.prisma.patient.findFirst({
       where: {
@@ -93,22 +105,42 @@ export class AlertsService {
       );
     }
 
-    const alert = await this.prisma.alert.create({
-      data: {
-        ...createAlertDto,
-        tenantId, // SEMPRE incluir tenantId
-        status: 'PENDING', // Status inicial sempre PENDING (conforme schema)
-      },
-      include: {
-        patient: {
-          select: {
-            id: true,
-            name: true,
-            phone: true,
+    let alert: Alert;
+    try {
+      alert = await this.prisma.alert.create({
+        data: {
+          ...createAlertDto,
+          tenantId, // SEMPRE incluir tenantId
+          idempotencyKey,
+          status: 'PENDING', // Status inicial sempre PENDING (conforme schema)
+        },
+        include: {
+          patient: {
+            select: {
+              id: true,
+              name: true,
+              phone: true,
+            },
           },
         },
-      },
-    });
+      });
+    } catch (error) {
+      // Reenvio concorrente criou o alerta primeiro (índice único)
+      if (
+        idempotencyKey &&
+        error instanceof Prisma.PrismaClientKnownRequestError &&
+        error.code === 'P2002'
+      ) {
+        const existing = await this.findByIdempotencyKey(
+          tenantId,
+          idempotencyKey
+        );
+        if (existing) {
+          return existing;
+        }
+      }
+      throw error;
+    }
 
     // Emitir evento WebSocket para notificar clientes conectados
     if (alert.severity === 'CRITICAL') {
@@ -123,6 +155,24 @@ export class AlertsService {
     return alert;
   }
 
+  private findByIdempotencyKey(
+    tenantId: string,
+    idempotencyKey: string
+  ): Promise<Alert | null> {
+    return this.prisma.alert.findUnique({
+      where: { tenantId_idempotencyKey: { tenantId, idempotencyKey } },
+      include: {
+        patient: {
+          select: {
+            id: true,
+            name: true,
+            phone: true,
+          },
+        },
+      },
+    });
+  }
+
   async update(
     id: string,
     updateAlertDto: UpdateAlertDto,
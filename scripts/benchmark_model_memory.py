@@ -0,0 +1,111 @@
+"""
+Benchmark de memória por worker: pickle (joblib) vs artefato plano (mmap)
+
+Sobe N processos, cada um carrega o modelo como um worker do uvicorn faria,
+faz uma predição e, com todos carregados ao mesmo tempo, reporta RSS, PSS
+(memória proporcional: páginas compartilhadas divididas entre processos) e
+tempo de carga.
+
+Uso (a partir da raiz do repositório, após train_priority_model.py):
+    python scripts/benchmark_model_memory.py --workers 4
+"""
+
+import argparse
+import multiprocessing as mp
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "ai-service"))
+
+
+def _read_memory_kb() -> dict:
+    """Lê RSS e PSS do processo atual em /proc (Linux)"""
+    memory = {"rss_kb": 0, "pss_kb": 0}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Rss:"):
+                memory["rss_kb"] = int(line.split()[1])
+            elif line.startswith("Pss:"):
+                memory["pss_kb"] = int(line.split()[1])
+    return memory
+
+
+def _worker(model_path: str, barrier, results):
+    import pandas as pd
+    from src.models.priority_model import PriorityModel
+
+    baseline = _read_memory_kb()
+
+    start = time.perf_counter()
+    model = PriorityModel()
+    model.load(model_path)
+    load_time = time.perf_counter() - start
+
+    features = pd.DataFrame([{
+        'performance_status': 1,
+        'age': 60,
+        'pain_score': 5,
+        'nausea_score': 2,
+        'fatigue_score': 3,
+        'days_since_last_visit': 30,
+        'treatment_cycle': 2,
+        'cancer_type_encoded': 0,
+        'stage_encoded': 2,
+    }])
+    model.predict(features)
+
+    # Medir só quando todos os workers estão com o modelo carregado
+    barrier.wait()
+    memory = _read_memory_kb()
+    barrier.wait()
+
+    results.put({
+        "load_time": load_time,
+        "rss_mb": (memory["rss_kb"] - baseline["rss_kb"]) / 1024,
+        "pss_mb": (memory["pss_kb"] - baseline["pss_kb"]) / 1024,
+    })
+
+
+def run_benchmark(model_path: str, workers: int) -> list:
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=_worker, args=(model_path, barrier, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    collected = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return collected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--pickle", default="ai-service/models/priority_model.pkl")
+    parser.add_argument("--mmap", default="ai-service/models/priority_model")
+    args = parser.parse_args()
+
+    for label, path in (("pickle", args.pickle), ("mmap", args.mmap)):
+        if not Path(path).exists():
+            print(f"Artefato não encontrado: {path}")
+            print("Execute primeiro: python scripts/train_priority_model.py")
+            return
+
+        results = run_benchmark(path, args.workers)
+        total_pss = sum(r["pss_mb"] for r in results)
+        print(f"\n{label} ({args.workers} workers): {path}")
+        for i, r in enumerate(results):
+            print(
+                f"  worker {i}: carga {r['load_time'] * 1000:.1f} ms | "
+                f"RSS +{r['rss_mb']:.1f} MB | PSS +{r['pss_mb']:.1f} MB"
+            )
+        print(f"  PSS total do modelo: {total_pss:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,10 +3,17 @@ Script para gerar dataset sintético de pacientes oncológicos
 Usado para treinar modelo de priorização
 """
 
+import argparse
+import sys
 import pandas as pd
 import numpy as np
 from pathlib import Path
 
+# Adicionar ai-service ao path
+sys.path.insert(0, str(Path(__file__).parent.parent / "ai-service"))
+
+from src.models.priority_rules import priority_rules
+
 
 def generate_synthetic_dataset(n_samples: int = 1000) -> pd.DataFrame:
     """
@@ -51,58 +58,30 @@ def generate_synthetic_dataset(n_samples: int = 1000) -> pd.DataFrame:
     
     df = pd.DataFrame(data)
     
-    # Calcular labels (prioridade) baseado em regras de negócio
-    def calculate_priority_score(row):
-        score = 0
-        
-        # Critérios críticos
-        if row['pain_score'] >= 8:
-            score += 30
-        if row['stage'] == 'IV':
-            score += 20
-        if row['performance_status'] >= 3:
-            score += 25
-        if row['days_since_last_visit'] > 60:
-            score += 15
-        
-        # Critérios de alta prioridade
-        if row['pain_score'] >= 6:
-            score += 15
-        if row['nausea_score'] >= 7:
-            score += 10
-        if row['stage'] == 'III':
-            score += 10
-        
-        # Normalizar para 0-100
-        score = min(100, score)
-        
-        # Categorizar
-        if score >= 75:
-            category = 'critico'
-        elif score >= 50:
-            category = 'alto'
-        elif score >= 25:
-            category = 'medio'
-        else:
-            category = 'baixo'
-        
-        return score, category
-    
-    df['priority_score'], df['priority_category'] = zip(*df.apply(calculate_priority_score, axis=1))
+    # Calcular labels (prioridade) com a tabela de regras de negócio
+    # (a mesma do fallback de /prioritize), vetorizada sobre o dataset
+    df['priority_score'] = priority_rules.score(df)
+    df['priority_category'] = priority_rules.categorize(df['priority_score'])
     
     return df
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera dataset sintético de pacientes")
+    parser.add_argument("--samples", type=int, default=1000, help="Número de amostras")
+    parser.add_argument(
+        "--output", default="data/synthetic_patients.csv", help="Arquivo CSV de saída"
+    )
+    args = parser.parse_args()
+    
     # Gerar dataset
     print("Gerando dataset sintético...")
-    df = generate_synthetic_dataset(n_samples=1000)
+    df = generate_synthetic_dataset(n_samples=args.samples)
     
     # Salvar
-    output_dir = Path("data")
-    output_dir.mkdir(exist_ok=True)
+    output_file = Path(args.output)
+    output_file.parent.mkdir(parents=True, exist_ok=True)
     
-    output_file = output_dir / "synthetic_patients.csv"
     df.to_csv(output_file, index=False)
     
     print(f"Dataset gerado: {output_file}")
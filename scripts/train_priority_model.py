@@ -2,6 +2,8 @@
 Script para treinar modelo de priorização
 """
 
+import argparse
+import json
 import pandas as pd
 import numpy as np
 from pathlib import Path
@@ -14,9 +16,65 @@ from sklearn.metrics import mean_absolute_error, r2_score
 sys.path.insert(0, str(Path(__file__).parent.parent / "ai-service"))
 
 from src.models.priority_model import PriorityModel
+from src.models.drift import build_reference_profile, save_reference_profile
+from src.models.incremental import reference_holdout_path, save_reference_holdout
 
 
-def train_model():
+def tune_params(X_train, y_train, args):
+    """Etapa de busca de hiperparâmetros (MAE + latência por linha)"""
+    from src.models.tuning import tune_ensemble
+    
+    print(f"Buscando hiperparâmetros (orçamento: {args.budget:.0f}s)...")
+    result = tune_ensemble(
+        X_train, y_train,
+        budget_seconds=args.budget,
+        n_candidates=args.candidates,
+        cv=args.cv,
+        n_jobs=args.n_jobs,
+        latency_weight=args.latency_weight,
+    )
+    
+    print(f"  Rodadas completas: {result.rungs_completed} em {result.elapsed_seconds:.0f}s")
+    for entry in result.leaderboard[:5]:
+        print(
+            f"  MAE {entry['mae']:.3f} | {entry['latency_per_row_ms'] * 1000:.1f} µs/linha"
+            f" | {entry['rows']} linhas | {json.dumps(entry['params'])}"
+        )
+    print(f"  Escolhido: {json.dumps(result.params)}")
+    return result.params
+
+
+def distill_model(model, X_train, X_test, y_test, model_dir, args):
+    """Etapa de destilação: substituto barato + relatório de trade-off"""
+    from src.models.surrogate import distill
+    
+    surrogate_dir = model_dir / "priority_surrogate"
+    print("\nDestilando ensemble...")
+    report = distill(
+        model.model, X_train, X_test, y_test, str(surrogate_dir),
+        tolerance=args.surrogate_tolerance,
+        max_cells=args.max_cells,
+        min_agreement=args.surrogate_min_agreement,
+        source_paths=[str(model_dir / "priority_model.pkl"), str(model_dir / "priority_model")],
+    )
+    
+    print(f"  {'modelo':<16} {'MAE':>6} {'fidel.':>7} {'categ.':>7} {'µs/linha':>9} {'p50 1 linha':>12} {'memória':>10}")
+    for name, item in report['models'].items():
+        print(
+            f"  {name:<16} {item['mae']:>6.2f} {item['fidelity_mae']:>7.3f}"
+            f" {item['category_agreement']:>7.1%} {item['batch_per_row_us']:>9.2f}"
+            f" {item['single_row_p50_us']:>10.0f}µs {item['memory_bytes'] / 1024:>8.0f}KB"
+        )
+    if report['selected']:
+        print(f"Substituto salvo ({report['selected']}): {surrogate_dir}")
+    else:
+        print(
+            f"Nenhum substituto dentro da tolerância (MAE {args.surrogate_tolerance}, "
+            f"concordância {args.surrogate_min_agreement:.0%})"
+        )
+
+
+def train_model(args):
     """Treina modelo de priorização"""
     
     # Carregar dados
@@ -55,8 +113,10 @@ def train_model():
     print(f"  Treino: {len(X_train)} amostras")
     print(f"  Teste: {len(X_test)} amostras")
     
+    params = tune_params(X_train, y_train, args) if args.tune else None
+    
     # Treinar modelo
-    model = PriorityModel()
+    model = PriorityModel(params=params)
     model.train(X_train, y_train)
     
     # Avaliar
@@ -76,6 +136,21 @@ def train_model():
     model.save(str(model_file))
     print(f"\nModelo salvo: {model_file}")
     
+    # Artefato plano: arrays mapeados em memória e compartilhados entre workers
+    flat_dir = model_dir / "priority_model"
+    model.save_flat(str(flat_dir))
+    print(f"Artefato mmap salvo: {flat_dir}")
+    
+    # Perfil de referência para monitoramento de drift (features brutas)
+    profile = build_reference_profile(df.loc[X_train.index])
+    save_reference_profile(profile, str(model_file))
+    save_reference_profile(profile, str(flat_dir))
+    print("Perfil de referência salvo")
+    
+    # Partição de teste (amostra limitada) para validar atualizações incrementais
+    save_reference_holdout(X_test, y_test, str(model_file))
+    print(f"Holdout de referência salvo: {reference_holdout_path(str(model_file))}")
+    
     # Salvar encoders
     import joblib
     encoders_file = model_dir / "label_encoders.pkl"
@@ -84,9 +159,41 @@ def train_model():
         'stage': le_stage,
     }, encoders_file)
     print(f"Encoders salvos: {encoders_file}")
+    
+    params_file = model_dir / "priority_model.params.json"
+    with open(params_file, "w", encoding="utf-8") as f:
+        json.dump(model.params, f, indent=2)
+    print(f"Hiperparâmetros salvos: {params_file}")
+    
+    if args.distill:
+        distill_model(model, X_train, X_test, y_test, model_dir, args)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Treina modelo de priorização")
+    parser.add_argument("--tune", action="store_true",
+                        help="Busca hiperparâmetros antes do treino final")
+    parser.add_argument("--budget", type=float, default=300.0,
+                        help="Tempo máximo da busca em segundos")
+    parser.add_argument("--candidates", type=int, default=27,
+                        help="Configurações avaliadas na primeira rodada")
+    parser.add_argument("--cv", type=int, default=3, help="Número de folds")
+    parser.add_argument("--n-jobs", type=int, default=-1,
+                        help="Processos paralelos da busca (-1 = todos)")
+    parser.add_argument("--latency-weight", type=float, default=1.0,
+                        help="Pontos de MAE por ms/linha de latência no objetivo")
+    parser.add_argument("--distill", action="store_true",
+                        help="Destila o ensemble em um substituto (tabela ou boosting raso)")
+    parser.add_argument("--surrogate-tolerance", type=float, default=1.0,
+                        help="MAE máximo do substituto em relação ao ensemble")
+    parser.add_argument("--surrogate-min-agreement", type=float, default=0.98,
+                        help="Concordância mínima de categoria com o ensemble")
+    parser.add_argument("--max-cells", type=int, default=2_000_000,
+                        help="Limite de células da tabela de lookup")
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    train_model()
+    train_model(parse_args())
 
 
@@ -0,0 +1,157 @@
+"""
+Script para atualizar o modelo de priorização com novos desfechos rotulados
+
+Continua o boosting dos membros XGBoost/LightGBM a partir do modelo atual
+(ver src/models/incremental.py) e grava uma nova versão em --output-dir,
+no layout do ModelRegistry ({versão}.pkl + {versão}/ plano). A versão só é
+gravada se o MAE não piorar no holdout dos dados novos nem na partição de
+teste do treino original ({modelo}.holdout.csv, salva pelo treino e levada
+adiante a cada versão).
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import joblib
+import pandas as pd
+
+# Adicionar path do ai-service
+sys.path.insert(0, str(Path(__file__).parent.parent / "ai-service"))
+
+from src.models.priority_model import PriorityModel
+from src.models.drift import load_reference_profile, save_reference_profile
+from src.models.incremental import (
+    DEFAULT_CHUNK_ROWS,
+    DEFAULT_MAX_UPDATE_ROWS,
+    DEFAULT_TREES_PER_UPDATE,
+    holdout_check,
+    iter_labeled_batches,
+    load_reference_holdout,
+    new_version,
+    reserve_holdout,
+    save_reference_holdout,
+    warm_start,
+)
+
+
+def update_model(args) -> int:
+    """Atualiza modelo; retorna código de saída (1 = rejeitado)"""
+    base_file = Path(args.base)
+    if not base_file.exists():
+        print(f"Modelo base não encontrado: {base_file}")
+        print("Execute primeiro: python scripts/train_priority_model.py")
+        return 1
+
+    base = PriorityModel()
+    base.load(str(base_file))
+    encoders = joblib.load(args.encoders)
+
+    batches = iter_labeled_batches(args.data, encoders, chunk_rows=args.chunk_rows)
+    holdout = []
+    if args.holdout:
+        holdout = list(iter_labeled_batches(args.holdout, encoders, chunk_rows=args.chunk_rows))
+    else:
+        batches = reserve_holdout(batches, holdout)
+
+    print(f"Atualizando modelo com {args.data}...")
+    updated, stats = warm_start(
+        base, batches, trees_per_update=args.trees_per_update, max_rows=args.max_rows
+    )
+    if stats['rows'] == 0:
+        print("Nenhuma linha nova válida; nada a fazer")
+        return 1
+    print(f"  Linhas: {stats['rows']} ({stats['rows_used']} usadas no ajuste, {stats['seconds']:.2f}s)")
+    print(f"  Árvores novas por membro boosted: {stats['trees_added_per_member']}")
+
+    if not holdout:
+        print("Holdout vazio; não é possível validar a atualização")
+        return 1
+    holdouts = {
+        'novos': (pd.concat([X for X, _ in holdout]), pd.concat([y for _, y in holdout])),
+    }
+    reference = load_reference_holdout(str(base_file))
+    if reference is not None:
+        holdouts['treino'] = reference
+    else:
+        print("Holdout do treino original não encontrado ao lado do modelo base; "
+              "validando só nos dados novos")
+
+    check = holdout_check(base, updated, holdouts, max_mae_increase=args.max_mae_increase)
+    for name, result in check['holdouts'].items():
+        status = "ok" if result['passed'] else "PIOROU"
+        print(f"\nHoldout {name} ({result['rows']} amostras): {status}")
+        print(f"  MAE base: {result['base_mae']:.3f}")
+        print(f"  MAE atualizado: {result['updated_mae']:.3f}")
+
+    print("\nÁrvores (rf/xgb/lgbm):")
+    for name in ('base', 'updated'):
+        trees = check['trees'][name]
+        latency = check['latency'][name]
+        print(
+            f"  {name}: {trees['rf']}/{trees['xgb']}/{trees['lgbm']} | "
+            f"{latency['batch_us_per_row']:.1f} µs/linha em lote, "
+            f"{latency['single_row_ms']:.2f} ms por requisição"
+        )
+
+    if not check['passed'] and not args.force:
+        print("Atualização rejeitada: MAE piorou além da tolerância")
+        return 1
+
+    version = args.version or new_version()
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    model_file = output_dir / f"{version}.pkl"
+    flat_dir = output_dir / version
+
+    updated.save(str(model_file))
+    updated.save_flat(str(flat_dir))
+
+    # Perfil de drift e holdout de referência continuam os do treino original
+    profile = load_reference_profile(str(base_file))
+    if profile is not None:
+        save_reference_profile(profile, str(model_file))
+        save_reference_profile(profile, str(flat_dir))
+    if reference is not None:
+        save_reference_holdout(*reference, str(model_file))
+
+    with open(output_dir / f"{version}.update.json", "w", encoding="utf-8") as f:
+        json.dump({
+            'base': str(base_file),
+            'data': args.data,
+            'update': stats,
+            'holdout': check,
+        }, f, indent=2)
+
+    print(f"\nVersão {version} salva: {model_file}, {flat_dir}")
+    return 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Atualiza modelo de priorização com novos desfechos"
+    )
+    parser.add_argument("--data", required=True,
+                        help="CSV com novos desfechos (mesmas colunas do dataset)")
+    parser.add_argument("--base", default="ai-service/models/priority_model.pkl",
+                        help="Modelo .pkl de partida")
+    parser.add_argument("--encoders", default="ai-service/models/label_encoders.pkl")
+    parser.add_argument("--holdout",
+                        help="CSV de holdout (padrão: 1 a cada 10 linhas novas)")
+    parser.add_argument("--output-dir", default="ai-service/models/versions")
+    parser.add_argument("--version", help="Nome da versão (padrão: timestamp UTC)")
+    parser.add_argument("--trees-per-update", type=int, default=DEFAULT_TREES_PER_UPDATE,
+                        help="Árvores novas por membro boosted nesta atualização")
+    parser.add_argument("--max-rows", type=int, default=DEFAULT_MAX_UPDATE_ROWS,
+                        help="Linhas novas usadas no ajuste (acima disso, amostra)")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS)
+    parser.add_argument("--max-mae-increase", type=float, default=0.05,
+                        help="Piora relativa de MAE aceita no holdout")
+    parser.add_argument("--force", action="store_true",
+                        help="Salva mesmo se a checagem de holdout falhar")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(update_model(parse_args()))